@@ -0,0 +1,325 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from package.api import tasks as api
+from package.api.history import append_history
+from package.api.writer import ThreadedStorage
+
+
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resources", "base")
+SAMPLE_SIZE = 100 #tâches touchées par les opérations groupées
+
+BENCHMARKS = {}
+WIDGET_BENCHMARKS = set()
+app = None
+
+
+#fonctions
+def benchmark(name, widget=False):
+    def register(function):
+        BENCHMARKS[name] = function
+        if widget: WIDGET_BENCHMARKS.add(name)
+        return function
+    return register
+
+##données synthétiques
+def case_name(case):
+    return "tasks={tasks},folders={folders},history={history}".format(**case)
+
+def folder_name(i, case):
+    return "folder"+str(i % case["folders"])
+
+def generate_store(directory, case):
+    os.makedirs(directory)
+    api.set_tasks_dir(directory)
+    tasks = {folder_name(i, case):{} for i in range(case["folders"])}
+    for i in range(case["tasks"]):
+        tasks[folder_name(i, case)]["task"+str(i)] = {"achieved":i % 3 == 0, "priority":i % 3, "date":"2024-"+str(i % 12+1)+"-"+str(i % 28+1)}
+    api.dump_tasks(tasks)
+    api.init_history_file()
+    api.init_config_file()
+    append_history(api.HISTORY_LOG_FILEPATH, api.HISTORY_ARCHIVE_DIR, ((folder_name(i, case), "old"+str(i)) for i in range(case["history"])))
+
+#les premières tâches du dossier folder0
+def sample_tasks(case, count = SAMPLE_SIZE):
+    names = range(0, case["tasks"], case["folders"])
+    return [("folder0", "task"+str(i)) for i in list(names)[:count]]
+
+def first_task(store):
+    return next(iter(store.folder("folder0").values()))
+
+##opérations mesurées, chaque fonction prépare les données et renvoie l'opération à chronométrer,
+##ou (opération, nettoyage) : le nettoyage ferme ce qui garde le dossier ouvert avant la répétition suivante
+@benchmark("load_tasks")
+def bench_load_tasks(case):
+    return api.load_tasks
+
+@benchmark("TaskStore.load")
+def bench_store_load(case):
+    store = api.TaskStore(api.JsonStorage())
+    return store.load, store.close
+
+def to_binary():
+    api.dump_tasks(api.simple_load_tasks(), "binary")
+
+@benchmark("load_tasks binary")
+def bench_load_tasks_binary(case):
+    to_binary()
+    return api.load_tasks
+
+@benchmark("TaskStore.load binary")
+def bench_store_load_binary(case):
+    to_binary()
+    store = api.TaskStore(api.JsonStorage(True, "binary"))
+    return store.load, store.close
+
+@benchmark("TaskStore.load_all")
+def bench_store_load_all(case):
+    store = api.TaskStore(api.JsonStorage())
+    store.load()
+    return store.load_all, store.close
+
+def bench_toggle(store):
+    store.load()
+    task = first_task(store)
+    def run():
+        task.switch_status()
+        store.flush()
+    return run, store.close
+
+@benchmark("Task.dump")
+def bench_task_dump(case):
+    return bench_toggle(api.TaskStore(api.JsonStorage()))
+
+@benchmark("Task.dump journal")
+def bench_task_dump_journal(case):
+    return bench_toggle(api.TaskStore(api.JsonStorage(True)))
+
+@benchmark("Task.dump sqlite")
+def bench_task_dump_sqlite(case):
+    return bench_toggle(api.TaskStore(api.migrate_to_sqlite()))
+
+#temps passé dans le thread de l'interface, l'écriture se fait dans le thread d'écriture
+@benchmark("Task.dump background")
+def bench_task_dump_background(case):
+    return bench_toggle(api.TaskStore(ThreadedStorage(api.JsonStorage())))
+
+@benchmark("delete_tasks")
+def bench_delete_tasks(case):
+    tasks = sample_tasks(case)
+    return lambda: api.delete_tasks(tasks)
+
+@benchmark("TaskStore.remove_tasks")
+def bench_store_remove_tasks(case):
+    store = api.TaskStore(api.JsonStorage())
+    store.load()
+    tasks = sample_tasks(case)
+    def run():
+        store.remove_tasks(tasks)
+        store.flush()
+    return run, store.close
+
+@benchmark("add_tasks_to_history")
+def bench_add_tasks_to_history(case):
+    tasks = sample_tasks(case)
+    return lambda: api.add_tasks_to_history(tasks)
+
+@benchmark("load_history")
+def bench_load_history(case):
+    return api.load_history
+
+@benchmark("build_rollups")
+def bench_build_rollups(case):
+    from package.api.rollups import build_rollups
+    return lambda: build_rollups(api.iter_all_history())
+
+@benchmark("load_rollups")
+def bench_load_rollups(case):
+    api.load_rollups()
+    return api.load_rollups
+
+@benchmark("change_folder_name")
+def bench_change_folder_name(case):
+    return lambda: api.change_folder_name("folder0", "renamed")
+
+@benchmark("TaskStore.rename_folder")
+def bench_store_rename_folder(case):
+    store = api.TaskStore(api.JsonStorage())
+    store.load()
+    def run():
+        store.rename_folder("folder0", "renamed")
+        store.flush()
+    return run, store.close
+
+#une modification envoyée et une reçue, après une première synchronisation de tout le jeu :
+#la durée doit dépendre du nombre de modifications, pas du nombre de tâches
+@benchmark("sync_one_change")
+def bench_sync_one_change(case):
+    from package.api.sync import SyncClient
+    from package.api.sync_server import SyncServer
+    server = SyncServer().start()
+    store = api.TaskStore(api.JsonStorage())
+    store.load()
+    client = SyncClient(store, server.url)
+    client.track()
+    client.sync()
+    def run():
+        first_task(store).update({"priority":2})
+        server.push([{"folder":"folder0", "name":"remote", "task":{"achieved":False, "priority":1, "date":""}, "stamp":[int(time.time()*1000)+1000, "benchmark"]}])
+        client.sync()
+    def cleanup():
+        client.close()
+        client.state.close()
+        store.close()
+        server.stop()
+    return run, cleanup
+
+@benchmark("SearchIndex.build")
+def bench_search_build(case):
+    from package.api.search import SearchIndex
+    store = api.TaskStore(api.JsonStorage())
+    store.load()
+    return (lambda: SearchIndex().build(store.iter_records(), store.storage.iter_history())), store.close
+
+@benchmark("SearchIndex.search")
+def bench_search(case):
+    from package.api.search import SearchIndex
+    store = api.TaskStore(api.JsonStorage())
+    store.load()
+    index = SearchIndex()
+    index.build(store.iter_records(), store.storage.iter_history())
+    def run():
+        for query in ("task1", "k12", "old9", "ta"): index.search(query)
+    return run, store.close
+
+@benchmark("TabView.load", widget=True)
+def bench_tabview_load(case):
+    application()
+    from package.ui import TabView
+    store = api.TaskStore(api.JsonStorage())
+    store.load()
+    view = TabView("folder0", store)
+    view.show()
+    def run():
+        view.load()
+        application().processEvents()
+    return run, lambda: close_view(view, store)
+
+@benchmark("TabView.update_data", widget=True)
+def bench_tabview_update_data(case):
+    application()
+    from package.ui import TabView
+    store = api.TaskStore(api.JsonStorage())
+    store.load()
+    view = TabView("folder0", store)
+    view.load()
+    view.show()
+    application().processEvents()
+    def run():
+        view.update_data()
+        application().processEvents()
+    return run, lambda: close_view(view, store)
+
+def close_view(view, store):
+    view.close()
+    view.deleteLater()
+    application().processEvents()
+    store.close()
+
+##Qt sans affichage
+class ResourceContext:
+    def get_resource(self, name):
+        return os.path.join(RESOURCES_DIR, name)
+
+def application():
+    global app
+    if app is None:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5.QtWidgets import QApplication
+        from package.resources import resources
+        resources.set_context(ResourceContext())
+        app = QApplication([])
+    return app
+
+##exécution
+def run_case(case, names, repeat, workdir):
+    base = os.path.join(workdir, "base")
+    if os.path.exists(base): shutil.rmtree(base)
+    generate_store(base, case)
+    results = {}
+    for name in names:
+        timings = []
+        for _ in range(repeat):
+            directory = os.path.join(workdir, "run")
+            if os.path.exists(directory): shutil.rmtree(directory)
+            shutil.copytree(base, directory)
+            api.set_tasks_dir(directory)
+            operation, cleanup = BENCHMARKS[name](case), None
+            if isinstance(operation, tuple): operation, cleanup = operation
+            try:
+                start = time.perf_counter()
+                operation()
+                timings.append(time.perf_counter()-start)
+            finally:
+                if cleanup is not None: cleanup()
+        results[name] = min(timings)
+        print("%-45s %-26s %10.2f ms" % (case_name(case), name, results[name]*1000))
+    return results
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+#renvoie le nombre d'opérations plus lentes que threshold fois la référence
+def compare(results, baseline, threshold):
+    regressions = 0
+    for case, timings in results.items():
+        for name, seconds in timings.items():
+            reference = baseline.get("results", {}).get(case, {}).get(name)
+            if not reference: continue
+            ratio = seconds/reference
+            flag = "REGRESSION" if ratio > threshold else ""
+            if flag: regressions += 1
+            print("%-45s %-26s x%.2f %s" % (case, name, ratio, flag))
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks de la couche de données et des vues de PyTasks")
+    parser.add_argument("--tasks", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--folders", type=int, nargs="+", default=[1, 50])
+    parser.add_argument("--history", type=int, default=None, help="taille de l'historique, par défaut le nombre de tâches")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", default=None, help="ne lancer que les benchmarks contenant ces mots")
+    parser.add_argument("--no-widgets", action="store_true")
+    parser.add_argument("--output", help="fichier JSON où enregistrer les résultats")
+    parser.add_argument("--compare", help="fichier JSON de référence")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    names = [name for name in BENCHMARKS if not (args.no_widgets and name in WIDGET_BENCHMARKS)]
+    if args.only: names = [name for name in names if any(word in name for word in args.only)]
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for tasks in args.tasks:
+            for folders in args.folders:
+                case = {"tasks":tasks, "folders":folders, "history":args.history if args.history is not None else tasks}
+                results[case_name(case)] = run_case(case, names, args.repeat, workdir)
+    report = {"commit":current_commit(), "python":platform.python_version(), "platform":platform.platform(), "repeat":args.repeat, "results":results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(results, baseline, args.threshold) else 0)
@@ -0,0 +1,131 @@
+import argparse
+import sys
+
+from package.api.backup import KEEP_DAILY, KEEP_LAST, KEEP_WEEKLY, create_backup, list_backups, load_manifest, prune_backups, restore_backup
+from package.api.daemon import StoreDaemon
+from package.api.sync import SyncClient, SyncError
+from package.api.sync_server import SyncServer
+from package.api.bulk import export_history, export_tasks, import_tasks, read_records
+from package.api.tasks import get_store, init_files, load_config, open_storage
+
+
+#fonctions
+def run_import(args):
+    store = get_store()
+    with (open(args.file, "r", newline="") if args.file != "-" else sys.stdin) as f:
+        count = import_tasks(read_records(f, args.format), store, args.folder)
+    print(str(count)+" tâches importées", file=sys.stderr)
+
+def run_export(args):
+    storage = open_storage(load_config())
+    with (open(args.file, "w", newline="") if args.file != "-" else sys.stdout) as f:
+        if args.history: export_history(storage, f, args.format)
+        else: export_tasks(storage, f, args.format)
+
+##sauvegardes
+def run_backup(args):
+    print(create_backup())
+    if args.prune: prune_backups()
+
+def run_list_backups(args):
+    for backup_id in list_backups():
+        manifest = load_manifest(backup_id)
+        print(backup_id, manifest["time"], str(len(manifest["folders"]))+" dossiers")
+
+def run_prune(args):
+    removed = prune_backups(args.keep_last, args.keep_daily, args.keep_weekly)
+    print(str(len(removed))+" sauvegardes supprimées", file=sys.stderr)
+
+def run_restore(args):
+    backups = list_backups()
+    backup_id = args.backup or (backups[-1] if backups else None)
+    if backup_id is None: sys.exit("aucune sauvegarde")
+    safety_id = restore_backup(backup_id, not args.tasks_only)
+    print(backup_id+" restaurée, état précédent sauvegardé sous "+safety_id, file=sys.stderr)
+
+##synchronisation
+def run_sync(args):
+    url = args.url or load_config().get("sync_url")
+    if not url: sys.exit("aucun serveur : sync_url dans config.ini ou --url")
+    client = SyncClient(get_store(), url)
+    client.track()
+    try:
+        sent, applied = client.sync()
+    except (OSError, SyncError) as e:
+        sys.exit("synchronisation impossible : "+str(e))
+    finally:
+        client.close()
+    print(str(sent)+" modifications envoyées, "+str(applied)+" reçues", file=sys.stderr)
+
+def run_serve(args):
+    server = SyncServer((args.host, args.port))
+    print("serveur de synchronisation sur "+server.url, file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+def run_daemon(args):
+    try:
+        daemon = StoreDaemon()
+    except RuntimeError as e:
+        sys.exit(str(e))
+    print("démon des tâches sur "+daemon.filepath, file=sys.stderr)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import, export, sauvegardes et synchronisation des tâches de PyTasks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="ajoute les tâches d'un fichier JSON Lines ou CSV")
+    importer.add_argument("file", help="fichier à lire, - pour l'entrée standard")
+    importer.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    importer.add_argument("--folder", default="general", help="dossier des enregistrements sans dossier")
+    importer.set_defaults(run=run_import)
+
+    exporter = commands.add_parser("export", help="écrit les tâches ou l'historique en JSON Lines ou CSV")
+    exporter.add_argument("file", nargs="?", default="-", help="fichier à écrire, - pour la sortie standard")
+    exporter.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    exporter.add_argument("--history", action="store_true", help="exporter l'historique plutôt que les tâches")
+    exporter.set_defaults(run=run_export)
+
+    backup = commands.add_parser("backup", help="sauvegarde les tâches et l'historique dans ~/.todo/backups")
+    backup.add_argument("--prune", action="store_true", help="supprimer ensuite les sauvegardes hors rétention")
+    backup.set_defaults(run=run_backup)
+
+    lister = commands.add_parser("backups", help="liste les sauvegardes")
+    lister.set_defaults(run=run_list_backups)
+
+    pruner = commands.add_parser("prune", help="supprime les sauvegardes hors rétention et les objets inutilisés")
+    pruner.add_argument("--keep-last", type=int, default=KEEP_LAST)
+    pruner.add_argument("--keep-daily", type=int, default=KEEP_DAILY)
+    pruner.add_argument("--keep-weekly", type=int, default=KEEP_WEEKLY)
+    pruner.set_defaults(run=run_prune)
+
+    restorer = commands.add_parser("restore", help="réécrit tasks.json et l'historique depuis une sauvegarde")
+    restorer.add_argument("backup", nargs="?", help="identifiant de la sauvegarde, la plus récente par défaut")
+    restorer.add_argument("--tasks-only", action="store_true", help="ne pas restaurer l'historique")
+    restorer.set_defaults(run=run_restore)
+
+    syncer = commands.add_parser("sync", help="envoie et reçoit les modifications depuis la dernière synchronisation")
+    syncer.add_argument("--url", help="adresse du serveur, sync_url de config.ini par défaut")
+    syncer.set_defaults(run=run_sync)
+
+    server = commands.add_parser("serve", help="lance le serveur de synchronisation de référence, en mémoire")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=8765)
+    server.set_defaults(run=run_serve)
+
+    daemon = commands.add_parser("daemon", help="garde les tâches en mémoire pour les clients configurés avec \"daemon\": true")
+    daemon.set_defaults(run=run_daemon)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    init_files()
+    args = parse_args()
+    args.run(args)
@@ -1,10 +1,18 @@
+import time
+started = time.perf_counter()
+import logging
 from fbs_runtime.application_context.PyQt5 import ApplicationContext
 from PyQt5.QtWidgets import QMainWindow
 import sys
 from package.main_window import MainWindow
+from package import startup
 
 if __name__ == '__main__':
+    logging.basicConfig(level = logging.DEBUG)
+    startup.start(started)
+    startup.mark("import")
     appctxt = ApplicationContext()       # 1. Instantiate ApplicationContext
+    startup.mark("context")
     window = MainWindow(appctxt)
     window.resize(450, 300)
     window.show()
@@ -0,0 +1,23 @@
+from datetime import date
+
+from .storage import date_to_ordinal
+
+
+#fonctions
+#tâches terminées à archiver : toutes, ou avec age celles dont l'échéance est passée
+#depuis au moins age jours. Une tâche ne garde pas sa date de fin, son échéance en tient lieu
+#et une tâche terminée sans échéance est archivée tout de suite
+def archivable(records, age = 0, today = None)->list:
+    if not age: return [(folder, name) for folder, name, task in records if task["achieved"]]
+    limit = (today or date.today().toordinal())-age
+    return [(folder, name) for folder, name, task in records if task["achieved"] and date_to_ordinal(task["date"]) <= limit]
+
+#retire les tâches terminées de tous les dossiers et les ajoute à l'historique en un seul lot,
+#les dossiers pas encore affichés ne sont pas convertis en Task
+def archive_done_tasks(store, age = 0, today = None)->list:
+    tasks = archivable(store.iter_records(), age, today)
+    if tasks:
+        with store.batch():
+            store.remove_tasks(tasks)
+            store.add_to_history(tasks)
+    return tasks
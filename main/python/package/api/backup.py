@@ -0,0 +1,228 @@
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import zlib
+
+from . import metrics
+from . import tasks as api
+from .filelock import get_lock
+from .storage import SqliteStorage
+
+
+#sauvegardes de ~/.todo/backups : chaque dossier de tâches et chaque fichier d'historique est un
+#objet compressé nommé par le sha1 de son contenu (objects/ab/cdef…), une sauvegarde est un
+#manifeste (manifests/<id>.json) qui liste ses objets. Un dossier qui n'a pas changé depuis la
+#sauvegarde précédente a le même sha1 : il n'est pas réécrit. Les archives de l'historique ne
+#changent plus une fois écrites, elles ne sont donc copiées qu'une fois
+#avec "storage": "sqlite", tâches et historique sont lus dans tasks.db, l'historique est sauvegardé
+#comme history.json (entrées sans date) et history.jsonl : une sauvegarde se restaure dans l'un ou
+#l'autre backend
+KEEP_LAST = 10 #sauvegardes les plus récentes toujours gardées
+KEEP_DAILY = 7 #puis la dernière de chacun des derniers jours
+KEEP_WEEKLY = 8 #et de chacune des dernières semaines
+ID_FORMAT = "%Y%m%d-%H%M%S-%f"
+
+
+#fonctions
+##chemins
+def backup_dir():
+    return os.path.join(api.TASKS_DIR, "backups")
+
+def object_path(digest):
+    return os.path.join(backup_dir(), "objects", digest[:2], digest[2:])
+
+def manifest_path(backup_id):
+    return os.path.join(backup_dir(), "manifests", backup_id+".json")
+
+#verrou des objets et manifestes, distinct de celui des tâches : l'application peut
+#enregistrer pendant la compression d'une sauvegarde
+def backups_lock():
+    os.makedirs(backup_dir(), exist_ok=True)
+    return get_lock(os.path.join(backup_dir(), "backups.lock"))
+
+#fichiers d'historique relatifs à TASKS_DIR
+def history_files()->list:
+    files = [api.HISTORY_FILEPATH, api.HISTORY_LOG_FILEPATH]
+    if os.path.exists(api.HISTORY_ARCHIVE_DIR):
+        files += [os.path.join(api.HISTORY_ARCHIVE_DIR, name) for name in sorted(os.listdir(api.HISTORY_ARCHIVE_DIR)) if name.endswith(".jsonl")]
+    return [os.path.relpath(filepath, api.TASKS_DIR) for filepath in files if os.path.exists(filepath)]
+
+#la base SQLite n'existe qu'après la migration, les fichiers JSON font foi jusque-là
+def uses_sqlite(config: dict)->bool:
+    return config.get("storage") == "sqlite" and os.path.exists(api.SQLITE_FILEPATH)
+
+#(tâches, {chemin relatif: contenu}) de l'historique, à lire sous tasks_lock()
+def read_json_data():
+    history = {}
+    for relpath in history_files():
+        with open(os.path.join(api.TASKS_DIR, relpath), "rb") as f:
+            history[relpath] = f.read()
+    return api.simple_load_tasks(), history
+
+#les tâches validées dans tasks.db, par une connexion à part
+def read_sqlite_data():
+    storage = SqliteStorage(api.SQLITE_FILEPATH)
+    try:
+        tasks = storage.load()
+        legacy, lines = {}, []
+        for record in storage.iter_history():
+            if record.get("time"): lines.append(json.dumps(record, separators=(",", ":"))+"\n")
+            else: legacy.setdefault(record["folder"], []).append(record["name"])
+    finally:
+        storage.close()
+    history = {os.path.relpath(api.HISTORY_FILEPATH, api.TASKS_DIR):json.dumps(legacy).encode("utf-8")}
+    if lines: history[os.path.relpath(api.HISTORY_LOG_FILEPATH, api.TASKS_DIR)] = "".join(lines).encode("utf-8")
+    return tasks, history
+
+#enregistrements de l'historique d'une sauvegarde, dans l'ordre de iter_all_history()
+def backup_history(manifest)->list:
+    history = manifest["history"]
+    legacy = os.path.relpath(api.HISTORY_FILEPATH, api.TASKS_DIR)
+    log = os.path.relpath(api.HISTORY_LOG_FILEPATH, api.TASKS_DIR)
+    records = []
+    if legacy in history: records += [{"folder":folder, "name":name} for folder, names in json.loads(read_object(history[legacy])).items() for name in names]
+    for relpath in sorted(relpath for relpath in history if relpath != legacy and relpath != log)+([log] if log in history else []):
+        for line in read_object(history[relpath]).decode("utf-8").splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:#ligne tronquée par un arrêt brutal
+                continue
+    return records
+
+##objets
+def write_object(data: bytes)->str:
+    digest = hashlib.sha1(data).hexdigest()
+    filepath = object_path(digest)
+    if not os.path.exists(filepath):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        compressed = zlib.compress(data)
+        with open(filepath+".tmp", "wb") as f:
+            f.write(compressed)
+        os.replace(filepath+".tmp", filepath)
+        metrics.count("backup.objects_written")
+        metrics.count("io.bytes_written", len(compressed))
+    return digest
+
+def read_object(digest)->bytes:
+    with open(object_path(digest), "rb") as f:
+        return zlib.decompress(f.read())
+
+def encode_folder(tasks: dict)->bytes:
+    return json.dumps(tasks, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+##sauvegardes
+#l'état du disque est lu sous le verrou des tâches, journal compris : on peut sauvegarder pendant que
+#l'application tourne. Il est relâché avant la compression, les objets et le manifeste sont écrits
+#sous celui des sauvegardes pour qu'un prune_backups() ne retire pas les objets entre-temps
+@metrics.timed("backup.create")
+def create_backup(now: datetime = None)->str:
+    now = now or datetime.now()
+    backup_id = now.strftime(ID_FORMAT)
+    with api.tasks_lock():
+        tasks, history = read_sqlite_data() if uses_sqlite(api.load_config()) else read_json_data()
+    with backups_lock():
+        history = {relpath:write_object(data) for relpath, data in history.items()}
+        folders = [[folder, write_object(encode_folder(folder_tasks))] for folder, folder_tasks in tasks.items()]
+        os.makedirs(os.path.dirname(manifest_path(backup_id)), exist_ok=True)
+        with open(manifest_path(backup_id)+".tmp", "w") as f:
+            json.dump({"time":now.isoformat(timespec="seconds"), "folders":folders, "history":history}, f)
+        os.replace(manifest_path(backup_id)+".tmp", manifest_path(backup_id))
+    return backup_id
+
+#identifiants du plus ancien au plus récent
+def list_backups()->list:
+    directory = os.path.join(backup_dir(), "manifests")
+    if not os.path.exists(directory): return []
+    return sorted(name[:-len(".json")] for name in os.listdir(directory) if name.endswith(".json"))
+
+def load_manifest(backup_id)->dict:
+    with open(manifest_path(backup_id), "r") as f:
+        return json.load(f)
+
+def backup_time(backup_id)->datetime:
+    return datetime.strptime(backup_id, ID_FORMAT)
+
+def last_backup_time():
+    backups = list_backups()
+    return backup_time(backups[-1]) if backups else None
+
+##rétention
+def backups_to_keep(backup_ids, keep_last = KEEP_LAST, keep_daily = KEEP_DAILY, keep_weekly = KEEP_WEEKLY)->set:
+    newest = sorted(backup_ids, reverse=True)
+    keep = set(newest[:keep_last])
+    for limit, period in ((keep_daily, lambda time: time.date()), (keep_weekly, lambda time: time.isocalendar()[:2])):
+        seen = []
+        for backup_id in newest:
+            key = period(backup_time(backup_id))
+            if key in seen: continue
+            if len(seen) == limit: break
+            seen.append(key)
+            keep.add(backup_id)
+    return keep
+
+#supprime les sauvegardes hors rétention puis les objets qu'aucun manifeste ne référence
+@metrics.timed("backup.prune")
+def prune_backups(keep_last = KEEP_LAST, keep_daily = KEEP_DAILY, keep_weekly = KEEP_WEEKLY)->list:
+    with backups_lock():
+        return remove_backups(backups_to_keep(list_backups(), keep_last, keep_daily, keep_weekly))
+
+def remove_backups(keep)->list:
+    backups = list_backups()
+    removed = [backup_id for backup_id in backups if not backup_id in keep]
+    for backup_id in removed: os.remove(manifest_path(backup_id))
+    used = set()
+    for backup_id in keep:
+        manifest = load_manifest(backup_id)
+        used.update(digest for _, digest in manifest["folders"])
+        used.update(manifest["history"].values())
+    objects = os.path.join(backup_dir(), "objects")
+    if os.path.exists(objects):
+        for prefix in os.listdir(objects):
+            for name in os.listdir(os.path.join(objects, prefix)):
+                if not prefix+name in used: os.remove(os.path.join(objects, prefix, name))
+    return removed
+
+##restauration
+#réécrit les tâches et l'historique depuis la sauvegarde backup_id dans le backend configuré, après
+#avoir sauvegardé l'état actuel. Une application ouverte relit les données d'elle-même (voir watcher.py)
+@metrics.timed("backup.restore")
+def restore_backup(backup_id, history = True)->str:
+    manifest = load_manifest(backup_id)
+    config = api.load_config()
+    with api.tasks_lock():
+        safety_id = create_backup()
+        tasks = {folder:json.loads(read_object(digest)) for folder, digest in manifest["folders"]}
+        if uses_sqlite(config): restore_sqlite(tasks, backup_history(manifest) if history else None)
+        else: restore_json(tasks, manifest if history else None, config.get("snapshot"))
+    return safety_id
+
+#une seule transaction : une application ouverte voit l'ancien état ou le nouveau
+def restore_sqlite(tasks, records = None):
+    storage = SqliteStorage(api.SQLITE_FILEPATH)
+    try:
+        storage.clear(records is not None)
+        storage.import_data(tasks, records or [])
+    finally:
+        storage.close()
+
+def restore_json(tasks, manifest = None, format = None):
+    api.dump_tasks(tasks, format)
+    if manifest is None: return
+    for relpath in history_files():
+        if not relpath in manifest["history"]: os.remove(os.path.join(api.TASKS_DIR, relpath))
+    for relpath, digest in manifest["history"].items():
+        filepath = os.path.join(api.TASKS_DIR, relpath)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath+".tmp", "wb") as f:
+            f.write(read_object(digest))
+        os.replace(filepath+".tmp", filepath)
+    if os.path.exists(api.ROLLUPS_FILEPATH): os.remove(api.ROLLUPS_FILEPATH)#reconstruit depuis l'historique
+
+#sauvegarde si la dernière a plus de interval, utilisé au démarrage de l'application
+def backup_if_needed(interval = timedelta(days=1))->str:
+    last = last_backup_time()
+    if last is not None and datetime.now()-last < interval: return None
+    backup_id = create_backup()
+    prune_backups()
+    return backup_id
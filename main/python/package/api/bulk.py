@@ -0,0 +1,81 @@
+from datetime import date as Date
+from itertools import islice
+from typing import Iterable
+import csv
+import json
+
+from .recurrence import format_rule, parse_rule, rule_anchor
+from .storage import Storage, date_to_ordinal
+from .tasks import Task, TaskStore
+
+
+BATCH_SIZE = 5000 #tâches transmises au backend en une seule écriture
+FIELDS = ["folder", "name", "achieved", "priority", "date", "repeat"]
+
+
+#fonctions
+##lecture
+def read_jsonl(f):
+    for line in f:
+        if line.strip(): yield json.loads(line)
+
+def read_csv(f):
+    yield from csv.DictReader(f)
+
+def read_records(f, format = "jsonl"):
+    return read_csv(f) if format == "csv" else read_jsonl(f)
+
+def parse_bool(value)->bool:
+    if isinstance(value, str): return value.strip().lower() in ("1", "true", "yes", "oui", "x")
+    return bool(value)
+
+def record_to_task(record: dict, folder = "general")->Task:
+    priority = record.get("priority") or 0
+    return Task(record["name"], parse_bool(record.get("achieved", False)), record.get("folder") or folder,
+                int(priority), date_to_ordinal(record.get("date") or 0), True, repeat=parse_repeat(record.get("repeat")))
+
+#une règle invalide est refusée à l'import plutôt qu'au premier report de la tâche
+def parse_repeat(value):
+    if not value: return None
+    return format_rule(*parse_rule(value), rule_anchor(value))
+
+##écriture
+def iso_date(ordinal)->str:
+    return Date.fromordinal(ordinal).isoformat() if ordinal > 0 else ""
+
+def write_jsonl(records, f):
+    for record in records: f.write(json.dumps(record, ensure_ascii=False)+"\n")
+
+def write_csv(records, f, fields = FIELDS):
+    writer = csv.DictWriter(f, fields, extrasaction="ignore")
+    writer.writeheader()
+    for record in records: writer.writerow(record)
+
+def write_records(records, f, format = "jsonl"):
+    if format == "csv": write_csv(records, f)
+    else: write_jsonl(records, f)
+
+##import / export
+#les enregistrements sont lus au fil de l'eau et ajoutés par lots de BATCH_SIZE,
+#le fichier des tâches n'est réécrit qu'une fois par store.flush()
+def import_tasks(records: Iterable[dict], store: TaskStore, folder = "general")->int:
+    tasks = (record_to_task(record, folder) for record in records)
+    count = 0
+    while True:
+        batch = list(islice(tasks, BATCH_SIZE))
+        if not batch: break
+        store.add_tasks(batch)
+        count += len(batch)
+    store.flush()
+    return count
+
+def iter_task_records(storage: Storage):
+    for folder, name, task in storage.iter_tasks():
+        yield {"folder":folder, "name":name, "achieved":task["achieved"], "priority":task["priority"], "date":iso_date(date_to_ordinal(task["date"])), "repeat":task.get("repeat")}
+
+def export_tasks(storage: Storage, f, format = "jsonl"):
+    write_records(iter_task_records(storage), f, format)
+
+def export_history(storage: Storage, f, format = "jsonl"):
+    if format == "csv": write_csv(storage.iter_history(), f, ["folder", "name", "time"])
+    else: write_jsonl(storage.iter_history(), f)
@@ -0,0 +1,225 @@
+from datetime import datetime
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from . import metrics
+from . import tasks as api
+from .remote import READS, daemon_available, encode
+
+
+#démon qui garde en mémoire l'unique TaskStore et écrit seul les fichiers de ~/.todo,
+#les fenêtres et les scripts lancés avec "daemon": true passent par lui (voir remote.py)
+#les requêtes d'un client sont traitées dans l'ordre, celles de tous les clients une à une
+#sous le même verrou. Chaque requête est un bloc TaskStore.batch() : ses modifications
+#sont envoyées d'un coup aux autres clients abonnés
+FLUSH_DELAY = 1.0 #s entre une modification et l'écriture des fichiers
+WATCH_INTERVAL = 2.0 #s entre deux vérifications des fichiers modifiés sans passer par le démon
+
+
+#fonctions
+#événement de TaskStore -> modification de TaskStore.apply_change
+def event_to_change(event, args):
+    if event in ("added", "changed"): return ["set", args[0].folder, args[0].name, args[0].toDict()]
+    if event == "removed": return ["delete", args[0], args[1]]
+    if event == "renamed": return ["rename", args[0].folder, args[1], args[0].name]
+    if event == "moved": return ["move", args[1], args[0].name, args[0].folder]
+    if event == "folder_added": return ["add_folder", args[0]]
+    if event == "folder_renamed": return ["rename_folder", args[0], args[1]]
+    if event == "folder_removed": return ["remove_folder", args[0]]
+    if event == "history_added": return ["history", args[0]]
+
+
+#class
+class DaemonHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.send_lock = threading.Lock()
+        with self.server.lock:
+            self.server.clients.add(self)
+
+    def handle(self):
+        for line in self.rfile:
+            message = {}
+            try:
+                message = json.loads(line)
+                result = self.server.execute(self, message)
+                if message["op"] in READS: self.send({"id":message["id"], "result":result})
+            except Exception as error:#une ligne illisible ne coupe pas la connexion
+                self.send({"id":message.get("id") if isinstance(message, dict) else None, "error":type(error).__name__+": "+str(error)})
+
+    def finish(self):
+        self.server.unsubscribe(self)
+        with self.server.lock:
+            self.server.clients.discard(self)
+        super().finish()
+
+    def send(self, message):
+        with self.send_lock:
+            self.wfile.write(encode(message))
+
+
+class StoreDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, filepath = None, storage = None):
+        self.filepath = filepath or api.SOCKET_FILEPATH
+        if daemon_available(self.filepath): raise RuntimeError("store daemon already running on "+self.filepath)
+        if os.path.exists(self.filepath): os.remove(self.filepath)#socket d'un démon arrêté
+        super().__init__(self.filepath, DaemonHandler)
+        self.lock = threading.RLock()
+        self.store = api.TaskStore(storage if storage is not None else api.open_storage(dict(api.load_config(), daemon=False)))
+        self.store.load()
+        self.store.subscribe(self.store_changed, batched=True)
+        self.store.on_dirty = self.schedule_flush
+        self.subscribers = set()
+        self.clients = set()
+        self.origin = None
+        self.flush_timer = None
+        self.stopped = threading.Event()
+        self.watcher = threading.Thread(target=self.watch, name="store-watch", daemon=True)
+        self.watcher.start()
+
+    ##requêtes
+    def execute(self, client, message):
+        metrics.count("daemon.requests")
+        with self.lock:
+            self.origin = client
+            try:
+                with self.store.batch():
+                    if message["op"] == "batch":
+                        for op, args in message["calls"]: self.call(client, op, args)
+                        return None
+                    return self.call(client, message["op"], message["args"])
+            finally:
+                self.origin = None
+
+    def call(self, client, op, args):
+        return getattr(self, "op_"+op)(client, *args)
+
+    def op_ping(self, client):
+        return True
+
+    def op_subscribe(self, client):
+        self.subscribers.add(client)
+        return True
+
+    ##lectures
+    def op_load(self, client):
+        return self.store.to_dict()
+
+    def op_load_folders(self, client):
+        return {folder:None for folder in self.store.tasks}
+
+    def op_load_folder(self, client, folder):
+        if folder in self.store.loaded_folders: return {name:task.toDict() for name, task in self.store.tasks[folder].items()}
+        return dict(self.store.raw_folder(folder)) if folder in self.store.tasks else {}
+
+    def op_load_history(self, client):
+        return self.store.storage.load_history()
+
+    def op_iter_history(self, client):
+        return list(self.store.storage.iter_history())
+
+    def op_load_rollups(self, client):
+        return self.store.rollups()
+
+    def op_iter_tasks(self, client):
+        return list(self.store.iter_records())
+
+    #les requêtes du backend lisent les fichiers : ils sont d'abord mis à jour
+    def op_due_before(self, client, date):
+        self.store.flush()
+        return self.store.storage.due_before(date)
+
+    def op_priority_at_least(self, client, priority):
+        self.store.flush()
+        return self.store.storage.priority_at_least(priority)
+
+    def op_achieved_in(self, client, folder):
+        self.store.flush()
+        return self.store.storage.achieved_in(folder)
+
+    ##modifications, appliquées au TaskStore qui les transmet au backend
+    def op_set_task(self, client, folder, name, task):
+        self.store.apply_change("set", folder, name, task)
+
+    def op_set_tasks(self, client, tasks):
+        for folder, name, task in tasks: self.store.apply_change("set", folder, name, task)
+
+    #TaskStore.folder() créerait en mémoire un dossier inconnu
+    def op_delete_tasks(self, client, tasks):
+        self.store.remove_tasks([task for task in tasks if task[0] in self.store.tasks])
+
+    def op_rename_task(self, client, folder, name, new_name):
+        self.store.apply_change("rename", folder, name, new_name)
+
+    def op_move_task(self, client, folder, name, new_folder):
+        self.store.apply_change("move", folder, name, new_folder)
+
+    def op_add_folder(self, client, folder):
+        self.store.add_folder(folder)
+
+    def op_rename_folder(self, client, old_name, new_name):
+        self.store.rename_folder(old_name, new_name)
+
+    def op_add_history(self, client, tasks, time = None):
+        tasks = [tuple(task) for task in tasks]
+        self.store.persist("add_history", tasks, datetime.fromisoformat(time) if time else datetime.now())
+        self.store.notify("history_added", tasks)
+
+    def op_commit(self, client):
+        self.store.flush()
+
+    ##abonnés
+    #les modifications d'un client ne lui sont pas renvoyées, il les a déjà faites
+    def store_changed(self, event, *args):
+        events = args[0] if event == "batch" else [(event, args)]
+        changes = [change for change in (event_to_change(event, args) for event, args in events) if change is not None]
+        for client in list(self.subscribers):
+            if client is self.origin: continue
+            try:
+                client.send({"event":"changes", "changes":changes})
+            except OSError:
+                self.unsubscribe(client)
+        metrics.count("daemon.changes", len(changes))
+
+    def unsubscribe(self, client):
+        with self.lock:
+            self.subscribers.discard(client)
+
+    ##écriture des fichiers
+    def schedule_flush(self):
+        if self.flush_timer is None:
+            self.flush_timer = threading.Timer(FLUSH_DELAY, self.flush)
+            self.flush_timer.daemon = True
+            self.flush_timer.start()
+
+    def flush(self):
+        with self.lock:
+            self.flush_timer = None
+            self.store.flush()
+
+    #un script lancé sans le démon écrit directement les fichiers : le store les relit
+    #et les abonnés reçoivent les différences
+    def watch(self):
+        while not self.stopped.wait(WATCH_INTERVAL):
+            with self.lock:
+                self.store.sync()
+
+    #les connexions ouvertes sont coupées : leurs clients reçoivent ("closed",) au lieu d'écrire dans un store fermé
+    def close(self):
+        self.stopped.set()
+        self.shutdown()
+        self.server_close()
+        with self.lock:
+            if self.flush_timer is not None: self.flush_timer.cancel()
+            self.store.close()
+            for client in self.clients:
+                try:
+                    client.request.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if os.path.exists(self.filepath): os.remove(self.filepath)
@@ -0,0 +1,103 @@
+from itertools import count
+import heapq
+
+from .storage import date_to_ordinal
+
+
+#tas des tâches non terminées ayant une date, trié par date puis priorité décroissante
+#les entrées retirées sont seulement marquées et ignorées en tête de tas
+class DeadlineIndex:
+    DATE, PRIORITY, SEQUENCE, FOLDER, NAME, VALID = range(6)
+
+    def __init__(self):
+        self.heap = []
+        self.entries = {}
+        self.stale = 0
+        self.counter = count()
+
+    def build(self, records):
+        self.heap = []
+        self.entries = {}
+        self.stale = 0
+        for folder, name, task in records:
+            date = date_to_ordinal(task["date"])
+            if date and not task["achieved"]: self.heap.append(self.new_entry(folder, name, date, task["priority"]))
+        heapq.heapify(self.heap)
+
+    def new_entry(self, folder, name, date, priority):
+        entry = [date, -(priority or 0), next(self.counter), folder, name, True]
+        self.entries.setdefault(folder, {})[name] = entry
+        return entry
+
+    ##mises à jour
+    def update(self, task):
+        self.remove(task.folder, task.name)
+        if task.date and not task.achieved:
+            heapq.heappush(self.heap, self.new_entry(task.folder, task.name, task.date, task.priority))
+
+    def remove(self, folder, name):
+        entry = self.entries.get(folder, {}).pop(name, None)
+        if entry is not None:
+            entry[self.VALID] = False
+            self.stale += 1
+            if self.stale > len(self.heap)//2: self.compact()
+
+    def rename_folder(self, old_name, new_name):
+        if old_name in self.entries:
+            self.entries[new_name] = self.entries.pop(old_name)
+            for entry in self.entries[new_name].values(): entry[self.FOLDER] = new_name
+
+    def compact(self):
+        self.heap = [entry for entry in self.heap if entry[self.VALID]]
+        heapq.heapify(self.heap)
+        self.stale = 0
+
+    #à brancher sur TaskStore.subscribe
+    def store_changed(self, event, *args):
+        if event in ("added", "changed"): self.update(args[0])
+        elif event == "removed": self.remove(*args)
+        elif event == "renamed":
+            self.remove(args[0].folder, args[1])
+            self.update(args[0])
+        elif event == "moved":
+            self.remove(args[1], args[0].name)
+            self.update(args[0])
+        elif event == "folder_renamed": self.rename_folder(*args)
+
+    ##requêtes
+    def date_of(self, folder, name):
+        entry = self.entries.get(folder, {}).get(name)
+        return entry[self.DATE] if entry is not None else None
+
+    def peek(self):
+        while self.heap and not self.heap[0][self.VALID]:
+            heapq.heappop(self.heap)
+            self.stale -= 1
+        return self.heap[0] if self.heap else None
+
+    #les deux parcours suivants élaguent les sous-arbres du tas dont la racine dépasse la date
+    #(dossier, nom, date) des tâches dont la date est <= date, triées par date et priorité
+    def due(self, date):
+        found = []
+        pending = [0] if self.heap else []
+        while pending:
+            i = pending.pop()
+            entry = self.heap[i]
+            if entry[self.DATE] > date: continue
+            if entry[self.VALID]: found.append(entry)
+            pending.extend(child for child in (2*i+1, 2*i+2) if child < len(self.heap))
+        return [(entry[self.FOLDER], entry[self.NAME], entry[self.DATE]) for entry in sorted(found)]
+
+    #première date strictement postérieure à date
+    def next_date(self, date):
+        best = None
+        pending = [0] if self.heap else []
+        while pending:
+            i = pending.pop()
+            entry = self.heap[i]
+            if best is not None and entry[self.DATE] >= best: continue
+            if entry[self.DATE] > date and entry[self.VALID]:
+                best = entry[self.DATE]
+                continue
+            pending.extend(child for child in (2*i+1, 2*i+2) if child < len(self.heap))
+        return best
@@ -0,0 +1,57 @@
+import threading
+
+try:
+    import fcntl
+except ImportError:#Windows
+    fcntl = None
+    import msvcrt
+
+
+locks = {}
+
+
+#fonctions
+#un seul verrou par fichier dans le processus : deux descripteurs sur le même
+#fichier se bloqueraient mutuellement
+def get_lock(filepath):
+    if not filepath in locks: locks[filepath] = FileLock(filepath)
+    return locks[filepath]
+
+
+#class
+#verrou consultatif entre processus (flock, ou msvcrt sous Windows), réentrant
+#pour le processus qui le détient
+class FileLock:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.file = None
+        self.depth = 0
+        self.thread_lock = threading.RLock()
+
+    def acquire(self):
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            self.file = open(self.filepath, "a+")
+            if fcntl is not None: fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None: fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,45 @@
+import hashlib
+import os
+
+
+#fonctions
+def file_stat(filepath):
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def file_digest(filepath):
+    if not os.path.exists(filepath): return None
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""): digest.update(chunk)
+    return digest.hexdigest()
+
+
+#class
+#taille et date de modification d'un groupe de fichiers, plus le contenu des
+#fichiers de hashed pour ignorer une réécriture à l'identique
+class Fingerprint:
+    def __init__(self, filepaths, hashed = ()):
+        self.filepaths = list(filepaths)
+        self.hashed = set(hashed)
+        self.stats = {}
+        self.digests = {}
+
+    def changed(self)->bool:
+        stats = {filepath:file_stat(filepath) for filepath in self.filepaths}
+        if stats == self.stats: return False
+        for filepath, stat in stats.items():
+            if stat == self.stats.get(filepath): continue
+            if not filepath in self.hashed or file_digest(filepath) != self.digests.get(filepath): return True
+        self.stats = stats#seules les dates ont changé
+        return False
+
+    #à appeler après chaque lecture ou écriture faite par ce processus
+    def remember(self):
+        stats = {filepath:file_stat(filepath) for filepath in self.filepaths}
+        for filepath in self.hashed:
+            if stats[filepath] != self.stats.get(filepath): self.digests[filepath] = file_digest(filepath)
+        self.stats = stats
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+from json.decoder import JSONDecodeError
+import os
+import json
+
+from . import metrics
+
+
+HISTORY_MAX_SIZE = 1024*1024 #octets avant d'archiver le fichier courant
+HISTORY_MAX_AGE = timedelta(days=30)
+
+
+#l'historique est un fichier JSON Lines où l'on ne fait qu'ajouter,
+#archivé dans archive_dir lorsqu'il devient trop gros ou trop vieux
+def append_history(filepath, archive_dir, tasks, time: datetime = None):
+    time = (time or datetime.now()).isoformat(timespec="seconds")
+    lines = [json.dumps({"folder":folder, "name":name, "time":time}, separators=(",", ":"))+"\n" for folder, name in tasks]
+    if not lines: return
+    if should_rotate(filepath): rotate_history(filepath, archive_dir)
+    elif is_truncated(filepath): lines.insert(0, "\n")
+    data = "".join(lines)
+    with open(filepath, "a") as f:
+        f.write(data)
+    metrics.count("io.writes")
+    metrics.count("io.bytes_written", len(data))
+
+def is_truncated(filepath):
+    if not os.path.exists(filepath) or os.path.getsize(filepath) == 0: return False
+    with open(filepath, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+def should_rotate(filepath):
+    if not os.path.exists(filepath) or os.path.getsize(filepath) == 0: return False
+    if os.path.getsize(filepath) > HISTORY_MAX_SIZE: return True
+    first = first_record(filepath)
+    return first is not None and datetime.now() - datetime.fromisoformat(first["time"]) > HISTORY_MAX_AGE
+
+def rotate_history(filepath, archive_dir):
+    if not os.path.exists(archive_dir): os.mkdir(archive_dir)
+    segment = "history-"+datetime.now().strftime("%Y%m%d-%H%M%S-%f")+".jsonl"
+    os.replace(filepath, os.path.join(archive_dir, segment))
+
+def first_record(filepath):
+    with open(filepath, "r") as f:
+        try:
+            return json.loads(f.readline())
+        except JSONDecodeError:
+            return None
+
+##lecture
+def history_segments(filepath, archive_dir):
+    segments = []
+    if os.path.exists(archive_dir):
+        segments = [os.path.join(archive_dir, name) for name in sorted(os.listdir(archive_dir)) if name.endswith(".jsonl")]
+    if os.path.exists(filepath): segments.append(filepath)
+    return segments
+
+def iter_history(filepath, archive_dir):
+    for segment in history_segments(filepath, archive_dir):
+        with open(segment, "r") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except JSONDecodeError:#ligne tronquée par un arrêt brutal
+                    continue
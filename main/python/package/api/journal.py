@@ -0,0 +1,108 @@
+from json.decoder import JSONDecodeError
+import os
+import json
+
+from . import metrics
+
+
+#chaque modification de tasks.json est ajoutée comme une ligne JSON
+#et rejouée au chargement par dessus le dernier snapshot
+#base : fonction qui donne l'empreinte du snapshot, notée en tête d'un journal vide (voir current_records)
+class Journal:
+    def __init__(self, filepath, base = None):
+        self.filepath = filepath
+        self.base = base
+        self.file = None
+
+    def append(self, record: dict):
+        self.extend([record])
+
+    #une seule écriture et un seul fsync pour tout le lot
+    def extend(self, records):
+        if self.file is None: self.open()
+        if self.base is not None and os.fstat(self.file.fileno()).st_size == 0: records = [{"op":"base", "snapshot":self.base()}]+list(records)
+        data = "".join(json.dumps(record, separators=(",", ":"))+"\n" for record in records)
+        self.file.write(data)
+        metrics.count("io.writes")
+        metrics.count("io.bytes_written", len(data))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def open(self):
+        truncated = False
+        if self.size() > 0:
+            with open(self.filepath, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                truncated = f.read(1) != b"\n"
+        self.file = open(self.filepath, "a")
+        if truncated: self.file.write("\n")#on termine la ligne coupée par un arrêt brutal
+
+    def size(self):
+        if os.path.exists(self.filepath): return os.path.getsize(self.filepath)
+        return 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_journal(filepath):
+    if not os.path.exists(filepath): return
+    metrics.count("io.reads")
+    with open(filepath, "r") as f:
+        for line in f:
+            metrics.count("io.bytes_read", len(line))
+            try:
+                yield json.loads(line)
+            except JSONDecodeError:#ligne tronquée par un arrêt brutal
+                continue
+
+#le journal ne s'applique qu'au snapshot noté en tête : si celui-ci a été réécrit depuis (arrêt
+#brutal entre l'écriture du snapshot et le vidage du journal), il contient déjà le journal
+#digest : fonction qui donne l'empreinte du snapshot actuel, calculée seulement si besoin
+def current_records(filepath, digest)->list:
+    records = list(read_journal(filepath))
+    if records and records[0]["op"] == "base":
+        if records[0]["snapshot"] != digest(): return []
+        del records[0]
+    return records
+
+def clear_journal(filepath):
+    if os.path.exists(filepath): os.truncate(filepath, 0)
+
+def replay(tasks: dict, records):
+    for record in records: apply_record(tasks, record)
+    return tasks
+
+#dans une suite de "set", seul le dernier état de chaque tâche est utile
+def coalesce(records):
+    kept = []
+    last_set = {}
+    for record in records:
+        if record["op"] == "set":
+            key = (record["folder"], record["name"])
+            if key in last_set: kept[last_set[key]] = None
+            last_set[key] = len(kept)
+        else: last_set = {}
+        kept.append(record)
+    return [record for record in kept if record is not None]
+
+def apply_record(tasks: dict, record: dict):
+    op = record["op"]
+    folder = record["folder"]
+    if op == "set":
+        tasks.setdefault(folder, {})[record["name"]] = record["task"]
+    elif op == "del":
+        if folder in tasks: tasks[folder].pop(record["name"], None)
+    elif op == "rename":
+        if folder in tasks and record["name"] in tasks[folder] and not record["new"] in tasks[folder]:
+            tasks[folder][record["new"]] = tasks[folder].pop(record["name"])
+    elif op == "move":
+        if folder in tasks and record["name"] in tasks[folder]:
+            tasks.setdefault(record["new"], {})[record["name"]] = tasks[folder].pop(record["name"])
+    elif op == "add_folder":
+        tasks.setdefault(folder, {})
+    elif op == "rename_folder":
+        if folder in tasks and not record["new"] in tasks:
+            tasks[record["new"]] = tasks.pop(folder)
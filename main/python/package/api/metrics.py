@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+from functools import wraps
+import json
+import threading
+import time
+
+
+#compteurs et histogrammes de latence des opérations, désactivés par défaut :
+#chaque point de mesure ne coûte alors qu'un test de enabled
+#le verrou n'est pris qu'une fois activé, le thread d'écriture mesure aussi ses opérations
+enabled = False
+lock = threading.Lock()
+counters = {}
+histograms = {}
+started = time.time()
+
+
+#class
+#durées regroupées par puissance de deux de microsecondes
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        bucket = int(seconds*1e6).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0)+1
+
+    #borne haute du seuil atteint par une proportion ratio des mesures, en ms
+    def percentile(self, ratio)->float:
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= ratio*self.count: return min((1 << bucket)/1000, self.max*1000)
+        return 0.0
+
+    def to_dict(self)->dict:
+        return {"count":self.count, "total_ms":self.total*1000, "mean_ms":self.total*1000/self.count if self.count else 0.0,
+                "p50_ms":self.percentile(0.5), "p95_ms":self.percentile(0.95), "p99_ms":self.percentile(0.99), "max_ms":self.max*1000,
+                "buckets_us":{str(1 << bucket):count for bucket, count in sorted(self.buckets.items())}}
+
+
+#fonctions
+def enable(on = True):
+    global enabled
+    enabled = on
+
+def reset():
+    global started
+    with lock:
+        counters.clear()
+        histograms.clear()
+        started = time.time()
+
+def count(name, n = 1):
+    if enabled:
+        with lock:
+            counters[name] = counters.get(name, 0)+n
+
+def observe(name, seconds):
+    if enabled:
+        with lock:
+            if not name in histograms: histograms[name] = Histogram()
+            histograms[name].add(seconds)
+
+@contextmanager
+def timer(name):
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter()-start)
+
+#décorateur : durée de chaque appel dans l'histogramme name
+def timed(name):
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled: return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter()-start)
+        return wrapper
+    return decorate
+
+##rapport
+def snapshot()->dict:
+    with lock:
+        return {"since":started, "duration_s":time.time()-started, "counters":dict(sorted(counters.items())),
+                "latency":{name:histogram.to_dict() for name, histogram in sorted(histograms.items())}}
+
+def report()->str:
+    state = snapshot()
+    lines = ["%-32s %12s" % ("compteur", "valeur")]
+    lines += ["%-32s %12d" % (name, value) for name, value in state["counters"].items()]
+    lines += ["", "%-32s %7s %9s %9s %9s %9s" % ("opération", "appels", "moy. ms", "p95 ms", "max ms", "total ms")]
+    for name, data in state["latency"].items():
+        lines.append("%-32s %7d %9.2f %9.2f %9.2f %9.1f" % (name, data["count"], data["mean_ms"], data["p95_ms"], data["max_ms"], data["total_ms"]))
+    return "\n".join(lines)
+
+def dump(filepath):
+    with open(filepath, "w") as f:
+        json.dump(snapshot(), f, indent=2)
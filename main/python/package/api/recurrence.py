@@ -0,0 +1,74 @@
+from calendar import monthrange
+from datetime import date
+
+
+#une règle de répétition est une chaîne "unité" ou "intervalle unité" ("week", "2 day", "3 month"),
+#gardée telle quelle dans le dictionnaire de la tâche sous la clé "repeat". La date de la tâche
+#est sa prochaine occurrence, les suivantes sont calculées à la demande.
+#Une règle mensuelle dont la date a été ramenée au dernier jour d'un mois plus court garde le
+#jour visé ("month@31") : l'occurrence suivante revient au 31 au lieu de rester au 28
+DAY, WEEK, MONTH = "day", "week", "month"
+UNITS = (DAY, WEEK, MONTH)
+MAX_INTERVAL = 0xFFFF #voir snapshot.py
+
+
+#fonctions
+def parse_rule(rule)->tuple:
+    every, _, unit = rule.partition("@")[0].strip().rpartition(" ")
+    every = int(every) if every else 1
+    if not unit in UNITS or not 0 < every <= MAX_INTERVAL: raise ValueError("invalid repeat rule: "+repr(rule))
+    return every, unit
+
+#jour du mois visé, None si la règle n'en précise pas
+def rule_anchor(rule):
+    _, _, anchor = rule.partition("@")
+    if not anchor: return None
+    if not 1 <= int(anchor) <= 31: raise ValueError("invalid repeat rule: "+repr(rule))
+    return int(anchor)
+
+def format_rule(every, unit, anchor = None)->str:
+    rule = unit if every == 1 else str(every)+" "+unit
+    return rule+"@"+str(anchor) if anchor else rule
+
+#la règle à garder pour une tâche datée de start, day : jour visé par l'occurrence précédente
+#le jour visé n'est noté que si start est le dernier jour d'un mois trop court pour lui
+def anchored_rule(rule, start: int, day: int = None):
+    every, unit = parse_rule(rule)
+    anchor = max(rule_anchor(rule) or 0, day or 0)
+    day = date.fromordinal(start)
+    if unit != MONTH or not anchor or anchor <= day.day or day.day != monthrange(day.year, day.month)[1]: anchor = None
+    return format_rule(every, unit, anchor)
+
+def add_months(day: date, months: int, anchor: int = None)->date:
+    year, month = divmod(day.month-1+months, 12)
+    year += day.year
+    return date(year, month+1, min(anchor or day.day, monthrange(year, month+1)[1]))
+
+#occurrences de la règle à partir de start (ordinal), à partir de la première postérieure à after
+#l'itérateur est infini, il n'en calcule que ce qu'on lui demande et saute directement à after
+def occurrences(start: int, rule, after: int = None):
+    every, unit = parse_rule(rule)
+    if unit == MONTH:
+        first = date.fromordinal(start)
+        anchor = max(rule_anchor(rule) or 0, first.day)
+        k = 0
+        if after is not None and after >= start:
+            later = date.fromordinal(after)
+            k = max(((later.year-first.year)*12+later.month-first.month)//every, 0)
+        while True:
+            ordinal = add_months(first, k*every, anchor).toordinal()
+            if after is None or ordinal > after: yield ordinal
+            k += 1
+    step = every*(7 if unit == WEEK else 1)
+    ordinal = start if after is None or after < start else start+((after-start)//step+1)*step
+    while True:
+        yield ordinal
+        ordinal += step
+
+def next_occurrence(start: int, rule, after: int)->int:
+    return next(occurrences(start, rule, after))
+
+def occurrences_between(start: int, rule, first: int, last: int):
+    for ordinal in occurrences(start, rule, first-1):
+        if ordinal > last: return
+        yield ordinal
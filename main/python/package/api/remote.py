@@ -0,0 +1,197 @@
+from datetime import datetime
+import itertools
+import json
+import socket
+import threading
+
+from . import metrics
+from .storage import Storage
+
+
+#protocole du démon (voir daemon.py) : un message JSON par ligne sur une socket Unix
+#  requête     {"id", "op", "args"}, op est une méthode de Storage, "batch" ({"id", "op", "calls":[[op, args], ...]}),
+#              "ping" ou "subscribe"
+#  réponse     {"id", "result"} pour les lectures, ping et subscribe, {"id", "error"} pour tout échec
+#  événement   {"event":"changes", "changes":[...]} pour les clients abonnés, voir TaskStore.apply_change
+#les écritures n'attendent pas de réponse : un client envoie ses requêtes à la suite sans attendre,
+#le démon les traite dans l'ordre. Une lecture attend sa réponse, et donc les écritures précédentes
+READS = {"load", "load_folders", "load_folder", "load_history", "iter_history", "load_rollups", "iter_tasks", "due_before", "priority_at_least", "achieved_in", "ping", "subscribe"}
+CONNECT_TIMEOUT = 1 #s
+
+
+#fonctions
+def encode(message)->bytes:
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")+b"\n"
+
+def connect(filepath, timeout = CONNECT_TIMEOUT)->socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(filepath)
+    except OSError:
+        sock.close()
+        raise
+    sock.settimeout(None)
+    return sock
+
+#pas de socket Unix sous Windows : le démon n'y est jamais disponible
+def daemon_available(filepath)->bool:
+    if not hasattr(socket, "AF_UNIX"): return False
+    try:
+        connect(filepath).close()
+        return True
+    except OSError:
+        return False
+
+
+#class
+#backend qui délègue au démon : aucune lecture ni écriture de fichier dans ce processus
+#les listeners reçoivent ("changes", modifications) des autres clients après subscribe(),
+#("failed", exception) pour une écriture refusée et ("closed",) si le démon s'arrête
+class RemoteStorage(Storage):
+    def __init__(self, filepath):
+        self.sock = connect(filepath)
+        self.reader = self.sock.makefile("rb")
+        self.ids = itertools.count(1)
+        self.send_lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.replies = {}
+        self.waiting = set()
+        self.grouping = None
+        self.closed = False
+        self.stopping = False
+        self.listeners = []
+        self.thread = threading.Thread(target=self.run, name="store-client", daemon=True)
+        self.thread.start()
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, event, *args):
+        for listener in self.listeners: listener(event, *args)
+
+    ##envoi
+    def send(self, message):
+        with self.send_lock:
+            if self.closed: raise ConnectionError("store daemon closed")
+            self.sock.sendall(encode(message))
+        metrics.count("remote.requests")
+
+    def put(self, op, *args):
+        if self.grouping is not None: self.grouping.append([op, list(args)])
+        else: self.send({"id":next(self.ids), "op":op, "args":list(args)})
+
+    def request(self, op, *args):
+        request_id = next(self.ids)
+        with self.condition:
+            self.waiting.add(request_id)
+        self.send({"id":request_id, "op":op, "args":list(args)})
+        with self.condition:
+            while not request_id in self.replies and not self.closed: self.condition.wait()
+            self.waiting.discard(request_id)
+            reply = self.replies.pop(request_id, {"error":"store daemon closed"})
+        if "error" in reply: raise RuntimeError(reply["error"])
+        return reply["result"]
+
+    ##réception
+    def run(self):
+        for line in self.reader:
+            message = json.loads(line)
+            if "event" in message:
+                self.notify(message["event"], message["changes"])
+                continue
+            with self.condition:
+                if message["id"] in self.waiting:
+                    self.replies[message["id"]] = message
+                    self.condition.notify_all()
+                    continue
+            self.notify("failed", RuntimeError(message.get("error")))
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if not self.stopping: self.notify("closed")
+
+    #les modifications des autres clients seront envoyées aux listeners
+    def subscribe_changes(self):
+        self.request("subscribe")
+
+    ##lectures
+    def load(self)->dict:
+        return self.request("load")
+
+    def load_folders(self)->dict:
+        return self.request("load_folders")
+
+    def load_folder(self, folder)->dict:
+        return self.request("load_folder", folder)
+
+    def load_history(self)->dict:
+        return self.request("load_history")
+
+    def iter_history(self):
+        return iter(self.request("iter_history"))
+
+    def load_rollups(self)->dict:
+        return self.request("load_rollups")
+
+    def iter_tasks(self):
+        return iter(self.request("iter_tasks"))
+
+    def due_before(self, date):
+        return self.request("due_before", date)
+
+    def priority_at_least(self, priority: int):
+        return self.request("priority_at_least", priority)
+
+    def achieved_in(self, folder):
+        return self.request("achieved_in", folder)
+
+    ##modifications
+    #les appels d'un bloc TaskStore.batch() partent en une seule requête, traitée d'un coup par le démon
+    def group(self, calls):
+        self.grouping = []
+        try:
+            for call in calls: call()
+        finally:
+            calls, self.grouping = self.grouping, None
+        if calls: self.send({"id":next(self.ids), "op":"batch", "calls":calls})
+
+    def set_task(self, folder, name, task: dict):
+        self.put("set_task", folder, name, task)
+
+    def set_tasks(self, tasks):
+        self.put("set_tasks", list(tasks))
+
+    def delete_tasks(self, tasks):
+        self.put("delete_tasks", list(tasks))
+
+    def rename_task(self, folder, name, new_name):
+        self.put("rename_task", folder, name, new_name)
+
+    def move_task(self, folder, name, new_folder):
+        self.put("move_task", folder, name, new_folder)
+
+    def add_folder(self, folder):
+        self.put("add_folder", folder)
+
+    def rename_folder(self, old_name, new_name):
+        self.put("rename_folder", old_name, new_name)
+
+    def add_history(self, tasks, time: datetime = None):
+        self.put("add_history", list(tasks), time.isoformat() if time else None)
+
+    #le démon écrit les fichiers quand un client valide
+    def commit(self, store = None):
+        self.put("commit")
+
+    def wait(self):
+        if not self.closed: self.request("ping")
+
+    def close(self):
+        if not self.closed:
+            self.wait()
+            self.stopping = True
+            self.sock.shutdown(socket.SHUT_RDWR)
+        self.thread.join()
+        self.reader.close()
+        self.sock.close()
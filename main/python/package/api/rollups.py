@@ -0,0 +1,47 @@
+from datetime import date, datetime, timedelta
+
+
+#nombre de tâches archivées par dossier, par jour et par semaine :
+#{période: {dossier: {premier jour de la période (AAAA-MM-JJ): nombre}}}
+#tenu à jour à chaque ajout à l'historique, une statistique ne relit jamais l'historique
+DAY, WEEK = "day", "week"
+PERIODS = (DAY, WEEK)
+
+
+#fonctions
+def period_start(day: date, period)->str:
+    if period == WEEK: day -= timedelta(days=day.weekday())
+    return day.isoformat()
+
+#{(période, dossier, début): nombre} pour des tâches (dossier, nom) archivées à time
+def count_rollups(tasks, time: datetime)->dict:
+    counts = {}
+    for folder, _ in tasks:
+        for period in PERIODS:
+            key = (period, folder, period_start(time.date(), period))
+            counts[key] = counts.get(key, 0)+1
+    return counts
+
+def add_to_rollups(rollups: dict, counts: dict)->dict:
+    for (period, folder, start), n in counts.items():
+        folder_counts = rollups.setdefault(period, {}).setdefault(folder, {})
+        folder_counts[start] = folder_counts.get(start, 0)+n
+    return rollups
+
+#reconstruction à partir de l'historique, les enregistrements sans date (history.json) sont ignorés
+def count_records(records)->dict:
+    counts = {}
+    for record in records:
+        if not record.get("time"): continue
+        for key, n in count_rollups([(record["folder"], record["name"])], datetime.fromisoformat(record["time"])).items():
+            counts[key] = counts.get(key, 0)+n
+    return counts
+
+def build_rollups(records)->dict:
+    return add_to_rollups({period:{} for period in PERIODS}, count_records(records))
+
+#les count dernières périodes jusqu'à today, de la plus récente à la plus ancienne
+def last_periods(period, count: int, today: date = None)->list:
+    step = timedelta(weeks=1) if period == WEEK else timedelta(days=1)
+    first = date.fromisoformat(period_start(today or date.today(), period))
+    return [(first-i*step).isoformat() for i in range(count)]
@@ -0,0 +1,165 @@
+from bisect import bisect_left, insort
+from itertools import count
+import json
+import os
+import unicodedata
+
+from . import tasks as api
+
+
+SEARCH_LIMIT = 50
+TASK, HISTORY = "task", "history"
+
+
+#helpers
+def normalize(text: str)->str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def trigrams(text: str):
+    return {text[i:i+3] for i in range(len(text)-2)}
+
+def index_filepath():
+    return os.path.join(api.TASKS_DIR, "search.idx")
+
+#taille et date des fichiers de données, l'index enregistré n'est valable que s'ils n'ont pas changé
+def data_fingerprint():
+    paths = [api.TASKS_FILEPATH, api.BINARY_FILEPATH, api.JOURNAL_FILEPATH, api.SQLITE_FILEPATH, api.SQLITE_FILEPATH+"-wal",
+             api.HISTORY_FILEPATH, api.HISTORY_LOG_FILEPATH]
+    if os.path.exists(api.HISTORY_ARCHIVE_DIR): paths += sorted(os.path.join(api.HISTORY_ARCHIVE_DIR, name) for name in os.listdir(api.HISTORY_ARCHIVE_DIR))
+    fingerprint = []
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            fingerprint.append([path, stat.st_size, stat.st_mtime_ns])
+    return fingerprint
+
+
+#class
+#index inversé des trigrammes des noms de tâches et de l'historique,
+#les requêtes de moins de 3 caractères utilisent la liste triée des mots
+class SearchIndex:
+    def __init__(self):
+        self.docs = {}
+        self.tasks = {}
+        self.folders = {}
+        self.grams = {}
+        self.words = []
+        self.word_docs = {}
+        self.counter = count()
+
+    def build(self, records, history):
+        for folder, name, _ in records: self.add(TASK, folder, name)
+        for record in history: self.add(HISTORY, record["folder"], record["name"])
+
+    #index enregistré si les fichiers n'ont pas changé, sinon reconstruit depuis le store
+    def load(self, store, cache = True):
+        if not (cache and self.restore(index_filepath())):
+            self.build(store.iter_records(), store.storage.iter_history())
+        store.subscribe(self.store_changed)
+
+    ##mises à jour
+    def add(self, kind, folder, name):
+        if kind == TASK and (folder, name) in self.tasks: return
+        doc = next(self.counter)
+        text = normalize(name)
+        self.docs[doc] = [kind, folder, name, text]
+        if kind == TASK: self.tasks[(folder, name)] = doc
+        self.folders.setdefault(folder, set()).add(doc)
+        for gram in trigrams(text): self.grams.setdefault(gram, set()).add(doc)
+        for word in set(text.split()):
+            if not word in self.word_docs:
+                self.word_docs[word] = set()
+                insort(self.words, word)
+            self.word_docs[word].add(doc)
+
+    def remove_task(self, folder, name):
+        doc = self.tasks.pop((folder, name), None)
+        if doc is None: return
+        _, folder, _, text = self.docs.pop(doc)
+        self.folders[folder].discard(doc)
+        for gram in trigrams(text):
+            self.grams[gram].discard(doc)
+            if not self.grams[gram]: del self.grams[gram]
+        for word in set(text.split()):
+            self.word_docs[word].discard(doc)
+            if not self.word_docs[word]:
+                del self.word_docs[word]
+                del self.words[bisect_left(self.words, word)]
+
+    #une tâche du même nom à l'arrivée a été remplacée dans le store
+    def move_task(self, folder, name, new_folder):
+        doc = self.tasks.pop((folder, name), None)
+        if doc is None: return
+        self.remove_task(new_folder, name)
+        self.tasks[(new_folder, name)] = doc
+        self.docs[doc][1] = new_folder
+        self.folders[folder].discard(doc)
+        self.folders.setdefault(new_folder, set()).add(doc)
+
+    def rename_folder(self, old_name, new_name):
+        docs = self.folders.pop(old_name, set())
+        self.folders.setdefault(new_name, set()).update(docs)
+        for doc in docs:
+            kind, _, name, _ = self.docs[doc]
+            self.docs[doc][1] = new_name
+            if kind == TASK: self.tasks[(new_name, name)] = self.tasks.pop((old_name, name))
+
+    #à brancher sur TaskStore.subscribe
+    def store_changed(self, event, *args):
+        if event == "added": self.add(TASK, args[0].folder, args[0].name)
+        elif event == "removed": self.remove_task(*args)
+        elif event == "renamed":
+            self.remove_task(args[0].folder, args[1])
+            self.add(TASK, args[0].folder, args[0].name)
+        elif event == "moved": self.move_task(args[1], args[0].name, args[0].folder)
+        elif event == "folder_renamed": self.rename_folder(*args)
+        elif event == "history_added":
+            for folder, name in args[0]: self.add(HISTORY, folder, name)
+
+    ##requêtes
+    #(type, dossier, nom) des entrées contenant query, tâches en premier
+    def search(self, query, limit = SEARCH_LIMIT):
+        query = normalize(query).strip()
+        if not query: return []
+        if len(query) < 3:
+            docs = set()
+            for word in self.words[bisect_left(self.words, query):]:
+                if not word.startswith(query): break
+                docs |= self.word_docs[word]
+        else:
+            candidates = sorted((self.grams.get(gram, set()) for gram in trigrams(query)), key=len)
+            docs = set.intersection(*candidates) if candidates else set()
+            docs = {doc for doc in docs if query in self.docs[doc][3]}
+        results = sorted((self.docs[doc][0] != TASK, self.docs[doc][3].find(query), doc) for doc in docs)
+        return [tuple(self.docs[doc][:3]) for _, _, doc in results[:limit]]
+
+    ##sauvegarde
+    #en JSON : le fichier est dans ~/.todo, sa lecture ne doit rien pouvoir exécuter
+    def save(self, filepath):
+        state = {"fingerprint":data_fingerprint(), "docs":[[doc]+entry for doc, entry in self.docs.items()],
+                 "grams":{gram:list(docs) for gram, docs in self.grams.items()}, "word_docs":{word:list(docs) for word, docs in self.word_docs.items()}}
+        tmp_filepath = filepath+".tmp"
+        with open(tmp_filepath, "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"), ensure_ascii=False)
+        os.replace(tmp_filepath, filepath)
+
+    #un fichier illisible, tronqué ou d'un ancien format (pickle) est ignoré : l'index est reconstruit
+    def restore(self, filepath)->bool:
+        if not os.path.exists(filepath): return False
+        try:
+            with open(filepath, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state["fingerprint"] != data_fingerprint(): return False
+            docs = {entry[0]:list(entry[1:]) for entry in state["docs"]}
+            grams = {gram:set(docs) for gram, docs in state["grams"].items()}
+            word_docs = {word:set(docs) for word, docs in state["word_docs"].items()}
+            tasks = {(folder, name):doc for doc, (kind, folder, name, _) in docs.items() if kind == TASK}
+            folders = {}
+            for doc, (_, folder, _, _) in docs.items(): folders.setdefault(folder, set()).add(doc)
+            counter = count(max(docs, default=-1)+1)
+        except Exception:
+            return False
+        self.docs, self.grams, self.words, self.word_docs = docs, grams, sorted(word_docs), word_docs
+        self.tasks, self.folders, self.counter = tasks, folders, counter
+        return True
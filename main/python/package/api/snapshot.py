@@ -0,0 +1,155 @@
+import hashlib
+import mmap
+import os
+import struct
+
+from . import metrics
+from .fingerprint import file_stat
+from .journal import replay
+from .recurrence import UNITS, format_rule, parse_rule, rule_anchor
+from .storage import date_to_ordinal, ordinal_to_date
+
+
+#format binaire des snapshots (tasks.bin), en petit boutiste :
+#  en-tête    magic, version, réservé, nombre de dossiers et de tâches
+#  dossiers   (position et longueur du nom, première tâche, nombre de tâches,
+#              position et longueur du bloc des noms de tâches) dans le texte
+#  tâches     enregistrements de taille fixe (drapeaux, unité de répétition, priorité,
+#              date ordinale, intervalle de répétition, jour visé d'une répétition mensuelle)
+#  texte      noms des dossiers, puis noms des tâches de chaque dossier séparés par SEPARATOR
+#un bloc de noms se décode en une fois, sans passer par une table de chaînes par tâche
+#les versions 1, sans répétition, et 2, sans jour visé, restent lisibles
+MAGIC = b"PTSK"
+VERSION = 3
+SEPARATOR = "\x00"
+HEADER = struct.Struct("<4sHHII")
+FOLDER = struct.Struct("<IIIIQQ")
+RECORDS = {1:struct.Struct("<Bxhi"), 2:struct.Struct("<BBhiH"), 3:struct.Struct("<BBhiHB")}
+RECORD = RECORDS[VERSION]
+ACHIEVED, NO_PRIORITY = 1, 2
+REPEAT_UNITS = (None,)+UNITS #unité de répétition : indice dans REPEAT_UNITS
+
+
+#fonctions
+def is_binary(filepath)->bool:
+    try:
+        with open(filepath, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def encode_snapshot(tasks: dict)->bytes:
+    text = bytearray()
+    folders = bytearray()
+    records = bytearray()
+    count = 0
+    for folder, folder_tasks in tasks.items():
+        if any(SEPARATOR in name for name in folder_tasks): raise ValueError("task name contains "+repr(SEPARATOR))
+        name = folder.encode("utf-8")
+        names = SEPARATOR.join(folder_tasks).encode("utf-8")
+        folders += FOLDER.pack(len(text), len(name), count, len(folder_tasks), len(text)+len(name), len(names))
+        text += name+names
+        for task in folder_tasks.values():
+            priority = task["priority"]
+            flags = (ACHIEVED if task["achieved"] else 0) | (NO_PRIORITY if priority is None else 0)
+            every, unit = parse_rule(task["repeat"]) if task.get("repeat") else (0, None)
+            anchor = rule_anchor(task["repeat"]) if task.get("repeat") else None
+            records += RECORD.pack(flags, REPEAT_UNITS.index(unit), priority or 0, date_to_ordinal(task["date"]), every, anchor or 0)
+        count += len(folder_tasks)
+    return HEADER.pack(MAGIC, VERSION, 0, len(tasks), count)+folders+records+text
+
+def write_snapshot(tasks: dict, filepath):
+    data = encode_snapshot(tasks)
+    tmp_filepath = filepath+".tmp"
+    with open(tmp_filepath, "wb") as f:
+        f.write(data)
+        metrics.count("io.writes")
+        metrics.count("io.bytes_written", len(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filepath, filepath)
+
+def record_to_dict(record)->dict:
+    if len(record) == 3: record = record[:1]+(0,)+record[1:]+(0,)
+    flags, unit, priority, date, every, anchor = record if len(record) == 6 else record+(0,)
+    task = {"achieved":bool(flags & ACHIEVED), "priority":None if flags & NO_PRIORITY else priority, "date":ordinal_to_date(date)}
+    if unit: task["repeat"] = format_rule(every, REPEAT_UNITS[unit], anchor)
+    return task
+
+#dossiers touchés par des enregistrements du journal
+def touched_folders(records)->set:
+    folders = set()
+    for record in records:
+        folders.add(record["folder"])
+        if record["op"] in ("move", "rename_folder"): folders.add(record["new"])
+    return folders
+
+
+#class
+#snapshot projeté en mémoire : l'ouverture ne lit que l'en-tête et la table des dossiers,
+#les tâches d'un dossier ne sont décodées qu'à l'appel de folder()
+#les tâches de mêmes valeurs partagent le même dictionnaire, qui ne doit pas être modifié
+#(sous Windows le fichier est lu en entier, un fichier projeté ne pourrait pas être remplacé)
+class BinarySnapshot:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.stat = file_stat(filepath)
+        with open(filepath, "rb") as f:
+            if os.name == "nt": self.data = f.read()
+            else: self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        metrics.count("io.reads")
+        magic, version, _, folder_count, record_count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or not version in RECORDS: raise ValueError("unknown snapshot format")
+        self.record = RECORDS[version]
+        self.records_start = HEADER.size+folder_count*FOLDER.size
+        self.text_start = self.records_start+record_count*self.record.size
+        self.folders = {}
+        for i in range(folder_count):
+            name, length, first, count, names, names_length = FOLDER.unpack_from(self.data, HEADER.size+i*FOLDER.size)
+            self.folders[self.text(name, length)] = (first, count, names, names_length)
+
+    def __contains__(self, folder):
+        return folder in self.folders
+
+    def text(self, position, length)->str:
+        start = self.text_start+position
+        return self.data[start:start+length].decode("utf-8")
+
+    def folder(self, folder)->dict:
+        first, count, names, names_length = self.folders[folder]
+        if not count: return {}
+        start = self.records_start+first*self.record.size
+        metrics.count("io.bytes_read", count*self.record.size+names_length)
+        values = {}
+        records = [values.get(record) or values.setdefault(record, record_to_dict(record)) for record in self.record.iter_unpack(self.data[start:start+count*self.record.size])]
+        return dict(zip(self.text(names, names_length).split(SEPARATOR), records))
+
+    #le fichier a été remplacé depuis l'ouverture (compaction, autre processus)
+    def replaced(self)->bool:
+        return file_stat(self.filepath) != self.stat
+
+    #empreinte des enregistrements et des noms d'un dossier, sans les décoder : deux snapshots
+    #donnent la même si le dossier n'a pas changé
+    def digest(self, folder)->str:
+        first, count, names, names_length = self.folders[folder]
+        start = self.records_start+first*self.record.size
+        digest = hashlib.sha1(self.data[start:start+count*self.record.size])
+        digest.update(self.data[self.text_start+names:self.text_start+names+names_length])
+        return digest.hexdigest()
+
+    def load(self)->dict:
+        return {folder:self.folder(folder) for folder in self.folders}
+
+    #{dossier: None} pour les dossiers que records ne touche pas, à décoder plus tard
+    def load_lazy(self, records)->dict:
+        touched = touched_folders(records)
+        changed = replay({folder:self.folder(folder) for folder in touched if folder in self.folders}, records)
+        tasks = {}
+        for folder in self.folders:
+            if not folder in touched: tasks[folder] = None
+            elif folder in changed: tasks[folder] = changed[folder]
+        for folder in changed: tasks.setdefault(folder, changed[folder])
+        return tasks
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap): self.data.close()
@@ -0,0 +1,91 @@
+from bisect import bisect_left, bisect_right
+from itertools import count
+
+
+MANUAL, PRIORITY, DATE, STATUS, NAME = "manual", "priority", "date", "status", "name"
+SORT_MODES = (MANUAL, PRIORITY, DATE, STATUS, NAME)
+NO_DATE = 1 << 30 #les tâches sans date passent après toutes les autres
+URGENT = 1 #priorité "Urgent" de TaskDetails
+
+
+#fonctions
+#clé de tri d'une tâche, (dossier, nom) en fin de clé rend chaque clé unique
+def sort_key(task, mode):
+    date = task.date or NO_DATE
+    priority = -(task.priority or 0)
+    if mode == PRIORITY: key = (priority, date)
+    elif mode == DATE: key = (date, priority)
+    elif mode == STATUS: key = (task.achieved, priority, date)
+    else: key = ()
+    return key+(task.name.lower(), task.folder, task.name)
+
+def is_due_or_urgent(task, today: int)->bool:
+    return not task.achieved and (0 < task.date <= today or (task.priority or 0) >= URGENT)
+
+
+#class
+#lignes (dossier, nom) triées par clé, chaque modification déplace une seule ligne
+#en mode manuel la clé est le rang d'insertion et ne change plus ensuite
+class SortedRows:
+    def __init__(self, mode = MANUAL):
+        self.mode = mode
+        self.rows = []
+        self.keys = []
+        self.row_keys = {}
+        self.counter = count()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, row):
+        return row in self.row_keys
+
+    def key(self, task, previous = None):
+        if self.mode == MANUAL: return previous if previous is not None else (next(self.counter),)
+        return sort_key(task, self.mode)
+
+    def build(self, tasks):
+        pairs = sorted((self.key(task), (task.folder, task.name)) for task in tasks)
+        self.keys = [key for key, _ in pairs]
+        self.rows = [row for _, row in pairs]
+        self.row_keys = dict(zip(self.rows, self.keys))
+
+    def index(self, row)->int:
+        return bisect_left(self.keys, self.row_keys[row])
+
+    #position qu'aurait la tâche une fois insérée
+    def position(self, task)->int:
+        return bisect_right(self.keys, self.key(task))
+
+    def insert(self, task)->int:
+        key = self.key(task)
+        i = bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.rows.insert(i, (task.folder, task.name))
+        self.row_keys[(task.folder, task.name)] = key
+        return i
+
+    def pop(self, row)->int:
+        i = self.index(row)
+        del self.keys[i]
+        del self.rows[i]
+        del self.row_keys[row]
+        return i
+
+    #nouvelle position de row une fois sa clé recalculée, sans modifier la liste
+    def target(self, row, task)->int:
+        i = self.index(row)
+        key = self.key(task, self.row_keys[row])
+        j = bisect_right(self.keys, key)
+        return j-1 if j > i else j
+
+    #déplace row de sa position actuelle vers target(), en gardant sa clé en mode manuel
+    def reposition(self, row, task):
+        previous = self.row_keys[row]
+        i = self.pop(row)
+        key = self.key(task, previous)
+        j = bisect_right(self.keys, key)
+        self.keys.insert(j, key)
+        self.rows.insert(j, (task.folder, task.name))
+        self.row_keys[(task.folder, task.name)] = key
+        return i, j
@@ -0,0 +1,295 @@
+from datetime import date as Date, datetime
+from functools import lru_cache
+import sqlite3
+
+from . import metrics
+from .rollups import build_rollups, count_records, count_rollups
+
+
+#helpers
+#les dates sont des ordinaux (date.toordinal()), 0 pour une tâche sans date
+def date_to_ordinal(date)->int:
+    if isinstance(date, int): return date
+    if isinstance(date, Date): return date.toordinal()
+    return str_to_ordinal(date)
+
+@lru_cache(maxsize=4096)#beaucoup de tâches partagent la même date
+def str_to_ordinal(date)->int:
+    try:
+        return Date(*[int(d) for d in date.split("-")]).toordinal()
+    except (AttributeError, ValueError, TypeError):#date vide ou invalide ("0-0-0")
+        return 0
+
+@lru_cache(maxsize=4096)
+def ordinal_to_date(ordinal: int)->str:
+    if ordinal <= 0: return "0-0-0"
+    date = Date.fromordinal(ordinal)
+    return str(date.year)+"-"+str(date.month)+"-"+str(date.day)
+
+
+#class
+#interface commune des backends de stockage, les tâches y sont manipulées sous
+#forme de dictionnaires {"achieved", "priority", "date"} comme dans tasks.json
+class Storage:
+    def load(self)->dict:
+        raise NotImplementedError
+
+    def load_history(self)->dict:
+        raise NotImplementedError
+
+    #{dossier: tâches}, ou {dossier: None} si le backend sait lire un dossier seul
+    def load_folders(self)->dict:
+        return self.load()
+
+    def load_folder(self, folder)->dict:
+        return self.load().get(folder, {})
+
+    def iter_history(self):
+        for folder, names in self.load_history().items():
+            for name in names: yield {"folder":folder, "name":name}
+
+    #voir rollups.py, sans table dédiée on relit tout l'historique
+    def load_rollups(self)->dict:
+        return build_rollups(self.iter_history())
+
+    ##modifications
+    def set_task(self, folder, name, task: dict): pass
+
+    def set_tasks(self, tasks):
+        for folder, name, task in tasks: self.set_task(folder, name, task)
+    def delete_tasks(self, tasks): pass
+    def rename_task(self, folder, name, new_name): pass
+    def move_task(self, folder, name, new_folder): pass
+    def add_folder(self, folder): pass
+    def rename_folder(self, old_name, new_name): pass
+    def add_history(self, tasks, time: datetime = None): pass
+
+    #appelle chaque fonction de calls, un backend peut en profiter pour regrouper ses écritures
+    def group(self, calls):
+        for call in calls: call()
+
+    def commit(self, store): pass
+    def close(self): pass
+    def wait(self): pass#écritures en cours terminées, voir ThreadedStorage
+
+    ##modifications faites par d'autres processus
+    #état complet {dossier: tâches} si les données ont changé depuis la dernière lecture, None sinon
+    def external_changes(self):
+        return None
+
+    def watched_files(self)->list:
+        return []
+
+    #valeur JSON qui change à chaque modification enregistrée, par ce processus ou un autre,
+    #None si le backend ne sait pas la donner (voir SyncClient.track)
+    def revision(self):
+        return None
+
+    ##requêtes, sans index on parcourt toutes les tâches
+    def iter_tasks(self):
+        for folder, tasks in self.load().items():
+            for name, task in tasks.items(): yield folder, name, task
+
+    def due_before(self, date):
+        limit = date_to_ordinal(date)
+        return [(folder, name, task) for folder, name, task in self.iter_tasks() if 0 < date_to_ordinal(task["date"]) < limit]
+
+    def priority_at_least(self, priority: int):
+        return [(folder, name, task) for folder, name, task in self.iter_tasks() if (task["priority"] or 0) >= priority]
+
+    def achieved_in(self, folder):
+        return [(folder, name, task) for name, task in self.load().get(folder, {}).items() if task["achieved"]]
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (name TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS tasks (
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    achieved INTEGER NOT NULL DEFAULT 0,
+    priority INTEGER,
+    date INTEGER NOT NULL DEFAULT 0,
+    repeat TEXT,
+    PRIMARY KEY (folder, name)
+);
+CREATE INDEX IF NOT EXISTS tasks_folder_achieved ON tasks (folder, achieved);
+CREATE INDEX IF NOT EXISTS tasks_date ON tasks (date);
+CREATE INDEX IF NOT EXISTS tasks_priority ON tasks (priority);
+CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY, folder TEXT NOT NULL, name TEXT NOT NULL, time TEXT);
+CREATE INDEX IF NOT EXISTS history_folder ON history (folder);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    start TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (period, folder, start)
+);
+"""
+BUMP_REVISION = "INSERT INTO meta (key, value) VALUES ('revision', 1) ON CONFLICT (key) DO UPDATE SET value = value+1"
+UPSERT_TASK = ("INSERT INTO tasks (folder, name, achieved, priority, date, repeat) VALUES (?, ?, ?, ?, ?, ?) "
+               "ON CONFLICT (folder, name) DO UPDATE SET achieved=excluded.achieved, priority=excluded.priority, date=excluded.date, repeat=excluded.repeat")
+
+#chaque modification est une seule requête, validée par commit()
+class SqliteStorage(Storage):
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.connection = sqlite3.connect(filepath, check_same_thread=False)#voir writer.py
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        if not "time" in self.columns("history"): self.connection.execute("ALTER TABLE history ADD COLUMN time TEXT")#base antérieure aux statistiques
+        if not "repeat" in self.columns("tasks"): self.connection.execute("ALTER TABLE tasks ADD COLUMN repeat TEXT")#et aux répétitions
+        self.data_version = self.get_data_version()
+        self.changes = self.connection.total_changes
+
+    def columns(self, table)->list:
+        return [column[1] for column in self.connection.execute("PRAGMA table_info("+table+")")]
+
+    def load(self)->dict:
+        metrics.count("io.reads")
+        tasks = {folder:{} for folder, in self.connection.execute("SELECT name FROM folders ORDER BY rowid")}
+        for row in self.connection.execute("SELECT folder, name, achieved, priority, date, repeat FROM tasks ORDER BY rowid"):
+            folder, name, task = self.row_to_task(row)
+            tasks.setdefault(folder, {})[name] = task
+        return tasks
+
+    def load_folders(self)->dict:
+        folders = {folder:None for folder, in self.connection.execute("SELECT name FROM folders ORDER BY rowid")}
+        for folder, in self.connection.execute("SELECT DISTINCT folder FROM tasks"): folders.setdefault(folder, None)
+        return folders
+
+    def load_folder(self, folder)->dict:
+        metrics.count("io.reads")
+        rows = self.connection.execute("SELECT folder, name, achieved, priority, date, repeat FROM tasks WHERE folder=? ORDER BY rowid", (folder,))
+        return {name:task for _, name, task in map(self.row_to_task, rows)}
+
+    def load_history(self)->dict:
+        history = {}
+        for folder, name in self.connection.execute("SELECT folder, name FROM history ORDER BY id"):
+            history.setdefault(folder, []).append(name)
+        return history
+
+    def iter_history(self):
+        for folder, name, time in self.connection.execute("SELECT folder, name, time FROM history ORDER BY id"):
+            yield {"folder":folder, "name":name, "time":time} if time else {"folder":folder, "name":name}
+
+    def load_rollups(self)->dict:
+        rollups = {}
+        for period, folder, start, count in self.connection.execute("SELECT period, folder, start, count FROM rollups"):
+            rollups.setdefault(period, {}).setdefault(folder, {})[start] = count
+        return rollups
+
+    def row_to_task(self, row):
+        folder, name, achieved, priority, date, repeat = row
+        if repeat: return folder, name, {"achieved":bool(achieved), "priority":priority, "date":ordinal_to_date(date), "repeat":repeat}
+        return folder, name, {"achieved":bool(achieved), "priority":priority, "date":ordinal_to_date(date)}
+
+    def task_row(self, folder, name, task: dict)->tuple:
+        return folder, name, int(task["achieved"]), task["priority"], date_to_ordinal(task["date"]), task.get("repeat")
+
+    ##modifications
+    def set_task(self, folder, name, task: dict):
+        self.add_folder(folder)
+        self.connection.execute(UPSERT_TASK, self.task_row(folder, name, task))
+
+    def set_tasks(self, tasks):
+        tasks = list(tasks)
+        self.connection.executemany("INSERT OR IGNORE INTO folders (name) VALUES (?)", {(folder,) for folder, _, _ in tasks})
+        self.connection.executemany(UPSERT_TASK, [self.task_row(folder, name, task) for folder, name, task in tasks])
+
+    def delete_tasks(self, tasks):
+        self.connection.executemany("DELETE FROM tasks WHERE folder=? AND name=?", [tuple(task) for task in tasks])
+
+    #comme pour tasks.json, une tâche du même nom à l'arrivée est remplacée
+    def rename_task(self, folder, name, new_name):
+        if new_name == name: return#la tâche se supprimerait elle-même
+        self.connection.execute("DELETE FROM tasks WHERE folder=? AND name=?", (folder, new_name))
+        self.connection.execute("UPDATE tasks SET name=? WHERE folder=? AND name=?", (new_name, folder, name))
+
+    def move_task(self, folder, name, new_folder):
+        if new_folder == folder: return
+        self.add_folder(new_folder)
+        self.connection.execute("DELETE FROM tasks WHERE folder=? AND name=?", (new_folder, name))
+        self.connection.execute("UPDATE tasks SET folder=? WHERE folder=? AND name=?", (new_folder, folder, name))
+
+    def add_folder(self, folder):
+        self.connection.execute("INSERT OR IGNORE INTO folders (name) VALUES (?)", (folder,))
+
+    def rename_folder(self, old_name, new_name):
+        self.connection.execute("UPDATE folders SET name=? WHERE name=?", (new_name, old_name))
+        self.connection.execute("UPDATE tasks SET folder=? WHERE folder=?", (new_name, old_name))
+
+    def add_history(self, tasks, time: datetime = None):
+        tasks = [tuple(task) for task in tasks]
+        time = time or datetime.now()
+        self.connection.executemany("INSERT INTO history (folder, name, time) VALUES (?, ?, ?)", [task+(time.isoformat(timespec="seconds"),) for task in tasks])
+        self.add_rollups(count_rollups(tasks, time))
+
+    def add_rollups(self, counts: dict):
+        self.connection.executemany(
+            "INSERT INTO rollups (period, folder, start, count) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (period, folder, start) DO UPDATE SET count = count+excluded.count",
+            [key+(n,) for key, n in counts.items()])
+
+    #sans valider : l'import_data() qui suit remplace le contenu dans la même transaction (voir backup.py)
+    def clear(self, history = True):
+        self.connection.execute("DELETE FROM tasks")
+        self.connection.execute("DELETE FROM folders")
+        if history:
+            self.connection.execute("DELETE FROM history")
+            self.connection.execute("DELETE FROM rollups")
+
+    #history : enregistrements {"folder", "name"} avec "time" s'il est connu
+    def import_data(self, tasks: dict, history):
+        for folder in tasks:
+            self.add_folder(folder)
+            for name, task in tasks[folder].items(): self.set_task(folder, name, task)
+        history = list(history)
+        self.connection.executemany("INSERT INTO history (folder, name, time) VALUES (?, ?, ?)", [(record["folder"], record["name"], record.get("time")) for record in history])
+        self.add_rollups(count_records(history))
+        self.commit()
+
+    #chaque validation qui modifie la base incrémente la révision
+    def commit(self, store=None):
+        metrics.count("io.writes")
+        if self.connection.total_changes != self.changes: self.connection.execute(BUMP_REVISION)
+        self.connection.commit()
+        self.changes = self.connection.total_changes
+
+    def revision(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+        return row[0] if row else 0
+
+    #data_version ne change qu'après un commit d'une autre connexion
+    def get_data_version(self)->int:
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def external_changes(self):
+        version = self.get_data_version()
+        if version == self.data_version: return None
+        self.data_version = version
+        return self.load()
+
+    def watched_files(self)->list:
+        return [self.filepath, self.filepath+"-wal"]
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    ##requêtes indexées
+    def iter_tasks(self):
+        for row in self.connection.execute("SELECT folder, name, achieved, priority, date, repeat FROM tasks ORDER BY rowid"):
+            yield self.row_to_task(row)
+
+    def due_before(self, date):
+        rows = self.connection.execute("SELECT folder, name, achieved, priority, date, repeat FROM tasks WHERE date > 0 AND date < ? ORDER BY date", (date_to_ordinal(date),))
+        return [self.row_to_task(row) for row in rows]
+
+    def priority_at_least(self, priority: int):
+        rows = self.connection.execute("SELECT folder, name, achieved, priority, date, repeat FROM tasks WHERE priority >= ? ORDER BY priority DESC", (priority,))
+        return [self.row_to_task(row) for row in rows]
+
+    def achieved_in(self, folder):
+        rows = self.connection.execute("SELECT folder, name, achieved, priority, date, repeat FROM tasks WHERE folder=? AND achieved=1", (folder,))
+        return [self.row_to_task(row) for row in rows]
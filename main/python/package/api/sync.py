@@ -0,0 +1,386 @@
+from contextlib import contextmanager
+import http.client
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+import uuid
+import zlib
+
+from . import metrics
+from . import tasks as api
+
+
+#synchronisation par différences avec un serveur de tâches (voir sync_server.py)
+#chaque tâche a une version (horloge en ms, appareil) gardée dans ~/.todo/sync.db, à côté des
+#données : le format des tâches ne change pas. Une modification locale donne une nouvelle version
+#à la tâche et la met dans la boîte d'envoi, une suppression est une version sans tâche.
+#La plus grande version gagne, chez le client comme chez le serveur, l'appareil départageant deux
+#versions de même heure : tous les appareils convergent vers le même état.
+#Le serveur numérote les versions qu'il reçoit, le client ne demande que celles postérieures au
+#dernier numéro vu (cursor) : une synchronisation coûte le nombre de modifications, pas la taille
+#des données. Un dossier est un enregistrement de nom FOLDER_MARKER, pour les dossiers vides
+FOLDER_MARKER = ""
+PUSH_BATCH = 500 #versions par requête d'envoi
+PULL_LIMIT = 1000 #versions par page de réception
+TIMEOUT = 10 #s
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS versions (
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    device TEXT NOT NULL,
+    task TEXT,
+    PRIMARY KEY (folder, name)
+);
+CREATE TABLE IF NOT EXISTS outbox (folder TEXT NOT NULL, name TEXT NOT NULL, PRIMARY KEY (folder, name));
+"""
+
+
+#fonctions
+##helpers
+#forme canonique d'une tâche, comparée telle quelle pour repérer les modifications
+def encode_task(task: dict)->str:
+    if task is None: return None
+    task = {key:value for key, value in task.items() if key != "repeat" or value}
+    return json.dumps(task, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def compress(payload)->bytes:
+    return zlib.compress(json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+
+def decompress(data: bytes, encoding = "deflate"):
+    if encoding == "deflate": data = zlib.decompress(data)
+    return json.loads(data.decode("utf-8")) if data else None
+
+def record(folder, name, task: dict, stamp)->dict:
+    return {"folder":folder, "name":name, "task":task, "stamp":list(stamp)}
+
+#versions des modifications décrites par des événements de TaskStore, dans l'ordre
+def event_changes(store, event, args)->list:
+    if event in ("added", "changed"): return [(args[0].folder, args[0].name, args[0].toDict())]
+    if event == "removed": return [(args[0], args[1], None)]
+    if event == "renamed": return [(args[0].folder, args[1], None), (args[0].folder, args[0].name, args[0].toDict())]
+    if event == "moved": return [(args[1], args[0].name, None), (args[0].folder, args[0].name, args[0].toDict())]
+    if event == "folder_added": return [(args[0], FOLDER_MARKER, {})]
+    if event == "folder_removed": return [(args[0], FOLDER_MARKER, None)]
+    if event == "folder_renamed":
+        old_name, new_name = args
+        tasks = store.folder(new_name)
+        changes = [(old_name, name, None) for name in tasks]+[(old_name, FOLDER_MARKER, None), (new_name, FOLDER_MARKER, {})]
+        return changes+[(new_name, name, task.toDict()) for name, task in tasks.items()]
+    return []#"history_added" : l'historique reste propre à chaque appareil
+
+
+#class
+class SyncError(Exception):
+    pass
+
+
+#versions, boîte d'envoi et curseur de réception, dans une base sqlite partagée entre le thread
+#de l'interface (modifications locales, application des réceptions) et celui des échanges
+class SyncState:
+    def __init__(self, filepath = None):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filepath or api.SYNC_FILEPATH, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.device = self.get("device")
+        if self.device is None:
+            self.device = uuid.uuid4().hex
+            self.set("device", self.device)
+        self.clock = int(self.get("clock") or 0)
+
+    @contextmanager
+    def transaction(self):
+        with self.lock, self.connection:
+            yield self.connection
+
+    #toutes les lectures prennent aussi le verrou, la connexion sert aux deux threads
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        with self.transaction() as connection:
+            connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def cursor(self)->int:
+        return int(self.get("cursor") or 0)
+
+    #horloge hybride : jamais en arrière, et toujours après les versions reçues, un appareil
+    #en retard sur l'heure ne perd donc pas les modifications qu'il fait après une réception
+    def tick(self)->int:
+        self.clock = max(int(time.time()*1000), self.clock+1)
+        return self.clock
+
+    ##modifications locales
+    #changes : [(dossier, nom, dictionnaire ou None)], les modifications d'un même lot partagent
+    #une version, la dernière modification d'une tâche dans le lot l'emporte
+    def record(self, changes):
+        if not changes: return
+        with self.transaction() as connection:
+            stamp = self.tick()
+            rows = [(folder, name, stamp, self.device, encode_task(task)) for folder, name, task in changes]
+            connection.executemany("INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?)", rows)
+            connection.executemany("INSERT OR IGNORE INTO outbox VALUES (?, ?)", [row[:2] for row in rows])
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('clock', ?)", (str(self.clock),))
+
+    #modifications faites pendant que rien ne les suivait (autre processus, première synchronisation) :
+    #les tâches dont la dernière version connue diffère des données, et les tâches disparues
+    @metrics.timed("sync.reconcile")
+    def reconcile(self, records)->int:
+        with self.lock:
+            known = {(folder, name):task for folder, name, task in self.connection.execute("SELECT folder, name, task FROM versions")}
+        changes = []
+        for folder, name, task in records:
+            encoded = encode_task(task)
+            if known.pop((folder, name), None) != encoded: changes.append((folder, name, task))
+        changes += [(folder, name, None) for (folder, name), task in known.items() if task is not None]
+        self.record(changes)
+        return len(changes)
+
+    #un serveur redémarré (autre epoch) a perdu ses versions et ses numéros : tout lui renvoyer,
+    #tout relire depuis le début. Vrai si c'est le cas
+    def check_epoch(self, epoch)->bool:
+        if epoch == self.get("epoch"): return False
+        with self.transaction() as connection:
+            connection.execute("INSERT OR IGNORE INTO outbox SELECT folder, name FROM versions")
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('cursor', '0')")
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('epoch', ?)", (epoch,))
+        metrics.count("sync.resets")
+        return True
+
+    def pending(self)->int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def outbox(self, limit = PUSH_BATCH)->list:
+        with self.lock:
+            rows = self.connection.execute("SELECT v.folder, v.name, v.task, v.time, v.device FROM outbox o JOIN versions v ON v.folder = o.folder AND v.name = o.name "
+                                           "ORDER BY v.time LIMIT ?", (limit,)).fetchall()
+        return [record(folder, name, json.loads(task) if task is not None else None, (stamp, device)) for folder, name, task, stamp, device in rows]
+
+    #une version envoyée sort de la boîte si la tâche n'a pas été modifiée depuis
+    def acknowledge(self, records):
+        with self.transaction() as connection:
+            connection.executemany("DELETE FROM outbox WHERE folder = ? AND name = ? AND EXISTS "
+                                   "(SELECT 1 FROM versions v WHERE v.folder = outbox.folder AND v.name = outbox.name AND v.time = ? AND v.device = ?)",
+                                   [(r["folder"], r["name"], r["stamp"][0], r["stamp"][1]) for r in records])
+
+    ##réception
+    def versions(self, keys)->dict:
+        with self.lock:
+            return {key:(row[0], row[1]) for key in keys for row in self.connection.execute("SELECT time, device FROM versions WHERE folder = ? AND name = ?", key)}
+
+    #versions reçues plus récentes que les locales, qui remplacent aussi les modifications en attente
+    def accept(self, records, cursor: int):
+        with self.transaction() as connection:
+            connection.executemany("INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?)",
+                                   [(r["folder"], r["name"], r["stamp"][0], r["stamp"][1], encode_task(r["task"])) for r in records])
+            connection.executemany("DELETE FROM outbox WHERE folder = ? AND name = ?", [(r["folder"], r["name"]) for r in records])
+            self.clock = max([self.clock]+[r["stamp"][0] for r in records])
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('clock', ?)", (str(self.clock),))
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('cursor', ?)", (str(cursor),))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+#connexion HTTP gardée ouverte entre les requêtes (keep-alive), rouverte une fois si le serveur l'a fermée
+#les corps des requêtes et des réponses sont du JSON compressé (Content-Encoding: deflate)
+class Connection:
+    def __init__(self, url, timeout = TIMEOUT):
+        parts = urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.connection = None
+
+    def open(self):
+        if self.connection is None:
+            connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self.connection = connection_class(self.host, self.port, timeout=self.timeout)
+            metrics.count("sync.connections")
+        return self.connection
+
+    #les deux requêtes du protocole peuvent être répétées sans effet de bord
+    def request(self, method, path, payload = None, query = None):
+        url = self.path+path+("?"+urlencode(query) if query else "")
+        body = compress(payload) if payload is not None else None
+        headers = {"Accept-Encoding":"deflate", "Content-Type":"application/json"}
+        if body is not None: headers["Content-Encoding"] = "deflate"
+        for attempt in range(2):
+            try:
+                connection = self.open()
+                connection.request(method, url, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                self.close()
+                if attempt: raise
+        metrics.count("sync.requests")
+        metrics.count("sync.bytes_sent", len(body or b""))
+        metrics.count("sync.bytes_received", len(data))
+        if response.status != 200: raise SyncError("%s %s : %d %s" % (method, path, response.status, response.reason))
+        return decompress(data, response.getheader("Content-Encoding"))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+#synchronise un TaskStore avec le serveur url
+#exchange() ne fait que du réseau et de la base sqlite, il peut tourner dans un thread ;
+#apply() modifie le TaskStore et doit être appelé là où on le modifie (voir syncing.py)
+class SyncClient:
+    def __init__(self, store, url, state: SyncState = None):
+        self.store = store
+        self.state = state if state is not None else SyncState()
+        self.connection = Connection(url)
+        self.applying = False
+        self.tracking = False
+        self.remembered = True #une révision est peut-être notée dans sync.db
+
+    #suit les modifications du store, après avoir repris celles faites sans suivi. La révision du
+    #backend (Storage.revision) est notée à la fermeture : si elle n'a pas changé depuis, personne
+    #n'a modifié les données et la comparaison complète, qui lit tout, est évitée
+    def track(self)->int:
+        changes = 0
+        revision = self.revision()
+        if revision is None or revision != self.state.get("revision"):
+            changes = self.state.reconcile(self.iter_records())
+            if revision is not None and not self.store.dirty: self.remember(revision)
+        if not self.tracking:
+            self.store.subscribe(self.store_changed, batched=True)
+            self.tracking = True
+        return changes
+
+    def untrack(self):
+        self.store.unsubscribe(self.store_changed)
+        self.tracking = False
+
+    def revision(self):
+        revision = self.store.storage.revision()
+        return json.dumps(revision) if revision is not None else None
+
+    def remember(self, revision):
+        self.state.set("revision", revision)
+        self.remembered = True
+
+    #une modification pas encore écrite sur le disque rendrait la révision notée fausse si
+    #l'application s'arrêtait brutalement : elle est oubliée jusqu'à la fermeture
+    def forget_revision(self):
+        if self.remembered:
+            self.state.set("revision", "")
+            self.remembered = False
+
+    def iter_records(self):
+        for folder in list(self.store.tasks): yield folder, FOLDER_MARKER, {}
+        yield from self.store.iter_records()
+
+    def store_changed(self, event, *args):
+        if self.applying: return
+        events = args[0] if event == "batch" else [(event, args)]
+        changes = [change for event, args in events for change in event_changes(self.store, event, args)]
+        if changes: self.forget_revision()
+        self.state.record(changes)
+
+    ##échanges
+    @metrics.timed("sync.push")
+    def push(self)->int:
+        sent = 0
+        while True:
+            records = self.state.outbox(PUSH_BATCH)
+            if not records: return sent
+            reply = self.connection.request("POST", "/push", {"device":self.state.device, "records":records})
+            self.state.check_epoch(reply["epoch"])
+            self.state.acknowledge(records)
+            metrics.count("sync.pushed", len(records))
+            sent += len(records)
+            if len(records) < PUSH_BATCH: return sent
+
+    #versions des autres appareils depuis le curseur : (versions, nouveau curseur)
+    @metrics.timed("sync.pull")
+    def pull(self)->tuple:
+        cursor = self.state.cursor
+        records = []
+        while True:
+            page = self.connection.request("GET", "/changes", query={"since":cursor, "device":self.state.device, "limit":PULL_LIMIT})
+            if self.state.check_epoch(page["epoch"]) and cursor:
+                cursor, records = 0, []
+                continue
+            records += page["records"]
+            cursor = page["cursor"]
+            if not page["more"]: break
+        metrics.count("sync.pulled", len(records))
+        return records, cursor
+
+    #après un redémarrage du serveur repéré par pull(), la boîte d'envoi est pleine : elle part tout de suite
+    def exchange(self)->tuple:
+        self.push()
+        result = self.pull()
+        if self.state.pending(): self.push()
+        return result
+
+    ##application
+    #la version la plus récente de chaque tâche, si elle l'est plus que la version locale
+    @metrics.timed("sync.apply")
+    def apply(self, records, cursor: int)->int:
+        latest = {}
+        for r in records:
+            key = (r["folder"], r["name"])
+            if not key in latest or tuple(r["stamp"]) > tuple(latest[key]["stamp"]): latest[key] = r
+        local = self.state.versions(latest)
+        accepted = [r for key, r in latest.items() if not key in local or tuple(r["stamp"]) > local[key]]
+        if accepted: self.forget_revision()
+        self.applying = True
+        try:
+            with self.store.batch():
+                for r in sorted(accepted, key=lambda r: r["name"] != FOLDER_MARKER):#dossiers d'abord
+                    self.apply_record(r["folder"], r["name"], r["task"])
+        finally:
+            self.applying = False
+        self.state.accept(accepted, cursor)
+        metrics.count("sync.applied", len(accepted))
+        return len(accepted)
+
+    #un dossier supprimé ailleurs garde ici les tâches qu'il contient encore, le store ne supprime pas de dossier
+    def apply_record(self, folder, name, task):
+        if name == FOLDER_MARKER:
+            if task is not None: self.store.add_folder(folder)
+        elif task is None:
+            if folder in self.store.tasks: self.store.remove_tasks([(folder, name)])
+        else:
+            self.store.add_folder(folder)
+            current = self.store.folder(folder).get(name) or api.Task(name, folder=folder, loaded=True, store=self.store)
+            current.achieved, current.priority, current.date, current.repeat = task["achieved"], task["priority"], api.date_to_ordinal(task["date"]), task.get("repeat")
+            self.store.update(current)
+
+    #envoi, réception et application en une fois (cli.py)
+    def sync(self)->tuple:
+        sent = self.push()
+        records, cursor = self.pull()
+        if self.state.pending(): sent += self.push()
+        return sent, self.apply(records, cursor)
+
+    #les modifications des autres processus sont reprises et celles du store écrites avant de
+    #noter la révision
+    def close(self):
+        if self.tracking:
+            self.store.sync()
+            self.store.flush()
+            self.store.storage.wait()
+            revision = self.revision()
+            if revision is not None: self.remember(revision)
+            self.untrack()
+        self.connection.close()
+        self.state.close()
@@ -0,0 +1,108 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+from .sync import PULL_LIMIT, compress, decompress
+
+
+#serveur de référence de la synchronisation (voir sync.py), en mémoire, pour les essais et les
+#tests : python cli.py serve, ou SyncServer().start() dans le processus des tests.
+#Protocole, corps en JSON éventuellement compressé (Content-Encoding: deflate) :
+#  POST /push     {"device", "records"} -> {"cursor", "accepted", "epoch"}
+#  GET  /changes  ?since=&device=&limit= -> {"records", "cursor", "more", "epoch"}
+#chaque version acceptée reçoit le numéro suivant, /changes parcourt les numéros postérieurs
+#à since et saute ceux qu'une version plus récente de la même tâche a remplacés
+#ainsi que ceux de l'appareil qui demande. epoch change à chaque démarrage du serveur, qui
+#repart sans versions : les clients renvoient alors tout et relisent depuis 0
+
+
+#class
+class SyncHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" #connexions gardées ouvertes
+    disable_nagle_algorithm = True #en-têtes et corps sont écrits séparément
+
+    def do_POST(self):
+        if urlsplit(self.path).path.rstrip("/").endswith("/push"):
+            payload = decompress(self.rfile.read(int(self.headers.get("Content-Length", 0))), self.headers.get("Content-Encoding"))
+            accepted = self.server.push(payload["records"])
+            self.reply({"cursor":self.server.cursor(), "accepted":accepted, "epoch":self.server.epoch})
+        else: self.reply(None, 404)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/").endswith("/changes"):
+            query = {key:values[0] for key, values in parse_qs(url.query).items()}
+            records, cursor, more = self.server.changes(int(query.get("since", 0)), query.get("device"), int(query.get("limit", PULL_LIMIT)))
+            self.reply({"records":records, "cursor":cursor, "more":more, "epoch":self.server.epoch})
+        else: self.reply(None, 404)
+
+    def reply(self, payload, status = 200):
+        body = b""
+        if payload is not None: body = compress(payload)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if body: self.send_header("Content-Encoding", "deflate")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SyncServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address = ("127.0.0.1", 0)):
+        super().__init__(address, SyncHandler)
+        self.lock = threading.Lock()
+        self.records = {} #(dossier, nom): (numéro, version)
+        self.log = [] #clé de la version de chaque numéro, le numéro n est en log[n-1]
+        self.epoch = uuid.uuid4().hex
+        self.thread = None
+
+    @property
+    def url(self)->str:
+        host, port = self.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="sync-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def cursor(self)->int:
+        return len(self.log)
+
+    #la plus grande version gagne, comme chez le client
+    def push(self, records)->int:
+        accepted = 0
+        with self.lock:
+            for record in records:
+                key = (record["folder"], record["name"])
+                current = self.records.get(key)
+                if current is not None and current[1]["stamp"] >= record["stamp"]: continue
+                self.log.append(key)
+                self.records[key] = (len(self.log), record)
+                accepted += 1
+        return accepted
+
+    def changes(self, since, device = None, limit = PULL_LIMIT)->tuple:
+        records = []
+        with self.lock:
+            seq = since
+            while seq < len(self.log) and len(records) < limit:
+                seq += 1
+                current, record = self.records[self.log[seq-1]]
+                if current == seq and record["stamp"][1] != device: records.append(record)
+            return records, seq, seq < len(self.log)
+
+    #versions courantes des tâches, pour comparer aux données des clients
+    def tasks(self)->dict:
+        with self.lock:
+            return {key:record["task"] for key, (_, record) in self.records.items()}
@@ -1,38 +1,108 @@
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import partial
 from json.decoder import JSONDecodeError
+import atexit
 import os
 from pathlib import Path
-import logging
 from typing import Iterable
-import uuid
 import json
-from PyQt5.QtCore import QDate
-from PyQt5.QtGui import QIcon
+from .filelock import get_lock
+from .fingerprint import Fingerprint, file_digest, file_stat
+from . import metrics
+from .history import append_history, iter_history
+from .recurrence import anchored_rule, next_occurrence
+from .rollups import add_to_rollups, build_rollups, count_rollups
+from .journal import Journal, clear_journal, coalesce, current_records, replay
+from .snapshot import BinarySnapshot, is_binary, touched_folders, write_snapshot
+from .storage import SqliteStorage, Storage, date_to_ordinal, ordinal_to_date
+from .remote import RemoteStorage, daemon_available
+from .writer import ThreadedStorage
 
 
-logging.basicConfig(level = logging.DEBUG)
-
 TASKS_DIR = os.path.join(Path.home(), ".todo")
 TASKS_FILEPATH = os.path.join(TASKS_DIR, "tasks.json")
+BINARY_FILEPATH = os.path.join(TASKS_DIR, "tasks.bin")
+JOURNAL_FILEPATH = os.path.join(TASKS_DIR, "tasks.journal")
 HISTORY_FILEPATH = os.path.join(TASKS_DIR, "history.json")
+HISTORY_LOG_FILEPATH = os.path.join(TASKS_DIR, "history.jsonl")
+HISTORY_ARCHIVE_DIR = os.path.join(TASKS_DIR, "history")
+ROLLUPS_FILEPATH = os.path.join(TASKS_DIR, "rollups.json")
+SQLITE_FILEPATH = os.path.join(TASKS_DIR, "tasks.db")
+SYNC_FILEPATH = os.path.join(TASKS_DIR, "sync.db")
+SOCKET_FILEPATH = os.path.join(TASKS_DIR, "store.sock")
 CONFIG_FILEPATH = os.path.join(TASKS_DIR, "config.ini")
+LOCK_FILEPATH = os.path.join(TASKS_DIR, "tasks.lock")
 
 DEFAULT_TASK_CONFIG = {"general":{}}
 DEFAULT_HISTORY_CONFIG = {}
-DEFAULT_CONFIG = {"first_time":True, "auto_clean":False, "notifications":True}
+DEFAULT_CONFIG = {"first_time":True, "auto_clean":False, "notifications":True, "journal":True, "storage":"json", "search_cache":True, "sort":"manual", "watch":True, "background_writes":True, "snapshot":"json", "metrics":False, "auto_clean_age":0, "backups":True, "sync_url":"", "daemon":False}
+JOURNAL_MAX_SIZE = 256*1024 #octets avant de réécrire le snapshot
 
+default_store = None
 
 
 #fonctions
 ##helpers
-def str_to_qdate(date):
-    if date: return QDate(*[int(d) for d in date.split("-")])
-    return QDate()
-
-def qdate_to_str(qdate: QDate):
-    return str(qdate.year())+"-"+str(qdate.month())+"-"+str(qdate.day())
-
-def cast_dict_to_task(task_dict: dict, folder):
-    return {key:Task(key, value["achieved"], folder, value["priority"], value["date"], True) for key, value in task_dict.items()}
+def atomic_dump(data, filepath):
+    tmp_filepath = filepath+".tmp"
+    with open(tmp_filepath, "w") as f:
+        json.dump(data, f)
+        metrics.count("io.writes")
+        metrics.count("io.bytes_written", f.tell())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filepath, filepath)
+
+def cast_dict_to_task(task_dict: dict, folder, store=None):
+    return {key:Task(key, value["achieved"], folder, value["priority"], value["date"], True, store, value.get("repeat")) for key, value in task_dict.items()}
+
+#verrou partagé par tous les processus qui écrivent dans TASKS_DIR
+def tasks_lock():
+    return get_lock(LOCK_FILEPATH)
+
+#background : les écritures passent par un thread dédié (voir writer.py)
+def get_store(background = False):
+    global default_store
+    if default_store is None:
+        storage = open_storage(load_config())
+        if background and not isinstance(storage, RemoteStorage): storage = ThreadedStorage(storage)
+        default_store = TaskStore(storage)
+        default_store.load()
+        atexit.register(default_store.close)
+    return default_store
+
+#avec "daemon": true, les données passent par le démon s'il tourne (voir daemon.py)
+def open_storage(config: dict)->Storage:
+    if config.get("daemon") and daemon_available(SOCKET_FILEPATH): return RemoteStorage(SOCKET_FILEPATH)
+    if config.get("storage") == "sqlite":
+        if not os.path.exists(SQLITE_FILEPATH): return migrate_to_sqlite()
+        return SqliteStorage(SQLITE_FILEPATH)
+    return JsonStorage(config.get("journal", True), config.get("snapshot", "json"))
+
+#copie unique de tasks.json et history.json dans la base sqlite
+def migrate_to_sqlite(filepath = None)->SqliteStorage:
+    storage = SqliteStorage(filepath or SQLITE_FILEPATH)
+    storage.import_data(simple_load_tasks(), iter_all_history())
+    return storage
+
+#utilisé par les scripts et benchmarks pour travailler hors de ~/.todo
+def set_tasks_dir(directory):
+    global TASKS_DIR, TASKS_FILEPATH, BINARY_FILEPATH, JOURNAL_FILEPATH, HISTORY_FILEPATH, HISTORY_LOG_FILEPATH, HISTORY_ARCHIVE_DIR, ROLLUPS_FILEPATH, SQLITE_FILEPATH, SYNC_FILEPATH, SOCKET_FILEPATH, CONFIG_FILEPATH, LOCK_FILEPATH, default_store
+    TASKS_DIR = directory
+    TASKS_FILEPATH = os.path.join(TASKS_DIR, "tasks.json")
+    BINARY_FILEPATH = os.path.join(TASKS_DIR, "tasks.bin")
+    JOURNAL_FILEPATH = os.path.join(TASKS_DIR, "tasks.journal")
+    HISTORY_FILEPATH = os.path.join(TASKS_DIR, "history.json")
+    HISTORY_LOG_FILEPATH = os.path.join(TASKS_DIR, "history.jsonl")
+    HISTORY_ARCHIVE_DIR = os.path.join(TASKS_DIR, "history")
+    ROLLUPS_FILEPATH = os.path.join(TASKS_DIR, "rollups.json")
+    SQLITE_FILEPATH = os.path.join(TASKS_DIR, "tasks.db")
+    SYNC_FILEPATH = os.path.join(TASKS_DIR, "sync.db")
+    SOCKET_FILEPATH = os.path.join(TASKS_DIR, "store.sock")
+    CONFIG_FILEPATH = os.path.join(TASKS_DIR, "config.ini")
+    LOCK_FILEPATH = os.path.join(TASKS_DIR, "tasks.lock")
+    default_store = None
 
 ##file system initialization
 def init_files():
@@ -42,8 +112,8 @@ def init_files():
 
 def init_task_file(force = False):
     if not os.path.exists(TASKS_DIR): os.mkdir(TASKS_DIR)
-    if not os.path.exists(TASKS_FILEPATH) or force:
-        with open(TASKS_FILEPATH, "x") as f:
+    if snapshot_filepath() is None or force:
+        with open(TASKS_FILEPATH, "w") as f:
             json.dump(DEFAULT_TASK_CONFIG, f)
 
 def init_history_file(force = False):
@@ -58,19 +128,25 @@ def init_config_file(force = False):
 
 
 ##data management
-def load_tasks()->dict:
-    if os.path.exists(TASKS_FILEPATH):
-        with open(TASKS_FILEPATH, "r") as f:
-            try:
-                tasks = json.load(f)
-                for folder in tasks: tasks[folder] = cast_dict_to_task(tasks[folder], folder)
-                return tasks
-            except JSONDecodeError:
-                dump_tasks(DEFAULT_TASK_CONFIG)
-                return json.load(f)
-    return {}
+@metrics.timed("load_tasks")
+def load_tasks(store=None)->dict:
+    tasks = simple_load_tasks()
+    for folder in tasks: tasks[folder] = cast_dict_to_task(tasks[folder], folder, store)
+    return tasks
 
+#history.json ne contient que l'historique antérieur au fichier history.jsonl
 def load_history():
+    history = load_history_file()
+    for record in iter_history(HISTORY_LOG_FILEPATH, HISTORY_ARCHIVE_DIR):
+        history.setdefault(record["folder"], []).append(record["name"])
+    return history
+
+#history.json n'a pas d'horodatage, history.jsonl et ses archives en ont un
+def iter_all_history():
+    yield from ({"folder":folder, "name":name} for folder, names in load_history_file().items() for name in names)
+    yield from iter_history(HISTORY_LOG_FILEPATH, HISTORY_ARCHIVE_DIR)
+
+def load_history_file():
     if os.path.exists(HISTORY_FILEPATH):
         with open(HISTORY_FILEPATH, "r") as f:
             try:
@@ -89,121 +165,658 @@ def load_config():
     return {}
 
 
+@metrics.timed("simple_load_tasks")
 def simple_load_tasks()->dict:
-    if os.path.exists(TASKS_FILEPATH):
-        with open(TASKS_FILEPATH, "r") as f:
-            try:
-                return json.load(f)
-            except JSONDecodeError:
-                dump_tasks(DEFAULT_TASK_CONFIG)
-                return json.load(f)
-    return {}
+    return replay(load_snapshot(), journal_records())
+
+#voir journal.current_records
+def journal_records()->list:
+    return current_records(JOURNAL_FILEPATH, snapshot_digest)
+
+##snapshots
+#tasks.json (format d'échange) ou tasks.bin (voir snapshot.py), le plus récent des deux
+#s'il en reste deux, le format est reconnu au contenu du fichier
+def snapshot_filepath():
+    filepaths = [filepath for filepath in (TASKS_FILEPATH, BINARY_FILEPATH) if os.path.exists(filepath)]
+    return max(filepaths, key=os.path.getmtime, default=None)
+
+def snapshot_format()->str:
+    filepath = snapshot_filepath()
+    if filepath is None: return None
+    return "binary" if is_binary(filepath) else "json"
+
+def snapshot_digest():
+    filepath = snapshot_filepath()
+    return file_digest(filepath) if filepath is not None else None
+
+def open_snapshot():
+    filepath = snapshot_filepath()
+    if filepath is None or not is_binary(filepath): return None
+    return BinarySnapshot(filepath)
+
+def load_snapshot()->dict:
+    filepath = snapshot_filepath()
+    if filepath is None: return {}
+    if is_binary(filepath):
+        snapshot = BinarySnapshot(filepath)
+        tasks = snapshot.load()
+        snapshot.close()
+        return tasks
+    with open(filepath, "r") as f:
+        try:
+            tasks = json.load(f)
+        except JSONDecodeError:
+            return {folder:{} for folder in DEFAULT_TASK_CONFIG}
+        metrics.count("io.reads")
+        metrics.count("io.bytes_read", f.tell())
+        return tasks
 
 
 def delete_all_tasks():
     empty = {"general":{}}
-    with open(TASKS_FILEPATH, "w") as f:
-        json.dump(empty, f) 
+    with tasks_lock():
+        dump_tasks(empty)
 
 def delete_task(folder, name):
-    tasks = simple_load_tasks()
-    tasks[folder].pop(name)
-    dump_tasks(tasks)
+    with tasks_lock():
+        tasks = simple_load_tasks()
+        tasks[folder].pop(name)
+        dump_tasks(tasks)
 
 def delete_tasks(cleanable_tasks: Iterable[tuple]):
-    tasks = simple_load_tasks()
-    for folder, task in cleanable_tasks: del tasks[folder][task]
-    with open(TASKS_FILEPATH, "w") as f: json.dump(tasks, f)
+    with tasks_lock():
+        tasks = simple_load_tasks()
+        for folder, task in cleanable_tasks: del tasks[folder][task]
+        dump_tasks(tasks)
 
-def dump_tasks(tasks):
-    with open(TASKS_FILEPATH, "w") as f:
-        json.dump(tasks, f)
+#le snapshot contient désormais tout le journal. Un arrêt brutal avant clear_journal() ne fait pas
+#rejouer le journal au chargement suivant : il est noté sur l'ancien snapshot (voir journal.py)
+#format : "json" ou "binary", par défaut celui du snapshot existant. L'autre fichier est
+#supprimé, c'est ainsi que se fait la migration d'un format à l'autre
+@metrics.timed("dump_tasks")
+def dump_tasks(tasks, format = None):
+    format = format or snapshot_format() or "json"
+    if format == "binary":
+        try:
+            write_snapshot(tasks, BINARY_FILEPATH)
+        except ValueError:#nom de tâche que le format binaire ne sait pas représenter
+            format = "json"
+    if format == "json": atomic_dump(tasks, TASKS_FILEPATH)
+    old_filepath = TASKS_FILEPATH if format == "binary" else BINARY_FILEPATH
+    if os.path.exists(old_filepath): os.remove(old_filepath)
+    clear_journal(JOURNAL_FILEPATH)
 
 def dump_history(history):
     with open(HISTORY_FILEPATH, "w") as f:
         json.dump(history, f)
 
-def change_folder_name(old_name, new_name):
-    tasks = simple_load_tasks()
-    if old_name in tasks and not new_name in tasks:
-        tasks[new_name] = tasks[old_name]
-        del tasks[old_name]
-        dump_tasks(tasks)
+def dump_config(config):
+    atomic_dump(config, CONFIG_FILEPATH)
 
-def add_task_to_history(task):
-    history = load_history()
-    history[task.folder].append(task.name)
-    dump_history(history)
+def change_folder_name(old_name, new_name):
+    with tasks_lock():
+        tasks = simple_load_tasks()
+        if old_name in tasks and not new_name in tasks:
+            tasks[new_name] = tasks[old_name]
+            del tasks[old_name]
+            dump_tasks(tasks)
 
 def add_task_to_history(folder, name):
-    history = load_history()
-    if folder in history: history[folder].append(name)
-    else: history[folder] = [name]
-    dump_history(history)
-
-def add_tasks_to_history(tasks):
-    for folder, name in tasks:
-        add_task_to_history(folder, name)
+    add_tasks_to_history([(folder, name)])
+
+def add_tasks_to_history(tasks, time: datetime = None):
+    tasks = list(tasks)
+    time = time or datetime.now()
+    if not tasks: return
+    with tasks_lock():
+        rollups = load_rollups()#construit avant l'ajout s'il n'existe pas encore
+        append_history(HISTORY_LOG_FILEPATH, HISTORY_ARCHIVE_DIR, tasks, time)
+        dump_rollups(add_to_rollups(rollups, count_rollups(tasks, time)))
+
+#rollups.json est construit depuis l'historique la première fois
+def load_rollups()->dict:
+    with tasks_lock():
+        if os.path.exists(ROLLUPS_FILEPATH):
+            with open(ROLLUPS_FILEPATH, "r") as f:
+                try:
+                    return json.load(f)
+                except JSONDecodeError:
+                    pass
+        rollups = build_rollups(iter_all_history())
+        dump_rollups(rollups)
+        return rollups
+
+def dump_rollups(rollups):
+    atomic_dump(rollups, ROLLUPS_FILEPATH)
 
 
 
 #class
+#backend historique : tasks.json, history.json et éventuellement tasks.journal
+#en mode journal le snapshot n'est réécrit que lorsque le journal dépasse JOURNAL_MAX_SIZE
+#les écritures se font sous tasks_lock(), les modifications des autres processus
+#sont repérées par l'empreinte du snapshot et du journal
+#avec un snapshot binaire, les dossiers que le journal ne touche pas sont décodés à la demande
+class JsonStorage(Storage):
+    def __init__(self, journal=False, format="json"):
+        self.journal = Journal(JOURNAL_FILEPATH, snapshot_digest) if journal else None
+        self.format = format
+        self.snapshot = None
+        self.digests = {}#empreinte des dossiers rendus à None, voir read()
+        self.previous = {}
+        self.lock = tasks_lock()
+        self.fingerprint = Fingerprint([TASKS_FILEPATH, BINARY_FILEPATH, JOURNAL_FILEPATH], [TASKS_FILEPATH, BINARY_FILEPATH])
+        self.pending = []#modifications pas encore écrites, sans journal
+        self.buffer = None
+        self.external = False
+
+    def load(self)->dict:
+        return simple_load_tasks()
+
+    def load_folders(self)->dict:
+        with self.lock:
+            if snapshot_format() not in (None, self.format): dump_tasks(simple_load_tasks(), self.format)
+            return self.read(True)
+
+    #un dossier rendu à None par read() : la version qu'a le store, celle du snapshot de read(). S'il a
+    #été remplacé depuis (compaction, autre processus), le dossier est lu dans le nouveau, avec le
+    #journal qui le suit. Juste après read(), la version précédente d'un dossier qui a changé, pour
+    #que la fusion du store notifie les différences
+    def load_folder(self, folder)->dict:
+        with self.lock:
+            if folder in self.previous: return self.previous.pop(folder)
+            if self.snapshot is not None and not self.snapshot.replaced(): return self.snapshot.folder(folder) if folder in self.snapshot else {}
+            records = journal_records()+self.pending
+            snapshot = open_snapshot()
+            if snapshot is None: return replay(load_snapshot(), records).get(folder, {})
+            try:
+                if folder in touched_folders(records): return snapshot.load_lazy(records).get(folder) or {}
+                if not folder in snapshot: return {}
+                self.digests[folder] = snapshot.digest(folder)#le store aura cette version
+                return snapshot.folder(folder)
+            finally:
+                snapshot.close()
+
+    def load_history(self)->dict:
+        return load_history()
+
+    def record(self, op, folder, **data):
+        self.write([{"op":op, "folder":folder, **data}])
+
+    def write(self, records):
+        with self.lock:
+            if self.buffer is not None: self.buffer.extend(records)
+            elif self.journal is None: self.pending.extend(records)
+            else:
+                self.external = self.external or self.fingerprint.changed()
+                self.journal.extend(records)
+                if not self.external: self.fingerprint.remember()
+
+    #les modifications faites par calls sont écrites ensemble, en ne gardant que
+    #le dernier état d'une tâche modifiée plusieurs fois
+    def group(self, calls):
+        with self.lock:
+            self.buffer = []
+            try:
+                for call in calls: call()
+            finally:
+                self.flush_buffer()
+
+    def flush_buffer(self):
+        records, self.buffer = self.buffer, None
+        if records: self.write(coalesce(records))
+
+    #état du disque auquel on réapplique les modifications en attente
+    def reload(self)->dict:
+        return self.read()
+
+    #avec un snapshot binaire, les dossiers que le journal ne touche pas sont rendus à None : tous
+    #au premier chargement (initial), ensuite seulement ceux dont l'empreinte n'a pas changé depuis
+    #qu'ils ont été rendus à None, le store les garde alors tels quels (voir TaskStore.merge_folders)
+    def read(self, initial = False)->dict:
+        previous, self.previous = self.snapshot, {}
+        self.snapshot = open_snapshot()
+        records = journal_records()+self.pending
+        digests = {}
+        if self.snapshot is None: tasks = replay(load_snapshot(), records)
+        else:
+            tasks = self.snapshot.load_lazy(records)
+            for folder in [folder for folder, raw in tasks.items() if raw is None]:
+                digests[folder] = self.snapshot.digest(folder)
+                if not initial and self.digests.get(folder) != digests[folder]: tasks[folder] = self.snapshot.folder(folder)
+        if previous is not None:
+            for folder, digest in self.digests.items():
+                if tasks.get(folder) is not None and folder in previous and previous.digest(folder) == digest: self.previous[folder] = previous.folder(folder)
+            previous.close()
+        self.digests = digests
+        self.fingerprint.remember()
+        self.external = False
+        return tasks
+
+    def external_changes(self):
+        with self.lock:
+            if self.external or self.fingerprint.changed(): return self.reload()
+        return None
+
+    def watched_files(self):
+        return [TASKS_FILEPATH, BINARY_FILEPATH, JOURNAL_FILEPATH]
+
+    #taille et date des fichiers : tout enregistrement les modifie
+    def revision(self):
+        with self.lock:
+            return [file_stat(filepath) for filepath in self.watched_files()]
+
+    def iter_history(self):
+        return iter_all_history()
+
+    def load_rollups(self)->dict:
+        return load_rollups()
+
+    ##modifications
+    def set_task(self, folder, name, task: dict):
+        self.record("set", folder, name=name, task=task)
+
+    def set_tasks(self, tasks):
+        self.write([{"op":"set", "folder":folder, "name":name, "task":task} for folder, name, task in tasks])
+
+    def delete_tasks(self, tasks):
+        for folder, name in tasks: self.record("del", folder, name=name)
+
+    #une tâche du même nom à l'arrivée est remplacée, comme en mémoire et dans SQLite :
+    #"rename" seul la laisserait en place à la relecture
+    def rename_task(self, folder, name, new_name):
+        if new_name == name: return
+        self.write([{"op":"del", "folder":folder, "name":new_name}, {"op":"rename", "folder":folder, "name":name, "new":new_name}])
+
+    def move_task(self, folder, name, new_folder):
+        self.record("move", folder, name=name, new=new_folder)
+
+    def add_folder(self, folder):
+        self.record("add_folder", folder)
+
+    def rename_folder(self, old_name, new_name):
+        self.record("rename_folder", old_name, new=new_name)
+
+    def add_history(self, tasks, time: datetime = None):
+        add_tasks_to_history(tasks, time)
+
+    #le snapshot est relu sur le disque sous verrou plutôt que pris dans le store : il
+    #contient ainsi les modifications des autres processus, et commit() peut tourner
+    #hors du thread de l'interface. Le store les fusionnera au prochain sync()
+    def commit(self, store = None):
+        with self.lock:
+            if self.buffer: self.flush_buffer()
+            if self.journal is None or self.journal.size() > JOURNAL_MAX_SIZE:
+                external = self.external or self.fingerprint.changed()
+                dump_tasks(replay(simple_load_tasks(), self.pending), self.format)
+                self.pending = []
+                self.fingerprint.remember()
+                self.external = external
+
+    def close(self):
+        if self.journal is not None: self.journal.close()
+        if self.snapshot is not None: self.snapshot.close()
+
+
+#copie en mémoire des tâches, les modifications sont transmises au backend de
+#stockage au fil de l'eau et validées par flush()
+#les Task d'un dossier ne sont créées qu'au premier appel de folder()
+class TaskStore:
+    def __init__(self, storage: Storage = None):
+        self.storage = storage if storage is not None else JsonStorage()
+        self.tasks = {}
+        self.raw_tasks = {}
+        self.loaded_folders = set()
+        self.dirty = False
+        self.on_dirty = None
+        self.listeners = []
+        self.batch_listeners = set()
+        self.batch_depth = 0
+        self.batch_calls = []
+        self.batch_events = []
+        self.applying = False #voir apply_changes
+
+    @metrics.timed("store.load")
+    def load(self):
+        self.raw_tasks = self.storage.load_folders()
+        self.tasks = {folder:{} for folder in self.raw_tasks}
+        self.loaded_folders = set()
+        self.dirty = False
+        return self.tasks
+
+    def folder(self, folder)->dict:
+        if not folder in self.loaded_folders:
+            metrics.count("store.folders_loaded")
+            raw = self.raw_tasks.pop(folder, None)
+            if raw is None and folder in self.tasks: raw = self.storage.load_folder(folder)
+            self.tasks.setdefault(folder, {}).update(cast_dict_to_task(raw or {}, folder, self))
+            self.loaded_folders.add(folder)
+        return self.tasks[folder]
+
+    #dictionnaires d'un dossier non chargé, gardés pour le premier appel de folder()
+    def raw_folder(self, folder)->dict:
+        if self.raw_tasks.get(folder) is None: self.raw_tasks[folder] = self.storage.load_folder(folder)
+        return self.raw_tasks[folder]
+
+    def load_all(self):
+        for folder in list(self.tasks): self.folder(folder)
+        return self.tasks
+
+    #(dossier, nom, dictionnaire) de toutes les tâches sans créer les Task des dossiers non chargés
+    def iter_records(self):
+        for folder in list(self.tasks):
+            if folder in self.loaded_folders:
+                for name, task in self.tasks[folder].items(): yield folder, name, task.toDict()
+            else:
+                raw = self.raw_tasks.get(folder)
+                if raw is None: raw = self.storage.load_folder(folder)
+                for name, task in raw.items(): yield folder, name, task
+
+    #relit les tâches si un autre processus les a modifiées
+    @metrics.timed("store.sync")
+    def sync(self)->bool:
+        tasks = self.storage.external_changes()
+        if tasks is not None: self.merge(tasks)
+        return tasks is not None
+
+    #applique l'état relu sur le disque, sans le réécrire, en prévenant les vues
+    #les dossiers non chargés dont le contenu n'a pas changé ne sont pas convertis, ni ceux que le
+    #backend rend à None (inchangés depuis sa lecture précédente, voir JsonStorage.read)
+    @metrics.timed("store.merge")
+    def merge(self, tasks: dict):
+        with self.batch():
+            self.merge_folders(tasks)
+
+    def merge_folders(self, tasks: dict):
+        for folder in [folder for folder in self.tasks if not folder in tasks]: self.drop_folder(folder)
+        for folder, raw in tasks.items():
+            if not folder in self.tasks:
+                if raw is None: raw = self.storage.load_folder(folder)
+                self.tasks[folder] = {}
+                self.loaded_folders.add(folder)
+                self.notify("folder_added", folder)
+            elif raw is None or (not folder in self.loaded_folders and self.raw_tasks.get(folder) == raw): continue
+            self.merge_folder(folder, raw)
+
+    #en mémoire seulement, les backends ne suppriment pas de dossier
+    def drop_folder(self, folder):
+        removed = list(self.folder(folder))
+        del self.tasks[folder]
+        self.loaded_folders.discard(folder)
+        for name in removed: self.notify("removed", folder, name)
+        self.notify("folder_removed", folder)
+
+    def merge_folder(self, folder, raw: dict):
+        current = self.folder(folder)
+        removed = [name for name in current if not name in raw]
+        for name in removed: del current[name]
+        for name in removed: self.notify("removed", folder, name)
+        for name, value in raw.items():
+            fields = (value["achieved"], value["priority"], date_to_ordinal(value["date"]), value.get("repeat"))
+            task = current.get(name)
+            if task is None:
+                current[name] = Task(name, fields[0], folder, fields[1], fields[2], True, self, fields[3])
+                self.notify("added", current[name])
+            elif (task.achieved, task.priority, task.date, task.repeat) != fields:
+                task.achieved, task.priority, task.date, task.repeat = fields
+                self.notify("changed", task)
+
+    #modifications faites par un autre client du démon (voir daemon.py) : appliquées en mémoire
+    #et notifiées aux vues, sans être renvoyées au backend
+    def apply_changes(self, changes):
+        self.applying = True
+        try:
+            with self.batch():
+                for change in changes: self.apply_change(*change)
+        finally:
+            self.applying = False
+
+    #une modification décrite par ("set", dossier, nom, dictionnaire), ("delete", dossier, nom),
+    #("rename", dossier, nom, nouveau nom), ("move", dossier, nom, nouveau dossier), ("add_folder", dossier),
+    #("rename_folder", ancien, nouveau), ("remove_folder", dossier) ou ("history", [(dossier, nom)])
+    #une tâche déjà à jour (dossier relu après la modification) est laissée telle quelle
+    def apply_change(self, op, *args):
+        if op == "set":
+            folder, name, task = args
+            self.add_folder(folder)
+            current = self.folder(folder).get(name) or Task(name, folder=folder, loaded=True, store=self)
+            current.achieved, current.priority, current.date, current.repeat = task["achieved"], task["priority"], date_to_ordinal(task["date"]), task.get("repeat")
+            self.update(current)
+        elif op == "delete":
+            if args[0] in self.tasks: self.remove_tasks([args])
+        elif op in ("rename", "move"):
+            folder, name, new = args
+            task = self.folder(folder).get(name) if folder in self.tasks else None
+            if task is not None: self.rename(task, new) if op == "rename" else self.move(task, new)
+        elif op == "add_folder": self.add_folder(args[0])
+        elif op == "rename_folder": self.rename_folder(*args)
+        elif op == "remove_folder":
+            if args[0] in self.tasks: self.drop_folder(args[0])
+        elif op == "history": self.notify("history_added", [tuple(task) for task in args[0]])
+
+    @metrics.timed("store.flush")
+    def flush(self):
+        if self.dirty:
+            self.storage.commit(self)
+            self.dirty = False
+
+    def close(self):
+        self.flush()
+        self.storage.close()
+
+    def to_dict(self):
+        return {folder:{name:task.toDict() for name, task in tasks.items()} for folder, tasks in self.load_all().items()}
+
+    def mark_dirty(self):
+        self.dirty = True
+        if self.on_dirty: self.on_dirty()
+
+    ##notifications
+    #les vues sont prévenues de chaque modification : "added", "changed", "removed",
+    #"renamed", "moved", "folder_added", "folder_renamed", "folder_removed" et "history_added"
+    #batched : le listener reçoit ("batch", [(événement, arguments), ...]) à la fin
+    #d'un bloc batch() plutôt que chaque événement séparément
+    def subscribe(self, listener, batched = False):
+        self.listeners.append(listener)
+        if batched: self.batch_listeners.add(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self.listeners: self.listeners.remove(listener)
+        self.batch_listeners.discard(listener)
+
+    def notify(self, event, *args):
+        if self.batch_depth:
+            self.batch_events.append((event, args))
+            return
+        for listener in list(self.listeners): listener(event, *args)
+
+    def notify_batch(self, events):
+        for listener in list(self.listeners):
+            if listener in self.batch_listeners: listener("batch", events)
+            else:
+                for event, args in events: listener(event, *args)
+
+    ##transactions
+    #dans un bloc with store.batch(), les écritures du backend et les notifications
+    #sont différées jusqu'à la sortie du bloc : une écriture groupée (Storage.group)
+    #puis un seul événement "batch". Les modifications en mémoire restent acquises
+    #si le bloc lève une exception, elles sont donc écrites quand même
+    @contextmanager
+    def batch(self):
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0: self.end_batch()
+
+    @metrics.timed("store.end_batch")
+    def end_batch(self):
+        calls, self.batch_calls = self.batch_calls, []
+        events, self.batch_events = self.batch_events, []
+        if calls:
+            self.storage.group(calls)
+            self.mark_dirty()
+        if events: self.notify_batch(events)
+
+    @metrics.timed("store.persist")
+    def persist(self, method, *args):
+        if self.applying: return
+        call = partial(getattr(self.storage, method), *args)
+        if self.batch_depth: self.batch_calls.append(call)
+        else:
+            call()
+            self.mark_dirty()
+
+    ##folders
+    def add_folder(self, folder):
+        if not folder in self.tasks:
+            self.folder(folder)
+            self.persist("add_folder", folder)
+            self.notify("folder_added", folder)
+
+    def rename_folder(self, old_name, new_name):
+        if old_name in self.tasks and not new_name in self.tasks:
+            tasks = self.folder(old_name)#le backend ne connaît pas encore le nouveau nom
+            del self.tasks[old_name]
+            self.loaded_folders.discard(old_name)
+            self.tasks[new_name] = tasks
+            self.loaded_folders.add(new_name)
+            for task in tasks.values(): task.folder = new_name
+            self.persist("rename_folder", old_name, new_name)
+            self.notify("folder_renamed", old_name, new_name)
+
+    ##tasks
+    def update(self, task):
+        tasks = self.folder(task.folder)
+        event = "changed" if task.name in tasks else "added"
+        tasks[task.name] = task
+        self.persist("set_task", task.folder, task.name, task.toDict())
+        self.notify(event, task)
+
+    #ajout groupé : une seule écriture pour le backend, puis les notifications
+    def add_tasks(self, tasks: Iterable):
+        tasks = list(tasks)
+        if not tasks: return
+        with self.batch():
+            for task in tasks:
+                task.store = self
+                folder = self.folder(task.folder)
+                self.notify("changed" if task.name in folder else "added", task)
+                folder[task.name] = task
+            self.persist("set_tasks", [(task.folder, task.name, task.toDict()) for task in tasks])
+
+    def remove(self, task):
+        self.remove_tasks([(task.folder, task.name)])
+
+    #les tâches d'un dossier pas encore chargé sont retirées de ses données brutes, sans créer ses Task
+    def remove_tasks(self, tasks: Iterable[tuple]):
+        tasks = [(folder, name) for folder, name in tasks]
+        if not tasks: return
+        with self.batch():
+            for folder, name in tasks:
+                if folder in self.loaded_folders or not folder in self.tasks: self.folder(folder).pop(name, None)
+                else: self.raw_folder(folder).pop(name, None)
+                self.notify("removed", folder, name)
+            self.persist("delete_tasks", tasks)
+
+    #même nom ou même dossier : rien à faire, le backend supprimerait la tâche en croyant remplacer une autre
+    def rename(self, task, new_name):
+        if new_name == task.name: return
+        tasks = self.folder(task.folder)
+        tasks.pop(task.name, None)
+        tasks[new_name] = task
+        self.persist("rename_task", task.folder, task.name, new_name)
+        old_name, task.name = task.name, new_name
+        self.notify("renamed", task, old_name)
+
+    def move(self, task, new_folder):
+        if new_folder == task.folder: return
+        self.folder(task.folder).pop(task.name, None)
+        self.folder(new_folder)[task.name] = task
+        self.persist("move_task", task.folder, task.name, new_folder)
+        old_folder, task.folder = task.folder, new_folder
+        self.notify("moved", task, old_folder)
+
+    def move_tasks(self, tasks: Iterable, new_folder):
+        with self.batch():
+            for task in list(tasks): self.move(task, new_folder)
+
+    ##history
+    def add_to_history(self, tasks: Iterable[tuple]):
+        tasks = [(folder, name) for folder, name in tasks]
+        self.persist("add_history", tasks, datetime.now())
+        self.notify("history_added", tasks)
+
+    #tâches archivées par dossier et par période, voir rollups.py
+    def rollups(self)->dict:
+        return self.storage.load_rollups()
+
+
+#date est un ordinal (0 : pas de date), la conversion en QDate se fait dans l'interface
 class Task:
-    def __init__(self, name, achieved=False, folder="general", priority = 0, date="", loaded=False):
+    __slots__ = ("name", "achieved", "folder", "priority", "date", "store", "repeat")
+
+    #repeat : règle de répétition (voir recurrence.py) ou None
+    def __init__(self, name, achieved=False, folder="general", priority = 0, date="", loaded=False, store=None, repeat=None):
+        self.store = store
         self.name = name
         self.achieved = achieved
         self.folder = folder
         self.priority = priority
-        self.date = str_to_qdate(date)
+        self.date = date_to_ordinal(date)
+        self.repeat = repeat
         if not loaded: self.dump()
     
+    #la clé "repeat" n'est écrite que pour les tâches qui se répètent
     def toDict(self):
-        return {"achieved":self.achieved, "priority":self.priority, "date":qdate_to_str(self.date)}
+        if self.repeat: return {"achieved":self.achieved, "priority":self.priority, "date":ordinal_to_date(self.date), "repeat":self.repeat}
+        return {"achieved":self.achieved, "priority":self.priority, "date":ordinal_to_date(self.date)}
+
+    def get_store(self):
+        if self.store is None: self.store = get_store()
+        return self.store
 
     def switch_folder(self, new_folder:str):
-        tasks = simple_load_tasks()
-        del tasks[self.folder][self.name]
-        if new_folder in tasks: tasks[new_folder][self.name] = self.toDict()
-        else: tasks[new_folder] = {self.name:self.toDict()}
-        with open (TASKS_FILEPATH,"w") as fw:
-            json.dump(tasks, fw) 
-        self.folder = new_folder
+        self.get_store().move(self, new_folder)
         
+    #terminer une tâche qui se répète l'archive et la reporte à l'occurrence suivante
     def switch_status(self):
+        if self.repeat and not self.achieved: return self.complete_occurrence()
         self.achieved = not self.achieved
         self.dump()
+
+    def complete_occurrence(self):
+        today = date.today().toordinal()
+        store = self.get_store()
+        with store.batch():
+            previous = self.date or today
+            self.date = next_occurrence(previous, self.repeat, max(self.date, today))
+            self.repeat = anchored_rule(self.repeat, self.date, date.fromordinal(previous).day)
+            self.dump()
+            store.add_to_history([(self.folder, self.name)])
     def rename(self, new_name):
-        self.name = new_name
-        self.dump()
+        self.get_store().rename(self, new_name)
     def change_date(self, new_date):
-        if isinstance(new_date, QDate):
-            self.date = new_date
-            self.dump()
+        self.date = date_to_ordinal(new_date)
+        self.dump()
     
     def update(self, data: dict):
         if "name" in data and self.name != data["name"]:
-            delete_task(self.folder, self.name)
-            self.name = data["name"]
+            self.get_store().rename(self, data["name"])
 
-        if "date" in data:
-            if isinstance(data["date"], QDate): 
-                self.date = data["date"]
-            else: self.date = str_to_qdate(data["date"])
+        if "date" in data: self.date = date_to_ordinal(data["date"])
         if "priority" in data: self.priority = data["priority"]
+        if "repeat" in data: self.repeat = data["repeat"] or None
+        if self.repeat and not self.date: self.date = date.today().toordinal()#une répétition part d'une date
+        if self.repeat: self.repeat = anchored_rule(self.repeat, self.date)
         self.dump()
 
     def dump(self):
-        tasks = simple_load_tasks()
-        tasks[self.folder][self.name] = self.toDict()
-        with open (TASKS_FILEPATH,"w") as fw:
-            json.dump(tasks, fw) 
+        self.get_store().update(self)
         
     def delete(self):
-        with open(TASKS_FILEPATH, "r") as f:
-            tasks = json.load(f)
-            del tasks[self.folder][self.name]
-            with open (TASKS_FILEPATH, "w") as fw:
-                json.dump(tasks, fw)
+        self.get_store().remove(self)
 
     def __str__(self):
         return self.name
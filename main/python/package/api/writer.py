@@ -0,0 +1,170 @@
+from functools import partial
+import threading
+
+from . import metrics
+from .storage import Storage
+
+
+#class
+#exécute les écritures d'un backend dans un thread dédié, dans l'ordre où elles
+#ont été demandées. Les lectures attendent que la file soit vide.
+#Le thread prend toute la file d'un coup : les modifications en attente sont
+#écrites ensemble (Storage.group) et plusieurs commit() successifs n'en font qu'un.
+#Les listeners reçoivent ("written", nombre), ("failed", exception) et
+#("external",) quand un autre processus a modifié les données pendant une écriture
+class ThreadedStorage(Storage):
+    def __init__(self, storage: Storage):
+        self.storage = storage
+        self.queue = []
+        self.running = False
+        self.recheck = False
+        self.closed = False
+        self.listeners = []
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name="storage-writer", daemon=True)
+        self.thread.start()
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, event, *args):
+        for listener in self.listeners: listener(event, *args)
+
+    ##file d'attente
+    def put(self, method, *args):
+        with self.condition:
+            if self.closed: raise RuntimeError("storage closed")
+            if method == "commit" and self.queue and self.queue[-1][0] == "commit": return
+            self.queue.append((method, args))
+            self.condition.notify_all()
+
+    def busy(self)->bool:
+        with self.condition:
+            return bool(self.queue) or self.running
+
+    def wait(self):
+        with self.condition:
+            while self.queue or self.running: self.condition.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed: self.condition.wait()
+                if not self.queue: return
+                batch, self.queue = self.queue, []
+                self.running = True
+            try:
+                self.write(batch)
+                self.notify("written", len(batch))
+            except Exception as error:
+                self.notify("failed", error)
+            finally:
+                with self.condition:
+                    self.running = False
+                    recheck, self.recheck = self.recheck, False
+                    self.condition.notify_all()
+            if recheck or getattr(self.storage, "external", False): self.notify("external")
+
+    #une écriture qui échoue n'empêche pas les suivantes, la première erreur est signalée
+    @metrics.timed("writer.write")
+    def write(self, batch):
+        metrics.count("writer.calls", len(batch))
+        errors = []
+        def call(method, args):
+            try:
+                getattr(self.storage, method)(*args)
+            except Exception as error:
+                errors.append(error)
+        self.storage.group([partial(call, method, args) for method, args in batch])
+        if errors: raise errors[0]
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.storage.close()
+
+    ##lectures
+    def load(self)->dict:
+        self.wait()
+        return self.storage.load()
+
+    def load_folders(self)->dict:
+        self.wait()
+        return self.storage.load_folders()
+
+    def load_folder(self, folder)->dict:
+        self.wait()
+        return self.storage.load_folder(folder)
+
+    def load_history(self)->dict:
+        self.wait()
+        return self.storage.load_history()
+
+    def iter_history(self):
+        self.wait()
+        return self.storage.iter_history()
+
+    def load_rollups(self)->dict:
+        self.wait()
+        return self.storage.load_rollups()
+
+    def iter_tasks(self):
+        self.wait()
+        return self.storage.iter_tasks()
+
+    def due_before(self, date):
+        self.wait()
+        return self.storage.due_before(date)
+
+    def priority_at_least(self, priority: int):
+        self.wait()
+        return self.storage.priority_at_least(priority)
+
+    def achieved_in(self, folder):
+        self.wait()
+        return self.storage.achieved_in(folder)
+
+    #sans attendre : si une écriture est en cours, le thread préviendra ("external",) une fois la file vide
+    def external_changes(self):
+        with self.condition:
+            if self.queue or self.running:
+                self.recheck = True
+                return None
+        return self.storage.external_changes()
+
+    def watched_files(self)->list:
+        return self.storage.watched_files()
+
+    def revision(self):
+        self.wait()
+        return self.storage.revision()
+
+    ##modifications
+    def set_task(self, folder, name, task: dict):
+        self.put("set_task", folder, name, task)
+
+    def set_tasks(self, tasks):
+        self.put("set_tasks", list(tasks))
+
+    def delete_tasks(self, tasks):
+        self.put("delete_tasks", list(tasks))
+
+    def rename_task(self, folder, name, new_name):
+        self.put("rename_task", folder, name, new_name)
+
+    def move_task(self, folder, name, new_folder):
+        self.put("move_task", folder, name, new_folder)
+
+    def add_folder(self, folder):
+        self.put("add_folder", folder)
+
+    def rename_folder(self, old_name, new_name):
+        self.put("rename_folder", old_name, new_name)
+
+    def add_history(self, tasks, time = None):
+        self.put("add_history", list(tasks), time)
+
+    def commit(self, store = None):
+        self.put("commit")
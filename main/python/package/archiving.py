@@ -0,0 +1,47 @@
+from PyQt5.QtCore import QObject, QTimer
+
+from .api import metrics
+from .api.archive import archive_done_tasks
+
+
+IDLE_DELAY = 5*60*1000 #ms sans modification avant d'archiver
+ARCHIVE_INTERVAL = 60*60*1000 #ms entre deux passages si l'application n'est jamais inactive
+
+
+#archive les tâches terminées quand l'utilisateur ne modifie plus rien depuis IDLE_DELAY,
+#et au plus tard toutes les ARCHIVE_INTERVAL. Le tri se fait ici, les écritures partent
+#en un seul lot vers le thread d'écriture (voir writer.py)
+class ArchiveScheduler(QObject):
+    def __init__(self, store, age = 0, parent = None):
+        super().__init__(parent)
+        self.store = store
+        self.age = age
+        self.archiving = False
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(IDLE_DELAY)
+        self.idle_timer.timeout.connect(self.archive)
+        self.timer = QTimer(self)
+        self.timer.setInterval(ARCHIVE_INTERVAL)
+        self.timer.timeout.connect(self.archive)
+
+    def start(self):
+        self.store.subscribe(self.store_changed)
+        self.idle_timer.start()
+        self.timer.start()
+
+    def stop(self):
+        self.store.unsubscribe(self.store_changed)
+        self.idle_timer.stop()
+        self.timer.stop()
+
+    def store_changed(self, event, *args):
+        if not self.archiving: self.idle_timer.start()
+
+    @metrics.timed("archive")
+    def archive(self):
+        self.archiving = True
+        try:
+            metrics.count("archive.tasks", len(archive_done_tasks(self.store, self.age)))
+        finally:
+            self.archiving = False
@@ -1,26 +1,61 @@
 import sys
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import QCoreApplication, QModelIndex, QSettings, Qt
+from PyQt5.QtCore import QCoreApplication, QModelIndex, QSettings, QTimer, Qt
 from PyQt5.QtGui import QIcon, QKeySequence, QMouseEvent
 import os
+import threading
 
 from .ui import *
+from .api.sorting import MANUAL
 from .api.tasks import *
+from .resources import resources
+from .notifications import DeadlineScheduler
+from .archiving import ArchiveScheduler
+from .syncing import SyncScheduler
+from .api.sync import SyncClient
+from .watcher import StoreWatcher, WriterSignals
+from .api.writer import ThreadedStorage
+from .api.remote import RemoteStorage
+from .api.backup import backup_if_needed
+from .api import metrics
+from .api.search import HISTORY, SearchIndex, index_filepath
+from . import startup
+
+SAVE_DELAY = 1000 #ms avant d'écrire les modifications sur le disque
 
 class MainWindow(QWidget):
     def __init__(self, ctx):
         super().__init__()
         self.ctx = ctx
+        self.painted = False
+        resources.set_context(ctx)
         self.setWindowTitle("Tableau de bord")
         self.setup_data()
+        startup.mark("data load")
         self.setup_ui()
+        startup.mark("widget build")
+        self.setup_notifications()
+        self.setup_watcher()
+        self.setup_archiving()
+        self.setup_backups()
+        self.setup_sync()
         self.add_to_startup()
         
     
     def setup_data(self):
         init_files()
-        self.tasks = load_tasks()
         self.config = load_config() 
+        if self.config.get("metrics", False): metrics.enable()
+        self.store = get_store(self.config.get("background_writes", True))
+        self.tasks = self.store.tasks
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(SAVE_DELAY)
+        self.save_timer.timeout.connect(self.store.flush)
+        self.store.on_dirty = self.save_timer.start
+        QCoreApplication.instance().aboutToQuit.connect(self.dump)
+        QCoreApplication.instance().aboutToQuit.connect(self.save_search_index)
+        self.search_index = None
 
     #ui functions
     def setup_ui(self):
@@ -33,9 +68,16 @@ class MainWindow(QWidget):
         self.init_window_position()
 
     def create_widgets(self):
+        self.edit_search = QLineEdit()
+        self.lw_results = QListWidget()
         self.tabWidget = QTabWidget()
-        for folder in self.tasks: self.tabWidget.addTab(TabView(folder, self.tasks[folder]), folder)
-        self.load_tasks()
+        self.sort_mode = self.config.get("sort", MANUAL)
+        for folder in self.tasks: self.tabWidget.addTab(TabView(folder, self.store, self.sort_mode), folder)
+        if self.tabWidget.count(): self.tabWidget.currentWidget().load()
+        self.due_view = DueTaskView(self.store)
+        self.combo_sort = QComboBox()
+        self.btn_today = QPushButton("!")
+        self.btn_stats = QPushButton()
 
         self.btn_add = QPushButton()
         self.btn_clean = QPushButton()
@@ -43,19 +85,27 @@ class MainWindow(QWidget):
         self.btn_quit = QPushButton()
         
     def modify_widgets(self):
-        res = self.ctx.get_resource("style.css")
-        with open(res, "r") as file:
-            self.setStyleSheet(file.read())
+        self.setStyleSheet(resources.text("style.css"))
         
         self.main_layout.setContentsMargins(0,0,0,0)
         self.main_layout.setSpacing(0)
         self.setWindowFlags(Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
 
-        self.btn_add.setIcon(QIcon(self.ctx.get_resource("plus.png")))
-        self.btn_clean.setIcon(QIcon(self.ctx.get_resource("clean.png")))
-        self.btn_quit.setIcon(QIcon(self.ctx.get_resource("remove.png")))
-        self.btn_folder.setIcon(ICON_FOLDER)
+        self.btn_add.setIcon(resources.icon("plus.png"))
+        self.btn_clean.setIcon(resources.icon("clean.png"))
+        self.btn_quit.setIcon(resources.icon(ICON_QUIT))
+        self.btn_folder.setIcon(resources.icon(ICON_FOLDER))
         self.btn_quit.setStyleSheet("border-radius: 50%")
+        self.edit_search.setPlaceholderText("Rechercher une tâche")
+        self.edit_search.setClearButtonEnabled(True)
+        self.lw_results.hide()
+        self.due_view.hide()
+        self.btn_today.setCheckable(True)
+        self.btn_today.setToolTip("Aujourd'hui / Urgent")
+        self.btn_stats.setIcon(self.style().standardIcon(QStyle.SP_FileDialogDetailedView))
+        self.btn_stats.setToolTip("Statistiques")
+        for mode, label in SORT_LABELS.items(): self.combo_sort.addItem(label, mode)
+        self.combo_sort.setCurrentIndex(max(self.combo_sort.findData(self.sort_mode), 0))
         
 
 
@@ -64,10 +114,16 @@ class MainWindow(QWidget):
         self.button_layout = QHBoxLayout()
 
     def add_widgets_to_layouts(self):
+        self.main_layout.addWidget(self.edit_search)
+        self.main_layout.addWidget(self.lw_results)
         self.main_layout.addWidget(self.tabWidget)
+        self.main_layout.addWidget(self.due_view)
         self.main_layout.addLayout(self.button_layout)
         self.button_layout.addWidget(self.btn_add)
+        self.button_layout.addWidget(self.btn_today)
+        self.button_layout.addWidget(self.btn_stats)
         self.button_layout.addStretch()
+        self.button_layout.addWidget(self.combo_sort)
         self.button_layout.addWidget(self.btn_folder)
         self.button_layout.addWidget(self.btn_clean)
         self.button_layout.addWidget(self.btn_quit)
@@ -78,14 +134,21 @@ class MainWindow(QWidget):
         self.btn_quit.clicked.connect(self.exit)
         self.btn_folder.clicked.connect(self.add_folder)
         self.tabWidget.tabBarDoubleClicked.connect(self.folder_double_clicked)
+        self.tabWidget.currentChanged.connect(self.tab_changed)
+        self.edit_search.textChanged.connect(self.search)
+        self.lw_results.itemClicked.connect(self.search_result_clicked)
+        self.btn_today.toggled.connect(self.today_toggled)
+        self.btn_stats.clicked.connect(self.show_stats)
+        self.combo_sort.currentIndexChanged.connect(self.sort_changed)
         QShortcut(QKeySequence("+"), self.tabWidget, self.create_task)
         QShortcut(QKeySequence("Backspace"), self.tabWidget, self.delete_selected_items)
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, self.show_debug_panel)
         
         self.tray.activated.connect(self.tray_icon_clicked)
 #icone qui s'affiche dans le systray
     def create_tray_icon(self):
         self.tray = QSystemTrayIcon()
-        self.tray.setIcon(QIcon(self.ctx.get_resource("home.png")))
+        self.tray.setIcon(resources.icon("home.png"))
         self.tray.setVisible(True)
     
     def init_window_position(self):
@@ -96,25 +159,58 @@ class MainWindow(QWidget):
         h = size.height()
         self.move(tray_x-(w/2), tray_y - h -50)
     
+    def paintEvent(self, e):
+        super().paintEvent(e)
+        if not self.painted:
+            self.painted = True
+            startup.mark("first paint")
+            startup.report()
+
 #triggered functions
     def create_task(self):
         name, result = InputText("Entrez le nom de votre tâche :").get()
-        if name and result:
-            folder = self.tabWidget.currentWidget().folder
-            self.tasks[folder][name] = Task(name, False, folder)
-            self.tabWidget.currentWidget().addTask(self.tasks[folder][name])
+        if not (name and result): return
+        #aucun onglet ouvert, ou vue sans dossier : rien à créer
+        folder = getattr(self.tabWidget.currentWidget(), "folder", None)
+        if folder is not None and not name in self.tasks[folder]:
+            Task(name, False, folder, store=self.store)
     
+    @metrics.timed("ui.tab_changed")
+    def tab_changed(self, index):
+        if index >= 0: self.tabWidget.widget(index).load()
+
     def load_tasks(self):
         for i in range(self.tabWidget.count()):
             self.tabWidget.widget(i).update_data()
 
     def clean_done_tasks(self):
-        self.tabWidget.currentWidget().clean_done_tasks()
-        self.load_tasks()
+        self.current_view().clean_done_tasks()
     
     def delete_selected_items(self):
-        self.tabWidget.currentWidget().delete_selected_item()
-        self.load_tasks()
+        self.current_view().delete_selected_item()
+
+    def current_view(self):
+        return self.due_view if self.btn_today.isChecked() else self.tabWidget.currentWidget()
+
+    #une seule vue affichée : résultats de recherche, vue Aujourd'hui / Urgent ou onglets
+    def update_views(self):
+        searching = bool(self.edit_search.text())
+        today = self.btn_today.isChecked() and not searching
+        self.lw_results.setVisible(searching)
+        self.due_view.setVisible(today)
+        self.tabWidget.setVisible(not (searching or today))
+
+    def today_toggled(self, checked):
+        if checked and self.due_view.loaded: self.due_view.update_data()#la date du jour a pu changer
+        elif checked: self.due_view.load()
+        self.update_views()
+
+    @metrics.timed("ui.sort_changed")
+    def sort_changed(self, index):
+        self.sort_mode = self.combo_sort.itemData(index)
+        for i in range(self.tabWidget.count()): self.tabWidget.widget(i).set_mode(self.sort_mode)
+        self.config["sort"] = self.sort_mode
+        dump_config(self.config)
        
     
     def tray_icon_clicked(self):
@@ -125,24 +221,126 @@ class MainWindow(QWidget):
 
     def add_folder(self):
         name, result = InputText("Entrez le nom du nouveau dossier").get()
-        if name and result:
-            self.tabWidget.addTab(TabView(name, {}), name)
-            self.tasks[name] = {}
-            self.dump()
+        if name and result and not name in self.tasks:
+            self.store.add_folder(name)
 
     def folder_double_clicked(self):
         current = self.tabWidget.currentWidget()
         new_name, result = InputText("Entrez le nouveau nom du dossier :", "Confirmer").get(current.folder)
-        if new_name and result:
-            change_folder_name(current.folder, new_name)
-            current.folder = new_name
-            self.tabWidget.setTabText(self.tabWidget.indexOf(current), new_name)
-            self.load_tasks()
+        if new_name and result and not new_name in self.tasks:
+            self.store.rename_folder(current.folder, new_name)
+
+    #les onglets suivent les dossiers du store, y compris ceux modifiés par un autre processus
+    def store_changed(self, event, *args):
+        if event == "folder_added" and self.folder_tab(args[0]) is None:
+            self.tabWidget.addTab(TabView(args[0], self.store, self.sort_mode), args[0])
+        elif event == "folder_renamed" and self.folder_tab(args[0]) is not None:
+            tab = self.folder_tab(args[0])
+            tab.folder = args[1]
+            self.tabWidget.setTabText(self.tabWidget.indexOf(tab), args[1])
+        elif event == "folder_removed" and self.folder_tab(args[0]) is not None:
+            tab = self.folder_tab(args[0])
+            self.tabWidget.removeTab(self.tabWidget.indexOf(tab))
+            tab.release()
+            tab.deleteLater()
+
+    def folder_tab(self, folder):
+        for i in range(self.tabWidget.count()):
+            if self.tabWidget.widget(i).folder == folder: return self.tabWidget.widget(i)
+        return None
+
+    @metrics.timed("ui.search")
+    def search(self, text):
+        if self.search_index is None:
+            self.search_index = SearchIndex()
+            self.search_index.load(self.store, self.config.get("search_cache", True))
+        self.lw_results.clear()
+        for kind, folder, name in self.search_index.search(text):
+            item = QListWidgetItem(folder+" / "+name+(" (historique)" if kind == HISTORY else ""))
+            item.setData(Qt.UserRole, (kind, folder, name))
+            if kind == HISTORY: item.setForeground(Qt.gray)
+            self.lw_results.addItem(item)
+        self.update_views()
+
+    def search_result_clicked(self, item):
+        kind, folder, name = item.data(Qt.UserRole)
+        tab = self.folder_tab(folder)
+        if kind == HISTORY or tab is None: return
+        self.edit_search.clear()
+        self.btn_today.setChecked(False)
+        self.tabWidget.setCurrentWidget(tab)
+        tab.select(name)
+
+    def show_stats(self):
+        self.stats = StatsDialog(self.store, self)
+        self.stats.show()
+
+    def show_debug_panel(self):
+        self.debug_panel = DebugPanel(self)
+        self.debug_panel.show()
+
+    def show_notifications(self, tasks):
+        self.popup = PopupNotification(tasks, self)
+        self.popup.show()
 
 #core functions
+    def setup_notifications(self):
+        self.scheduler = DeadlineScheduler(self.store, self.show_notifications, self)
+        if self.config.get("notifications", True): QTimer.singleShot(0, self.scheduler.start)
+
+    def setup_archiving(self):
+        self.archiver = ArchiveScheduler(self.store, self.config.get("auto_clean_age", 0), self)
+        if self.config.get("auto_clean", False): self.archiver.start()
+
+    #une sauvegarde par jour au plus, dans un thread : elle ne lit que les fichiers ou tasks.db, sous verrou
+    def setup_backups(self):
+        if self.config.get("backups", True):
+            threading.Thread(target=backup_if_needed, name="backup", daemon=True).start()
+
+    #synchronisation avec le serveur sync_url de la configuration, voir api/sync.py
+    def setup_sync(self):
+        self.syncer = None
+        if self.config.get("sync_url"):
+            self.syncer = SyncScheduler(SyncClient(self.store, self.config["sync_url"]), self)
+            self.syncer.failed.connect(self.sync_failed)
+            self.syncer.start()
+
+    #prévenir une fois, pas à chaque nouvel essai tant que le serveur est injoignable
+    def sync_failed(self, message):
+        if self.syncer.failures == 1: self.tray.showMessage("Synchronisation impossible", message, QSystemTrayIcon.Warning)
+
+    def setup_watcher(self):
+        self.store.subscribe(self.store_changed)
+        self.watcher = StoreWatcher(self.store, TASKS_DIR, self)
+        if isinstance(self.store.storage, RemoteStorage):#le démon envoie les modifications, rien à relire
+            self.writer_signals = WriterSignals(self)
+            self.store.storage.subscribe(self.writer_signals.storage_event)
+            self.writer_signals.changes.connect(self.store.apply_changes)
+            self.writer_signals.failed.connect(self.write_failed)
+            self.writer_signals.closed.connect(self.daemon_closed)
+            self.store.storage.subscribe_changes()
+            return
+        if self.config.get("watch", True): self.watcher.start()
+        if isinstance(self.store.storage, ThreadedStorage):
+            self.writer_signals = WriterSignals(self)
+            self.store.storage.subscribe(self.writer_signals.storage_event)
+            self.writer_signals.external.connect(self.store.sync)
+            self.writer_signals.failed.connect(self.write_failed)
+
+    def write_failed(self, message):
+        self.tray.showMessage("Erreur d'enregistrement", message, QSystemTrayIcon.Warning)
+
+    def daemon_closed(self):
+        self.tray.showMessage("Démon arrêté", "Les modifications ne sont plus enregistrées, relancer l'application.", QSystemTrayIcon.Warning)
+
     def dump(self):
-        tasks = {folder:{name:self.tasks[folder][name].achieved for name in self.tasks[folder]} for folder in self.tasks}
-        dump_tasks(tasks)
+        self.save_timer.stop()
+        self.store.flush()
+        self.store.storage.wait()
+
+    def save_search_index(self):
+        if self.search_index is not None and self.config.get("search_cache", True):
+            self.search_index.save(index_filepath())
 
     def add_to_startup(self):#lancer l'application au au démarrage
         if getattr(sys, "frozen", False):
@@ -150,12 +348,13 @@ class MainWindow(QWidget):
             app_path = QCoreApplication.applicationFilePath()
             app_path = app_path.replace("/", "\\")
             setting.setValue("PyTasks", app_path)
+    #l'archivage des tâches terminées se fait en cours de route (voir archiving.py), pas ici
     def exit(self):
-        try:
-            self.hide()
-            if self.config["auto_clean"]: self.clean_done_tasks()
-        finally:
-            self.close()
+        self.hide()
+        self.dump()
+        if self.syncer is not None: self.syncer.close()
+        self.save_search_index()
+        self.close()
         
 
         
@@ -0,0 +1,74 @@
+from datetime import date, datetime, time
+
+from PyQt5.QtCore import QObject, QTimer
+
+from .api.deadlines import DeadlineIndex
+
+
+#un QTimer ne dépasse pas 2**31-1 ms (~24 jours) ; on se réarme chaque jour pour rattraper
+#une mise en veille ou un changement d'heure, le délai étant calculé sur l'heure murale
+MAX_TIMER_INTERVAL = 24*3600*1000 #ms
+
+
+#un seul QTimer armé sur la prochaine échéance, l'index est tenu à jour par le store
+class DeadlineScheduler(QObject):
+    def __init__(self, store, on_due, parent = None):
+        super().__init__(parent)
+        self.store = store
+        self.on_due = on_due
+        self.index = DeadlineIndex()
+        self.armed_date = None
+        self.newly_due = []
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.timeout)
+
+    def start(self):
+        self.index.build(self.store.iter_records())
+        self.store.subscribe(self.store_changed)
+        self.check()
+
+    def stop(self):
+        self.store.unsubscribe(self.store_changed)
+        self.timer.stop()
+
+    #un minuteur qui se déclenche trop tôt se contente de se réarmer, il suffit donc
+    #d'avancer l'échéance quand une tâche arrive avant elle. Une tâche qui devient due
+    #(date passée, aujourd'hui ou tâche rouverte) est signalée tout de suite, une seule fois
+    def store_changed(self, event, *args):
+        if event in ("added", "changed", "renamed", "moved"):
+            task = args[0]
+            folder, name = task.folder, task.name
+            if event == "renamed": name = args[1]
+            elif event == "moved": folder = args[1]
+            previous = self.index.date_of(folder, name)
+        self.index.store_changed(event, *args)
+        if event in ("added", "changed", "renamed", "moved") and task.date and not task.achieved:
+            today = date.today().toordinal()
+            if task.date > today:
+                if self.armed_date is None or task.date < self.armed_date: self.arm(task.date)
+            elif task.date != previous:
+                if not self.newly_due: QTimer.singleShot(0, self.notify_newly_due)
+                self.newly_due.append((task.folder, task.name, task.date))
+
+    #regroupe les tâches devenues dues pendant un lot de modifications en une notification
+    def notify_newly_due(self):
+        due, self.newly_due = self.newly_due, []
+        if due: self.on_due(sorted(due, key=lambda task: task[2]))
+
+    def check(self):
+        due = self.index.due(date.today().toordinal())
+        if due: self.on_due(due)
+        self.arm(self.index.next_date(date.today().toordinal()))
+
+    def timeout(self):
+        if self.armed_date is not None and self.armed_date <= date.today().toordinal(): self.check()
+        else: self.arm(self.index.next_date(date.today().toordinal()))
+
+    def arm(self, ordinal):
+        self.armed_date = ordinal
+        if ordinal is None:
+            self.timer.stop()
+            return
+        delay = datetime.combine(date.fromordinal(ordinal), time()) - datetime.now()
+        self.timer.start(max(0, min(int(delay.total_seconds()*1000), MAX_TIMER_INTERVAL)))
@@ -0,0 +1,25 @@
+from PyQt5.QtGui import QIcon
+
+
+#les ressources de fbs ne sont résolues qu'une fois, à la première utilisation,
+#à partir du contexte transmis à MainWindow
+class ResourceCache:
+    def __init__(self):
+        self.ctx = None
+        self.icons = {}
+        self.texts = {}
+
+    def set_context(self, ctx):
+        self.ctx = ctx
+
+    def icon(self, name)->QIcon:
+        if not name in self.icons: self.icons[name] = QIcon(self.ctx.get_resource(name))
+        return self.icons[name]
+
+    def text(self, name)->str:
+        if not name in self.texts:
+            with open(self.ctx.get_resource(name), "r") as f:
+                self.texts[name] = f.read()
+        return self.texts[name]
+
+resources = ResourceCache()
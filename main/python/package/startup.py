@@ -0,0 +1,24 @@
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+#durée de chaque étape du démarrage : import, data load, widget build, first paint
+started = time.perf_counter()
+steps = []
+
+def start(timestamp = None):
+    global started
+    started = timestamp if timestamp is not None else time.perf_counter()
+    steps.clear()
+
+def mark(step):
+    steps.append((step, time.perf_counter()))
+
+def report():
+    previous = started
+    for step, timestamp in steps:
+        logger.info("startup %-12s %7.1f ms", step, (timestamp-previous)*1000)
+        previous = timestamp
+    logger.info("startup %-12s %7.1f ms", "total", (previous-started)*1000)
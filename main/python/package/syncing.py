@@ -0,0 +1,80 @@
+import threading
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from .api import metrics
+
+
+SYNC_INTERVAL = 60*1000 #ms entre deux synchronisations
+PUSH_DELAY = 2*1000 #ms après une modification locale avant de l'envoyer
+
+
+#synchronise le store avec le serveur : les échanges réseau se font dans un thread,
+#les versions reçues sont appliquées au store dans le thread de l'interface
+class SyncScheduler(QObject):
+    received = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, client, parent = None):
+        super().__init__(parent)
+        self.client = client
+        self.running = False
+        self.again = False #modification locale pendant un échange
+        self.failures = 0 #échecs depuis la dernière synchronisation réussie
+        self.timer = QTimer(self)
+        self.timer.setInterval(SYNC_INTERVAL)
+        self.timer.timeout.connect(self.sync)
+        self.push_timer = QTimer(self)
+        self.push_timer.setSingleShot(True)
+        self.push_timer.setInterval(PUSH_DELAY)
+        self.push_timer.timeout.connect(self.sync)
+        self.received.connect(self.apply)
+        self.failed.connect(self.exchange_failed)
+
+    def start(self):
+        self.client.track()
+        self.client.store.subscribe(self.store_changed)
+        self.timer.start()
+        self.sync()
+
+    def stop(self):
+        self.client.store.unsubscribe(self.store_changed)
+        self.timer.stop()
+        self.push_timer.stop()
+
+    #à la fermeture de l'application : un échange en cours n'est plus appliqué
+    def close(self):
+        self.stop()
+        self.received.disconnect(self.apply)
+        self.client.close()
+
+    def store_changed(self, event, *args):
+        if not self.client.applying and event != "history_added": self.push_timer.start()
+
+    def sync(self):
+        if self.running:
+            self.again = True
+            return
+        self.running = True
+        threading.Thread(target=self.exchange, name="sync", daemon=True).start()
+
+    def exchange(self):
+        try:
+            self.received.emit(self.client.exchange())
+        except Exception as e:#quel que soit l'échec, running doit être remis à False par exchange_failed
+            self.failed.emit(type(e).__name__+": "+str(e))
+
+    ##triggered
+    def apply(self, result):
+        self.running = False
+        self.failures = 0
+        self.client.apply(*result)
+        if self.again:
+            self.again = False
+            self.sync()
+
+    def exchange_failed(self, message):
+        self.running = False
+        self.again = False
+        self.failures += 1
+        metrics.count("sync.errors")
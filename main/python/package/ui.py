@@ -1,10 +1,13 @@
-from typing import overload
-from PyQt5.QtWidgets import QAction, QCalendarWidget, QCheckBox, QComboBox, QDialog, QInputDialog, QLabel, QLineEdit, QMenu, QMessageBox, QPushButton, QShortcut, QStyle, QVBoxLayout, QHBoxLayout, QWidget, QListWidget, QListWidgetItem, QTabWidget
-from PyQt5.QtCore import QCalendar, QModelIndex, Qt
-from PyQt5.QtGui import QColor, QContextMenuEvent, QIcon, QKeySequence, QMouseEvent
-from fbs_runtime.application_context.PyQt5 import ApplicationContext
+from datetime import date
+from PyQt5.QtWidgets import QApplication, QCalendarWidget, QCheckBox, QComboBox, QDialog, QFileDialog, QLabel, QLineEdit, QListView, QMenu, QMessageBox, QPlainTextEdit, QPushButton, QSpinBox, QTableWidget, QTableWidgetItem, QVBoxLayout, QHBoxLayout, QWidget, QListWidget
+from PyQt5.QtCore import QAbstractListModel, QDate, QModelIndex, Qt
+from PyQt5.QtGui import QBrush, QColor, QContextMenuEvent, QFontDatabase, QTextCharFormat
 
-from .api.tasks import Task, add_tasks_to_history, delete_tasks, load_tasks
+from .api import metrics
+from .api.recurrence import DAY as REPEAT_DAY, MONTH as REPEAT_MONTH, WEEK as REPEAT_WEEK, MAX_INTERVAL, anchored_rule, format_rule, occurrences_between, parse_rule, rule_anchor
+from .api.rollups import DAY, WEEK, last_periods
+from .api.sorting import DATE, MANUAL, NAME, PRIORITY, STATUS, SortedRows, is_due_or_urgent
+from .resources import resources
 
 
 
@@ -14,54 +17,253 @@ COLORS = {False:(219, 45, 114), True:(255, 255, 255)}
 BLACK = QColor(*(0,0,0))
 WHITE = QColor(*(255,255,255))
 BLUE = (44, 140, 240)
+BLACK_BRUSH = QBrush(BLACK)
+WHITE_BRUSH = QBrush(WHITE)
 
-ICON_CHECKED = QIcon(ApplicationContext().get_resource("checked.png"))
-ICON_FOLDER = QIcon(ApplicationContext().get_resource("folder.png"))
-ICON_BOARD = QIcon(ApplicationContext().get_resource("board.png"))
-ICON_QUIT = QIcon(ApplicationContext().get_resource("remove.png"))
+ICON_CHECKED = "checked.png"
+ICON_FOLDER = "folder.png"
+ICON_BOARD = "board.png"
+ICON_QUIT = "remove.png"
 
 BUTTON_OK_STYLE = f"background-color: rgb{str(BLUE)}; color:white; border-radius: 3%;"
 
+SORT_LABELS = {MANUAL:"Ordre d'ajout", PRIORITY:"Priorité", DATE:"Échéance", STATUS:"État", NAME:"Nom"}
+PRIORITY_LABELS = ["Normal", "Urgent", "Très urgent"]
+REPEAT_LABELS = {None:"Ne se répète pas", REPEAT_DAY:"jour(s)", REPEAT_WEEK:"semaine(s)", REPEAT_MONTH:"mois"}
+REPEAT_MARK = " ↻"
+PERIOD_LABELS = {DAY:"Par jour", WEEK:"Par semaine"}
+PERIOD_COUNTS = {DAY:30, WEEK:12} #périodes affichées par les statistiques
 
-class TaskItem(QListWidgetItem):
-    def __init__(self, name, achieved=False):
-        super().__init__(name)
-        self.name = name
-        self.achieved = achieved
-        self.setBackground(WHITE)
-        self.setForeground(Qt.black)
-        self.set_icon() 
-        
-    def set_icon(self):
-        if self.achieved:
-            self.setIcon(ICON_CHECKED)
+FETCH_SIZE = 200 #lignes ajoutées à la vue à chaque fetchMore
+
+JULIAN_DAY_OFFSET = 1721425 #QDate(1, 1, 1).toJulianDay() - date(1, 1, 1).toordinal()
+
+
+#les Task stockent leur date sous forme d'ordinal, 0 pour une tâche sans date
+def ordinal_to_qdate(ordinal: int)->QDate:
+    if ordinal > 0: return QDate.fromJulianDay(ordinal+JULIAN_DAY_OFFSET)
+    return QDate()
+
+def qdate_to_ordinal(qdate: QDate)->int:
+    if qdate.isValid(): return qdate.toJulianDay()-JULIAN_DAY_OFFSET
+    return 0
+
+
+#une ligne par tâche du dossier, mise à jour par les notifications du TaskStore
+#les lignes restent triées selon mode : une modification ne déplace qu'une ligne
+#la vue ne connaît que les fetched premières lignes, elle en demande d'autres (fetchMore)
+#quand on fait défiler la liste : son coût suit la partie affichée, pas la taille du dossier
+class TaskListModel(QAbstractListModel):
+    def __init__(self, folder, store, mode = MANUAL, parent = None):
+        super().__init__(parent)
+        self.folder = folder
+        self.store = store
+        self.icons = {True:resources.icon(ICON_CHECKED), False:resources.icon(ICON_BOARD)}
+        self.rows = SortedRows(mode)
+        self.rows.build(self.source())
+        self.fetched = min(FETCH_SIZE, len(self.rows))
+        store.subscribe(self.store_changed, batched=True)
+
+    def rowCount(self, parent = QModelIndex()):
+        if parent.isValid(): return 0
+        return self.fetched
+
+    def canFetchMore(self, parent = QModelIndex()):
+        return not parent.isValid() and self.fetched < len(self.rows)
+
+    def fetchMore(self, parent = QModelIndex()):
+        if not parent.isValid(): self.fetch_to(self.fetched+FETCH_SIZE)
+
+    def fetch_to(self, count):
+        count = min(count, len(self.rows))
+        if count > self.fetched:
+            metrics.count("ui.rows_fetched", count-self.fetched)
+            self.beginInsertRows(QModelIndex(), self.fetched, count-1)
+            self.fetched = count
+            self.endInsertRows()
+
+    def data(self, index, role = Qt.DisplayRole):
+        if not role in (Qt.DisplayRole, Qt.DecorationRole, Qt.BackgroundRole, Qt.ForegroundRole): return None
+        task = self.task(index) if index.isValid() else None
+        if task is None: return None#tâche déjà retirée du store, la ligne va disparaître
+        if role == Qt.DisplayRole: return self.label(task)+REPEAT_MARK if task.repeat else self.label(task)
+        if role == Qt.DecorationRole: return self.icons[bool(task.achieved)]
+        if role == Qt.BackgroundRole: return WHITE_BRUSH
+        return BLACK_BRUSH
+
+    ##tâches affichées
+    def source(self):
+        return self.store.folder(self.folder).values()
+
+    def accepts(self, task)->bool:
+        return task.folder == self.folder
+
+    def label(self, task)->str:
+        return task.name
+
+    def task(self, index):
+        return self.row_task(self.rows.rows[index.row()])
+
+    def row_task(self, row):
+        folder, name = row
+        return self.store.tasks.get(folder, {}).get(name)
+
+    #toutes les tâches du modèle, y compris celles que la vue n'a pas encore demandées
+    def tasks(self):
+        return [task for task in map(self.row_task, self.rows.rows) if task is not None]
+
+    def task_index(self, folder, name)->QModelIndex:
+        if (folder, name) in self.rows:
+            i = self.rows.index((folder, name))
+            self.fetch_to(i+1)
+            return self.index(i)
+        return QModelIndex()
+
+    @metrics.timed("ui.model_reset")
+    def reset(self):
+        self.beginResetModel()
+        self.rows.build(self.source())
+        self.fetched = min(max(self.fetched, FETCH_SIZE), len(self.rows))
+        self.endResetModel()
+
+    def set_mode(self, mode):
+        if mode != self.rows.mode:
+            self.rows.mode = mode
+            self.reset()
+
+    ##notifications du store
+    def store_changed(self, event, *args):
+        if event in ("added", "changed"): self.task_changed(args[0])
+        elif event == "removed": self.remove_row((args[0], args[1]))
+        elif event == "renamed": self.task_changed(args[0], (args[0].folder, args[1]))
+        elif event == "moved": self.task_changed(args[0], (args[1], args[0].name))
+        elif event == "folder_renamed": self.folder_renamed(*args)
+        elif event == "batch": self.batch_changed(args[0])
+
+    #au-delà d'une ligne touchée, une seule reconstruction plutôt qu'un signal par ligne
+    def batch_changed(self, events):
+        for event, args in events:
+            if event == "folder_renamed" and self.folder == args[0]: self.folder = args[1]
+        changes = [(event, args) for event, args in events if self.concerns(event, args)]
+        if len(changes) > 1: self.reset()
         else:
-            self.setIcon(ICON_BOARD)
-            #self.setForeground(WHITE)
+            for event, args in changes: self.store_changed(event, *args)
+
+    def concerns(self, event, args)->bool:
+        if event in ("added", "changed"): return self.accepts(args[0]) or (args[0].folder, args[0].name) in self.rows
+        if event == "removed": return (args[0], args[1]) in self.rows
+        if event == "renamed": return self.accepts(args[0]) or (args[0].folder, args[1]) in self.rows
+        if event == "moved": return self.accepts(args[0]) or (args[1], args[0].name) in self.rows
+        if event == "folder_renamed": return any(folder == args[0] for folder, _ in self.rows.rows)
+        return False
+
+    #row : ligne de la tâche avant la modification
+    def task_changed(self, task, row = None):
+        row = row or (task.folder, task.name)
+        if row in self.rows:
+            if self.accepts(task): self.move_row(row, task)
+            else: self.remove_row(row)
+        elif self.accepts(task): self.insert_row(task)
+
+    def folder_renamed(self, old_name, new_name):
+        if self.folder == old_name: self.folder = new_name
+        if any(folder == old_name for folder, _ in self.rows.rows): self.reset()
+
+    #seules les lignes déjà transmises à la vue (i < fetched) sont signalées,
+    #les autres lui parviendront au prochain fetchMore
+    def visible(self, i)->bool:
+        return i < self.fetched or self.fetched == len(self.rows)
+
+    def insert_row(self, task):
+        metrics.count("ui.row_updates")
+        row = self.rows.position(task)
+        if not self.visible(row):
+            self.rows.insert(task)
+            return
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.rows.insert(task)
+        self.fetched += 1
+        self.endInsertRows()
+
+    def remove_row(self, row):
+        if row in self.rows:
+            metrics.count("ui.row_updates")
+            i = self.rows.index(row)
+            if i >= self.fetched:
+                self.rows.pop(row)
+                return
+            self.beginRemoveRows(QModelIndex(), i, i)
+            self.rows.pop(row)
+            self.fetched -= 1
+            self.endRemoveRows()
+
+    def move_row(self, row, task):
+        metrics.count("ui.row_updates")
+        i, j = self.rows.index(row), self.rows.target(row, task)
+        if i >= self.fetched and j >= self.fetched: self.rows.reposition(row, task)
+        elif j >= self.fetched:#la ligne sort de la partie affichée
+            self.beginRemoveRows(QModelIndex(), i, i)
+            self.rows.reposition(row, task)
+            self.fetched -= 1
+            self.endRemoveRows()
+        elif i >= self.fetched:#elle y entre
+            self.beginInsertRows(QModelIndex(), j, j)
+            self.rows.reposition(row, task)
+            self.fetched += 1
+            self.endInsertRows()
+        else:
+            moved = i != j and self.beginMoveRows(QModelIndex(), i, i, QModelIndex(), j+1 if j > i else j)
+            self.rows.reposition(row, task)
+            if moved: self.endMoveRows()
+            index = self.index(j)
+            self.dataChanged.emit(index, index)
+
+#tâches non terminées de tous les dossiers, en retard, du jour ou urgentes
+class DueTaskModel(TaskListModel):
+    def __init__(self, store, mode = DATE, parent = None):
+        self.today = date.today().toordinal()
+        super().__init__(None, store, mode, parent)
+
+    def source(self):
+        return [task for tasks in self.store.load_all().values() for task in tasks.values() if self.accepts(task)]
 
-    def switch_status(self):
-        self.achieved = not self.achieved
-        self.set_icon()
+    def accepts(self, task)->bool:
+        return is_due_or_urgent(task, self.today)
 
-    def __str__(self):
-        return self.name
+    def label(self, task)->str:
+        return task.folder+" / "+task.name
 
-class CustomListWidget(QListWidget):
+    def reset(self):
+        self.today = date.today().toordinal()
+        super().reset()
+
+class CustomListView(QListView):
     def contextMenuEvent(self, e: QContextMenuEvent) -> None:
         menu = QMenu(self)
         details = menu.addAction("Détails")
         delete = menu.addAction("Supprimer")
+        move_menu = menu.addMenu("Déplacer vers")
+        moves = {move_menu.addAction(folder):folder for folder in self.folders()}
         action = menu.exec(e.globalPos())
         if action == details: self.launchDialog()
         if action == delete: self.delete()
+        if action in moves: self.move(moves[action])
 
+#onglet vide tant qu'il n'a pas été affiché, load() construit la liste
 class TabView(QWidget):
-    def __init__(self, folder, tasks):
+    def __init__(self, folder, store, mode = MANUAL):
         super().__init__()
-        self.tasks = tasks
+        self.store = store
         self.folder = folder
-        self.setup_ui()
+        self.mode = mode
+        self.loaded = False
     
+    @metrics.timed("ui.tab_load")
+    def load(self):
+        if not self.loaded:
+            self.setup_ui()
+            self.loaded = True
+
 #ui functions 
     def setup_ui(self):
         self.create_widgets()
@@ -71,15 +273,19 @@ class TabView(QWidget):
         self.setup_connections()
 
     def create_widgets(self):
-        self.lw_tasks = CustomListWidget()
-        for task in self.tasks.values(): 
-            self.lw_tasks.addItem(TaskItem(task.name, task.achieved))
+        self.model = self.create_model()
+        self.lw_tasks = CustomListView()
+        self.lw_tasks.setModel(self.model)
 
     def modify_widgets(self):
         self.lw_tasks.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.lw_tasks.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.lw_tasks.launchDialog = self.launchDialog
         self.lw_tasks.delete = self.delete_selected_item
+        self.lw_tasks.move = self.move_selected_items
+        self.lw_tasks.folders = self.other_folders
+        self.lw_tasks.setSelectionMode(QListView.ExtendedSelection)
+        self.lw_tasks.setUniformItemSizes(True)#une ligne mesurée pour toutes
         
 
 
@@ -94,48 +300,74 @@ class TabView(QWidget):
         
 #core functions
 ##data
+    def create_model(self):
+        return TaskListModel(self.folder, self.store, self.mode, self)
+
     def update_data(self):
-        self.lw_tasks.clear()
-        tasks = load_tasks()[self.folder]
-        for task in tasks.values(): self.lw_tasks.addItem(TaskItem(task.name, task.achieved))
-        self.tasks = tasks
-    
-    
-    def addTask(self, task):
-        if not task.name in self.tasks:
-            self.tasks[task.name]=task
-            self.lw_tasks.addItem(TaskItem(task.name, task.achieved))
+        if self.loaded: self.model.reset()
+
+    def set_mode(self, mode):
+        self.mode = mode
+        if self.loaded: self.model.set_mode(mode)
+
+    def release(self):
+        if self.loaded: self.store.unsubscribe(self.model.store_changed)
     
+    def select(self, name, folder = None):
+        self.load()
+        index = self.model.task_index(folder or self.folder, name)
+        if index.isValid():
+            self.lw_tasks.setCurrentIndex(index)
+            self.lw_tasks.scrollTo(index)
+
+    @metrics.timed("ui.clean_done_tasks")
     def clean_done_tasks(self):
-        cleanable_tasks = []
-        for i in range(self.lw_tasks.count()):
-           item = self.lw_tasks.item(i)
-           if item.achieved: cleanable_tasks.append([self.folder, item.name])
-        delete_tasks(cleanable_tasks)
-        add_tasks_to_history(cleanable_tasks)
+        cleanable_tasks = [(task.folder, task.name) for task in self.model.tasks() if task.achieved]
+        with self.store.batch():
+            self.store.remove_tasks(cleanable_tasks)
+            self.store.add_to_history(cleanable_tasks)
+
+    def other_folders(self):
+        return [folder for folder in self.store.tasks if folder != self.folder]
 ##triggered  
+    @metrics.timed("ui.task_clicked")
     def lw_tasks_clicked(self, index):
-        self.tasks[index.data()].switch_status()
-        self.lw_tasks.currentItem().switch_status()
+        if QApplication.keyboardModifiers() != Qt.NoModifier: return#ctrl/maj : sélection multiple
+        self.model.task(index).switch_status()
     
+    def selected_tasks(self):
+        return [task for task in map(self.model.task, self.lw_tasks.selectedIndexes()) if task is not None]
+
+    @metrics.timed("ui.delete_selected")
     def delete_selected_item(self):
-        items = self.lw_tasks.selectedItems()
-        for item in items:
-            self.tasks[item.name].delete()
-            self.tasks.pop(item.name)
-            self.update_data()
+        self.store.remove_tasks([(task.folder, task.name) for task in self.selected_tasks()])
+
+    #une tâche du même nom dans le dossier d'arrivée serait écrasée : elle n'est pas déplacée
+    @metrics.timed("ui.move_selected")
+    def move_selected_items(self, folder):
+        tasks = self.store.folder(folder)
+        self.store.move_tasks([task for task in self.selected_tasks() if not task.name in tasks], folder)
         
     def launchDialog(self):
-        task_name = self.lw_tasks.currentItem().name
-        details= TaskDetails(self.tasks[task_name], self)
+        index = self.lw_tasks.currentIndex()
+        if not index.isValid(): return
+        task = self.model.task(index)
+        details= TaskDetails(task, self)
         data, result = details.get()
         if data and result:
-            if not data["name"] in self.tasks or data["name"] == task_name:
-                self.tasks[task_name].update(data)
-                self.update_data()
+            if not data["name"] in self.store.folder(task.folder) or data["name"] == task.name:
+                task.update(data)
             else:
                 QMessageBox(QMessageBox.Icon(), "Impossible de sauvegarder les modifications", "Vous avez entré le nom d'une tâche qui existe déjà")
 
+#vue transversale "Aujourd'hui / Urgent", triée par échéance par défaut
+class DueTaskView(TabView):
+    def __init__(self, store, mode = DATE):
+        super().__init__(None, store, mode)
+
+    def create_model(self):
+        return DueTaskModel(self.store, self.mode, self)
+
 
 
 class InputText(QDialog):
@@ -218,12 +450,15 @@ class TaskDetails(QDialog):
         self.btn_save = QPushButton("Enregistrer")
         self.btn_quit = QPushButton("Quitter")
         self.combo_priority = QComboBox()
+        self.spin_every = QSpinBox()
+        self.combo_repeat = QComboBox()
         
 
 
     def create_layouts(self):
         self.main_layout = QVBoxLayout(self)
         self.upper_layout = QHBoxLayout()
+        self.repeat_layout = QHBoxLayout()
         self.button_layout = QHBoxLayout()
         
         
@@ -232,6 +467,10 @@ class TaskDetails(QDialog):
         self.upper_layout.addWidget(self.combo_priority)
         self.main_layout.addLayout(self.upper_layout)
         self.main_layout.addWidget(self.calendar_wgt)
+        self.repeat_layout.addWidget(self.spin_every)
+        self.repeat_layout.addWidget(self.combo_repeat)
+        self.repeat_layout.addStretch()
+        self.main_layout.addLayout(self.repeat_layout)
         
         self.button_layout.addStretch()
         self.main_layout.addLayout(self.button_layout)
@@ -242,21 +481,54 @@ class TaskDetails(QDialog):
     def setup_connections(self):
         self.btn_save.clicked.connect(self.save)
         self.btn_quit.clicked.connect(self.reject)
+        self.calendar_wgt.currentPageChanged.connect(self.show_occurrences)
+        self.calendar_wgt.selectionChanged.connect(self.show_occurrences)
+        self.combo_repeat.currentIndexChanged.connect(self.show_occurrences)
+        self.spin_every.valueChanged.connect(self.show_occurrences)
         
     def modify_widgets(self):
         self.btn_save.setStyleSheet(BUTTON_OK_STYLE+"padding:12px")
         self.btn_save.setFlat(True)
         self.btn_quit.setFlat(True)
 
-        self.combo_priority.addItem("Normal")
-        self.combo_priority.addItem("Urgent")
-        self.combo_priority.addItem("Très urgent")
+        for priority, label in enumerate(PRIORITY_LABELS): self.combo_priority.addItem(label, priority)
+        self.combo_priority.setCurrentIndex(min(self.task.priority or 0, len(PRIORITY_LABELS)-1))
+        if self.task.date: self.calendar_wgt.setSelectedDate(ordinal_to_qdate(self.task.date))
+        for unit, label in REPEAT_LABELS.items(): self.combo_repeat.addItem(label, unit)
+        self.spin_every.setRange(1, MAX_INTERVAL)
+        self.spin_every.setPrefix("Tous les ")
+        every, unit = parse_rule(self.task.repeat) if self.task.repeat else (1, None)
+        self.spin_every.setValue(every)
+        self.combo_repeat.setCurrentIndex(self.combo_repeat.findData(unit))
+        self.show_occurrences()
+
+    #le jour visé par une règle mensuelle est gardé tant que la date reste la fin d'un mois plus court
+    def rule(self):
+        unit = self.combo_repeat.currentData()
+        if not unit: return None
+        rule = format_rule(self.spin_every.value(), unit, rule_anchor(self.task.repeat) if self.task.repeat else None)
+        start = qdate_to_ordinal(self.calendar_wgt.selectedDate())
+        return anchored_rule(rule, start) if start else rule
     
     ##triggered
+    #seules les occurrences du mois affiché sont calculées
+    def show_occurrences(self):
+        rule = self.rule()
+        self.spin_every.setEnabled(rule is not None)
+        self.calendar_wgt.setDateTextFormat(QDate(), QTextCharFormat())
+        start = qdate_to_ordinal(self.calendar_wgt.selectedDate())
+        if rule is None or not start: return
+        page = QDate(self.calendar_wgt.yearShown(), self.calendar_wgt.monthShown(), 1)
+        highlight = QTextCharFormat()
+        highlight.setBackground(QColor(*BLUE).lighter(170))
+        for ordinal in occurrences_between(start, rule, qdate_to_ordinal(page.addDays(-7)), qdate_to_ordinal(page.addMonths(1).addDays(14))):
+            self.calendar_wgt.setDateTextFormat(ordinal_to_qdate(ordinal), highlight)
+
     def save(self):
         self.data["name"] = self.edit.text()
-        self.data["date"] = self.calendar_wgt.selectedDate()
+        self.data["date"] = qdate_to_ordinal(self.calendar_wgt.selectedDate())
         self.data["priority"] = self.combo_priority.currentData()
+        self.data["repeat"] = self.rule()
         self.accept()
     
     def get(self):
@@ -264,26 +536,173 @@ class TaskDetails(QDialog):
         return [self.data, result]
         
 
+#tâches du jour et tâches en retard, tasks contient des tuples (dossier, nom, date)
 class PopupNotification(QDialog):
     def __init__(self, tasks, parent =  None):
         super().__init__(parent)
         self.tasks = tasks
+        self.setup_ui()
     
     def setup_ui(self):
-        self.create_layouts()
+        self.setWindowFlags(Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
+        self.setStyleSheet("background-color:white")
         self.create_widgets()
+        self.create_layouts()
         self.add_widgets_to_layouts()
+        self.setup_connections()
+        self.modify_widgets()
 
     def create_widgets(self):
-        self.btn_quit = QPushButton(ICON_QUIT)
+        self.btn_quit = QPushButton(resources.icon(ICON_QUIT), "")
         self.lbl = QLabel("Vos tâches pour aujourd'hui")
+        self.lbl_urgent = QLabel("En retard")
         self.lw_today_tasks = QListWidget()
         self.lw_urgent_tasks = QListWidget()
     
     def create_layouts(self):
-        pass
+        self.main_layout = QVBoxLayout(self)
+        self.header_layout = QHBoxLayout()
     
     def add_widgets_to_layouts(self):
-        pass
+        self.header_layout.addWidget(self.lbl)
+        self.header_layout.addStretch()
+        self.header_layout.addWidget(self.btn_quit)
+        self.main_layout.addLayout(self.header_layout)
+        self.main_layout.addWidget(self.lw_today_tasks)
+        self.main_layout.addWidget(self.lbl_urgent)
+        self.main_layout.addWidget(self.lw_urgent_tasks)
+
+    def setup_connections(self):
+        self.btn_quit.clicked.connect(self.close)
+
+    def modify_widgets(self):
+        self.btn_quit.setFlat(True)
+        today = date.today().toordinal()
+        for folder, name, day in self.tasks:
+            if day < today: self.lw_urgent_tasks.addItem(folder+" / "+name)
+            else: self.lw_today_tasks.addItem(folder+" / "+name)
+        self.lbl_urgent.setVisible(self.lw_urgent_tasks.count() > 0)
+        self.lw_urgent_tasks.setVisible(self.lw_urgent_tasks.count() > 0)
+
 
+#mesures de api/metrics.py, ouvert par Ctrl+Maj+D depuis la fenêtre principale
+class DebugPanel(QDialog):
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self.setWindowTitle("Mesures")
+        self.setup_ui()
+        self.refresh()
 
+    def setup_ui(self):
+        self.create_widgets()
+        self.create_layouts()
+        self.add_widgets_to_layouts()
+        self.setup_connections()
+        self.modify_widgets()
+
+    def create_widgets(self):
+        self.edit_report = QPlainTextEdit()
+        self.cb_enabled = QCheckBox("Activer")
+        self.btn_refresh = QPushButton("Rafraîchir")
+        self.btn_reset = QPushButton("Réinitialiser")
+        self.btn_save = QPushButton("Enregistrer…")
+
+    def create_layouts(self):
+        self.main_layout = QVBoxLayout(self)
+        self.button_layout = QHBoxLayout()
+
+    def add_widgets_to_layouts(self):
+        self.main_layout.addWidget(self.edit_report)
+        self.main_layout.addLayout(self.button_layout)
+        self.button_layout.addWidget(self.cb_enabled)
+        self.button_layout.addStretch()
+        self.button_layout.addWidget(self.btn_refresh)
+        self.button_layout.addWidget(self.btn_reset)
+        self.button_layout.addWidget(self.btn_save)
+
+    def setup_connections(self):
+        self.cb_enabled.toggled.connect(self.enable)
+        self.btn_refresh.clicked.connect(self.refresh)
+        self.btn_reset.clicked.connect(self.reset)
+        self.btn_save.clicked.connect(self.save)
+
+    def modify_widgets(self):
+        self.edit_report.setReadOnly(True)
+        self.edit_report.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.edit_report.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.cb_enabled.setChecked(metrics.enabled)
+        self.resize(640, 420)
+
+    ##triggered
+    def enable(self, checked):
+        metrics.enable(checked)
+        self.refresh()
+
+    def refresh(self):
+        if metrics.enabled or metrics.counters or metrics.histograms: self.edit_report.setPlainText(metrics.report())
+        else: self.edit_report.setPlainText("Mesures désactivées")
+
+    def reset(self):
+        metrics.reset()
+        self.refresh()
+
+    def save(self):
+        filepath, _ = QFileDialog.getSaveFileName(self, "Enregistrer les mesures", "metrics.json", "JSON (*.json)")
+        if filepath: metrics.dump(filepath)
+
+
+#tâches archivées par période et par dossier, lues dans les rollups du store
+class StatsDialog(QDialog):
+    def __init__(self, store, parent = None):
+        super().__init__(parent)
+        self.store = store
+        self.setWindowTitle("Statistiques")
+        self.setup_ui()
+        self.refresh()
+
+    def setup_ui(self):
+        self.create_widgets()
+        self.create_layouts()
+        self.add_widgets_to_layouts()
+        self.setup_connections()
+        self.modify_widgets()
+
+    def create_widgets(self):
+        self.combo_period = QComboBox()
+        self.table = QTableWidget()
+
+    def create_layouts(self):
+        self.main_layout = QVBoxLayout(self)
+
+    def add_widgets_to_layouts(self):
+        self.main_layout.addWidget(self.combo_period)
+        self.main_layout.addWidget(self.table)
+
+    def setup_connections(self):
+        self.combo_period.currentIndexChanged.connect(self.refresh)
+
+    def modify_widgets(self):
+        for period, label in PERIOD_LABELS.items(): self.combo_period.addItem(label, period)
+        self.combo_period.setCurrentIndex(self.combo_period.findData(WEEK))
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.resize(560, 420)
+
+    ##triggered
+    #une ligne par période, de la plus récente à la plus ancienne, puis le total et un dossier par colonne
+    def refresh(self):
+        period = self.combo_period.currentData()
+        starts = last_periods(period, PERIOD_COUNTS[period])
+        counts = self.store.rollups().get(period, {})
+        totals = {folder:sum(counts[folder].get(start, 0) for start in starts) for folder in counts}
+        folders = sorted((folder for folder in totals if totals[folder]), key=lambda folder: (-totals[folder], folder))
+        rows = [[counts[folder].get(start, 0) for folder in folders] for start in starts]
+        best = max([sum(row) for row in rows]+[1])
+        self.table.clear()
+        self.table.setRowCount(len(starts))
+        self.table.setColumnCount(len(folders)+2)
+        self.table.setHorizontalHeaderLabels(["Total", ""]+folders)
+        self.table.setVerticalHeaderLabels(starts)
+        for i, row in enumerate(rows):
+            self.table.setItem(i, 0, QTableWidgetItem(str(sum(row))))
+            self.table.setItem(i, 1, QTableWidgetItem("▇"*round(10*sum(row)/best)))
+            for j, n in enumerate(row): self.table.setItem(i, j+2, QTableWidgetItem(str(n) if n else ""))
@@ -0,0 +1,57 @@
+import os
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal
+
+
+SYNC_DELAY = 200 #ms, une écriture produit plusieurs événements du système de fichiers
+
+
+#surveille le dossier des données et relit les tâches modifiées par un autre processus,
+#les fichiers remplacés par os.replace ne sont plus suivis et sont ajoutés à nouveau
+class StoreWatcher(QObject):
+    def __init__(self, store, directory, parent = None):
+        super().__init__(parent)
+        self.store = store
+        self.directory = directory
+        self.watcher = QFileSystemWatcher(self)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(SYNC_DELAY)
+        self.timer.timeout.connect(self.store.sync)
+        self.watcher.directoryChanged.connect(self.schedule)
+        self.watcher.fileChanged.connect(self.schedule)
+
+    def start(self):
+        self.watcher.addPath(self.directory)
+        self.watch_files()
+
+    def stop(self):
+        self.timer.stop()
+        paths = self.watcher.files()+self.watcher.directories()
+        if paths: self.watcher.removePaths(paths)
+
+    def watch_files(self):
+        watched = set(self.watcher.files())
+        paths = [path for path in self.store.storage.watched_files() if os.path.exists(path) and not path in watched]
+        if paths: self.watcher.addPaths(paths)
+
+    def schedule(self, path = ""):
+        self.watch_files()
+        self.timer.start()
+
+
+#relaie dans le thread de l'interface les événements du thread d'écriture (ThreadedStorage)
+#ou de la connexion au démon (RemoteStorage)
+class WriterSignals(QObject):
+    written = pyqtSignal(int)
+    failed = pyqtSignal(str)
+    external = pyqtSignal()
+    changes = pyqtSignal(object)
+    closed = pyqtSignal()
+
+    def storage_event(self, event, *args):
+        if event == "written": self.written.emit(args[0])
+        elif event == "failed": self.failed.emit(str(args[0]))
+        elif event == "external": self.external.emit()
+        elif event == "changes": self.changes.emit(args[0])#voir remote.py
+        elif event == "closed": self.closed.emit()
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))#main/python
+
+from package.api import tasks as api
+
+
+#~/.todo remplacé par un dossier temporaire
+@pytest.fixture
+def tasks_dir(tmp_path):
+    api.set_tasks_dir(str(tmp_path))
+    api.init_files()
+    return tmp_path
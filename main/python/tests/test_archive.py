@@ -0,0 +1,36 @@
+from package.api import tasks as api
+from package.api.archive import archivable, archive_done_tasks
+
+
+TODAY = 738000
+
+
+def record(achieved, date = 0):
+    return {"achieved":achieved, "priority":0, "date":api.ordinal_to_date(date)}
+
+def test_archivable():
+    records = [("a", "done", record(True)), ("a", "todo", record(False, TODAY-30)), ("b", "old", record(True, TODAY-10)), ("b", "recent", record(True, TODAY-2))]
+    assert archivable(records) == [("a", "done"), ("b", "old"), ("b", "recent")]
+    assert archivable(records, 7, TODAY) == [("a", "done"), ("b", "old")]
+
+#les dossiers jamais affichés sont archivés sans être chargés
+def test_archive_done_tasks(tasks_dir):
+    store = api.TaskStore(api.JsonStorage(True))
+    store.load()
+    store.add_folder("work")
+    api.Task("done", True, "work", store=store)
+    api.Task("todo", store=store)
+    api.Task("done too", True, store=store)
+    store.flush()
+    store.close()
+    store = api.TaskStore(api.JsonStorage(True))
+    store.load()
+    events = []
+    store.subscribe(lambda event, *args: events.append(event), batched=True)
+    assert sorted(archive_done_tasks(store)) == [("general", "done too"), ("work", "done")]
+    assert events == ["batch"]
+    assert not store.loaded_folders
+    assert list(store.folder("general")) == ["todo"] and len(store.folder("work")) == 0
+    assert sorted(store.storage.load_history()["work"]) == ["done"]
+    assert archive_done_tasks(store) == []
+    store.close()
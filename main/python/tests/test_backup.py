@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+import os
+
+import pytest
+
+from package.api import backup
+from package.api import tasks as api
+
+
+START = datetime(2024, 5, 1, 12, 0)
+
+
+def open_store(storage):
+    api.dump_config({"storage":storage})
+    store = api.TaskStore(api.open_storage(api.load_config()))
+    store.load()
+    return store
+
+def fill(store):
+    store.add_folder("work")
+    api.Task("a", store=store, priority=1)
+    api.Task("b", folder="work", store=store, date="2024-5-2")
+    store.add_to_history([("general", "done")])
+    store.flush()
+
+def history_names(store):
+    return sorted(record["name"] for record in store.storage.iter_history())
+
+def objects():
+    return sorted(os.path.join(root, name) for root, _, names in os.walk(os.path.join(backup.backup_dir(), "objects")) for name in names)
+
+
+@pytest.mark.parametrize("source, target", [("json", "json"), ("sqlite", "sqlite"), ("sqlite", "json"), ("json", "sqlite")])
+def test_restore(tasks_dir, source, target):
+    store = open_store(source)
+    fill(store)
+    expected = store.to_dict()
+    backup_id = backup.create_backup(START)
+    store.folder("general")["a"].delete()
+    store.add_to_history([("work", "later")])
+    store.close()
+    open_store(target).close()
+    safety_id = backup.restore_backup(backup_id)
+    assert safety_id in backup.list_backups()
+    store = open_store(target)
+    assert store.to_dict() == expected
+    assert history_names(store) == ["done"]
+    store.close()
+
+def test_restore_keeps_history_if_asked(tasks_dir):
+    store = open_store("json")
+    fill(store)
+    backup_id = backup.create_backup(START)
+    store.add_to_history([("work", "later")])
+    store.close()
+    backup.restore_backup(backup_id, history=False)
+    store = open_store("json")
+    assert history_names(store) == ["done", "later"]
+    store.close()
+
+#un dossier inchangé n'est pas réécrit, les objets sans manifeste disparaissent avec lui
+def test_unchanged_folders_are_shared_and_pruned(tasks_dir):
+    store = open_store("json")
+    fill(store)
+    backup.create_backup(START)
+    before = objects()
+    store.folder("work")["b"].update({"priority":2})
+    store.flush()
+    second = backup.create_backup(START+timedelta(minutes=1))
+    after = objects()
+    assert len(after) == len(before)+1
+    backup.remove_backups({second})
+    assert backup.list_backups() == [second]
+    assert len(objects()) == len(before)
+    for _, digest in backup.load_manifest(second)["folders"]: backup.read_object(digest)
+    store.close()
+
+def test_retention():
+    ids = [(START+timedelta(hours=6*i)).strftime(backup.ID_FORMAT) for i in range(4*60)]#4 par jour pendant 60 jours
+    daily, weekly = {}, {}
+    for backup_id in ids:#la dernière de chaque jour et de chaque semaine
+        daily[backup.backup_time(backup_id).date()] = backup_id
+        weekly[backup.backup_time(backup_id).isocalendar()[:2]] = backup_id
+    expected = set(ids[-3:]) | set(sorted(daily.values())[-5:]) | set(sorted(weekly.values())[-4:])
+    assert backup.backups_to_keep(ids, keep_last=3, keep_daily=5, keep_weekly=4) == expected
+
+def test_backup_if_needed(tasks_dir):
+    open_store("json").close()
+    assert backup.backup_if_needed() is not None
+    assert backup.backup_if_needed() is None
+    assert len(backup.list_backups()) == 1
@@ -0,0 +1,36 @@
+import io
+
+import pytest
+
+from package.api import bulk
+from package.api import tasks as api
+from package.api.storage import SqliteStorage
+
+
+RECORDS = [{"folder":"work", "name":"rapport", "achieved":False, "priority":2, "date":"2024-05-31", "repeat":"month"},
+    {"folder":"general", "name":"pain", "achieved":True, "priority":0, "date":"", "repeat":None}]
+
+
+@pytest.mark.parametrize("format", ["jsonl", "csv"])
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_round_trip(tasks_dir, monkeypatch, format, backend):
+    monkeypatch.setattr(bulk, "BATCH_SIZE", 2)
+    store = api.TaskStore(api.JsonStorage(True) if backend == "json" else SqliteStorage(api.SQLITE_FILEPATH))
+    store.load()
+    records = RECORDS+[{"folder":"work", "name":"t%d" % i, "achieved":False, "priority":0, "date":"", "repeat":None} for i in range(5)]
+    exported = io.StringIO()
+    bulk.write_records(records, exported, format)
+    assert bulk.import_tasks(bulk.read_records(io.StringIO(exported.getvalue()), format), store) == 7
+    assert store.folder("work")["rapport"].repeat == "month"
+    output = io.StringIO()
+    bulk.export_tasks(store.storage, output, format)
+    key = lambda record: (record["folder"], record["name"])
+    assert sorted(bulk.read_records(io.StringIO(output.getvalue()), format), key=key) == sorted(bulk.read_records(io.StringIO(exported.getvalue()), format), key=key)
+    store.close()
+
+def test_parsing():
+    task = bulk.record_to_task({"name":"x", "achieved":"oui", "priority":"1", "date":"2024-2-29", "repeat":"1 month@31"}, "inbox")
+    assert (task.folder, task.achieved, task.priority, task.repeat) == ("inbox", True, 1, "month@31")
+    assert bulk.iso_date(task.date) == "2024-02-29"
+    assert not bulk.parse_bool("0") and not bulk.parse_bool("")
+    with pytest.raises(ValueError): bulk.record_to_task({"name":"x", "repeat":"fortnight"})
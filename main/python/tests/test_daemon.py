@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+
+import pytest
+
+from package.api import tasks as api
+from package.api.daemon import StoreDaemon
+from package.api.remote import RemoteStorage, connect
+
+
+@pytest.fixture
+def daemon(tasks_dir):
+    daemon = StoreDaemon()
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    yield daemon
+    daemon.close()
+
+#client abonné : ses événements sont notés dans events
+def client(events = None):
+    store = api.TaskStore(RemoteStorage(api.SOCKET_FILEPATH))
+    store.load()
+    if events is not None:
+        store.storage.subscribe(lambda event, *args: events.append((event,)+args))
+        store.storage.subscribe_changes()
+    return store
+
+def state(store):
+    return {folder:{name:task.toDict() for name, task in tasks.items()} for folder, tasks in store.load_all().items()}
+
+
+#les modifications d'un client sont appliquées par le démon et envoyées aux autres, pas à lui
+def test_changes_reach_other_clients(daemon):
+    events_a, events_b = [], []
+    a, b = client(events_a), client(events_b)
+    with a.batch():
+        for i in range(50): api.Task("t%d" % i, store=a, priority=i%3)
+    a.add_folder("work")
+    a.folder("general")["t1"].rename("renamed")
+    a.move(a.folder("general")["t2"], "work")
+    a.remove_tasks([("general", "t3")])
+    a.storage.wait()
+    b.storage.wait()#l'événement précède la réponse sur la même connexion
+    assert events_a == []
+    assert [event for event, *_ in events_b] == ["changes"]*5
+    assert len(events_b[0][1]) == 50#un bloc batch() arrive en un seul message
+    for _, changes in events_b: b.apply_changes(changes)
+    assert state(b) == state(a) == state(client())
+    a.storage.close()
+    b.storage.close()
+
+#les écritures partent sans attendre de réponse, une lecture voit toutes celles envoyées avant elle
+def test_reads_follow_writes(daemon):
+    a = client()
+    for i in range(200): api.Task("t%d" % i, store=a)
+    assert len(a.storage.load()["general"]) == 200
+    a.flush()
+    a.storage.wait()
+    assert len(api.simple_load_tasks()["general"]) == 200
+    a.storage.close()
+
+#une ligne illisible ou une requête refusée ne coupe pas la connexion
+def test_errors(daemon):
+    sock = connect(api.SOCKET_FILEPATH)
+    reader = sock.makefile("rb")
+    sock.sendall(b"not json\n")
+    assert json.loads(reader.readline())["error"].startswith("JSONDecodeError")
+    sock.sendall(b'{"id":1, "op":"ping", "args":[]}\n')
+    assert json.loads(reader.readline()) == {"id":1, "result":True}
+    reader.close()
+    sock.close()
+    events = []
+    a = client(events)
+    a.storage.put("unknown_op")
+    a.storage.wait()
+    assert events[0][0] == "failed"
+    a.storage.close()
+
+def test_stop(tasks_dir):
+    daemon = StoreDaemon()
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    with pytest.raises(RuntimeError): StoreDaemon()
+    events = []
+    a = client(events)
+    closed = threading.Event()
+    a.storage.subscribe(lambda event, *args: event == "closed" and closed.set())
+    daemon.close()
+    assert closed.wait(5)
+    assert not os.path.exists(api.SOCKET_FILEPATH)
+    with pytest.raises(ConnectionError): a.storage.set_task("general", "t", {"achieved":False, "priority":0, "date":""})
+    a.storage.close()
@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+
+import pytest
+
+from package.api import tasks as api
+from package.api.deadlines import DeadlineIndex
+from package.notifications import DeadlineScheduler
+
+
+TODAY = date.today()
+
+def day(offset):
+    return TODAY + timedelta(days=offset)
+
+def record(date, priority = 0, achieved = False):
+    return {"date":"%d-%d-%d" % (date.year, date.month, date.day) if date else "0-0-0", "priority":priority, "achieved":achieved}
+
+
+def test_due_sorted_by_date_then_priority():
+    index = DeadlineIndex()
+    index.build([("general", "a", record(day(0))), ("general", "b", record(day(-1))), ("work", "c", record(day(0), 3)),
+        ("general", "d", record(day(2))), ("general", "e", record(day(-5), achieved=True)), ("general", "f", record(None))])
+    assert index.due(TODAY.toordinal()) == [("general", "b", day(-1).toordinal()), ("work", "c", TODAY.toordinal()), ("general", "a", TODAY.toordinal())]
+    assert index.next_date(TODAY.toordinal()) == day(2).toordinal()
+    assert index.next_date(day(2).toordinal()) is None
+
+def test_follows_store_changes(tasks_dir):
+    store = api.TaskStore(api.JsonStorage(True))
+    store.load()
+    index = DeadlineIndex()
+    index.build(store.iter_records())
+    store.subscribe(index.store_changed)
+    task = api.Task("a", date=day(1), store=store)
+    api.Task("b", date=day(3), store=store)
+    assert index.next_date(TODAY.toordinal()) == day(1).toordinal()
+    task.rename("c")
+    assert index.due(day(1).toordinal()) == [("general", "c", day(1).toordinal())]
+    task.switch_status()
+    assert index.next_date(TODAY.toordinal()) == day(3).toordinal()
+    store.add_folder("work")
+    store.folder("general")["b"].switch_folder("work")
+    store.rename_folder("work", "job")
+    assert index.due(day(3).toordinal()) == [("job", "b", day(3).toordinal())]
+    assert index.date_of("job", "b") == day(3).toordinal()
+
+
+#tâche rendue due par une modification : signalée sans attendre le minuteur, une seule fois
+@pytest.fixture
+def scheduler(tasks_dir):
+    store = api.TaskStore(api.JsonStorage(True))
+    store.load()
+    api.Task("late", date=day(-2), store=store)
+    api.Task("later", date=day(5), store=store)
+    notified = []
+    scheduler = DeadlineScheduler(store, notified.append)
+    scheduler.start()
+    yield store, scheduler, notified
+    scheduler.stop()
+
+def test_task_made_due_is_notified(scheduler):
+    store, scheduler, notified = scheduler
+    assert notified == [[("general", "late", day(-2).toordinal())]]
+    store.folder("general")["later"].update({"date":day(0)})
+    api.Task("new", date=day(-1), store=store)
+    scheduler.notify_newly_due()
+    assert notified[1:] == [[("general", "new", day(-1).toordinal()), ("general", "later", TODAY.toordinal())]]
+    store.folder("general")["later"].update({"priority":2})
+    store.folder("general")["late"].rename("still late")
+    scheduler.notify_newly_due()
+    assert len(notified) == 2
+
+def test_future_task_arms_timer(scheduler):
+    store, scheduler, notified = scheduler
+    assert scheduler.armed_date == day(5).toordinal()
+    api.Task("soon", date=day(1), store=store)
+    assert scheduler.armed_date == day(1).toordinal()
+    scheduler.notify_newly_due()
+    assert len(notified) == 1
@@ -0,0 +1,67 @@
+import pytest
+
+from package.api import tasks as api
+from package.api.journal import coalesce, replay
+
+
+def open_store(format = "json"):
+    store = api.TaskStore(api.JsonStorage(True, format))
+    store.load()
+    return store
+
+def names(store, folder = "general"):
+    return sorted(store.load_all()[folder])
+
+
+def test_replay():
+    records = [{"op":"set", "folder":"a", "name":"x", "task":1}, {"op":"rename", "folder":"a", "name":"x", "new":"y"},
+               {"op":"move", "folder":"a", "name":"y", "new":"b"}, {"op":"rename_folder", "folder":"b", "new":"c"}, {"op":"del", "folder":"z", "name":"x"}]
+    assert replay({}, records) == {"a":{}, "c":{"y":1}}
+
+def test_coalesce_keeps_last_set_between_other_ops():
+    records = [{"op":"set", "folder":"a", "name":"x", "task":1}, {"op":"set", "folder":"a", "name":"x", "task":2},
+               {"op":"rename", "folder":"a", "name":"x", "new":"y"}, {"op":"set", "folder":"a", "name":"x", "task":3}]
+    assert coalesce(records) == records[1:]
+    assert replay({}, coalesce(records)) == replay({}, records)
+
+@pytest.mark.parametrize("format", ["json", "binary"])
+def test_reload_after_journaled_changes(tasks_dir, format):
+    store = open_store(format)
+    for name in "abc": api.Task(name, store=store, priority=1)
+    store.folder("general")["a"].rename("b")
+    store.folder("general")["c"].switch_folder("other")
+    store.close()
+    reopened = open_store(format)
+    assert names(reopened) == ["b"]
+    assert reopened.folder("other")["c"].priority == 1
+
+#arrêt brutal entre l'écriture du snapshot et le vidage du journal
+@pytest.mark.parametrize("format", ["json", "binary"])
+def test_compaction_crash_does_not_replay_journal(tasks_dir, monkeypatch, format):
+    store = open_store(format)
+    for name in "abx": api.Task(name, store=store)
+    monkeypatch.setattr(api, "JOURNAL_MAX_SIZE", 0)
+    store.flush()
+    store.folder("general")["a"].rename("b")
+    store.folder("general")["x"].rename("y")
+    api.Task("z", store=store).rename("w")
+    monkeypatch.setattr(api, "clear_journal", lambda filepath: None)
+    store.flush()
+    assert names(open_store(format)) == ["b", "w", "y"]
+    monkeypatch.undo()
+    store.close()
+    assert names(open_store(format)) == ["b", "w", "y"]
+
+def test_journal_without_base_is_replayed(tasks_dir):
+    with open(api.JOURNAL_FILEPATH, "w") as f:
+        f.write('{"op":"set","folder":"general","name":"a","task":{"achieved":false,"priority":0,"date":"0-0-0"}}\n{"op":"set","fol')
+    assert list(api.simple_load_tasks()["general"]) == ["a"]
+
+def test_rename_or_move_onto_itself_keeps_task(tasks_dir):
+    store = open_store()
+    task = api.Task("a", store=store)
+    task.rename("a")
+    task.switch_folder("general")
+    store.storage.rename_task("general", "a", "a")
+    store.close()
+    assert names(open_store()) == ["a"]
@@ -0,0 +1,63 @@
+from datetime import date
+from itertools import islice
+
+import pytest
+
+from package.api import tasks as api
+from package.api.recurrence import anchored_rule, format_rule, next_occurrence, occurrences, occurrences_between, parse_rule, rule_anchor
+
+
+def ordinal(*args):
+    return date(*args).toordinal()
+
+def dates(ordinals):
+    return [date.fromordinal(o) for o in ordinals]
+
+
+def test_parse_and_format():
+    assert parse_rule("week") == (1, "week")
+    assert parse_rule("3 month@31") == (3, "month")
+    assert rule_anchor("3 month@31") == 31
+    assert rule_anchor("2 day") is None
+    assert format_rule(1, "month", 31) == "month@31"
+    assert format_rule(2, "day") == "2 day"
+    for rule in ("fortnight", "0 day", "-1 week", "70000 day"):
+        with pytest.raises(ValueError): parse_rule(rule)
+    with pytest.raises(ValueError): rule_anchor("month@32")
+
+def test_daily_and_weekly_jump_after():
+    start = ordinal(2024, 1, 1)
+    assert dates(islice(occurrences(start, "2 day"), 3)) == [date(2024, 1, 1), date(2024, 1, 3), date(2024, 1, 5)]
+    assert date.fromordinal(next_occurrence(start, "week", ordinal(2024, 3, 4))) == date(2024, 3, 11)
+    assert date.fromordinal(next_occurrence(start, "week", ordinal(2023, 6, 1))) == date(2024, 1, 1)
+
+def test_month_end_keeps_target_day():
+    start = ordinal(2024, 1, 31)
+    assert dates(islice(occurrences(start, "month"), 4)) == [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)]
+    assert dates(occurrences_between(start, "month", ordinal(2024, 5, 1), ordinal(2024, 8, 31))) == [date(2024, 5, 31), date(2024, 6, 30), date(2024, 7, 31), date(2024, 8, 31)]
+    #la tâche reportée au 29 février garde le 31 dans sa règle
+    assert anchored_rule("month", ordinal(2024, 2, 29), 31) == "month@31"
+    assert date.fromordinal(next_occurrence(ordinal(2024, 2, 29), "month@31", ordinal(2024, 2, 29))) == date(2024, 3, 31)
+    #le jour visé n'a plus lieu d'être une fois atteint, ni pour un jour qui n'est pas une fin de mois
+    assert anchored_rule("month@31", ordinal(2024, 3, 31)) == "month"
+    assert anchored_rule("month@31", ordinal(2024, 2, 15)) == "month"
+    assert anchored_rule("week", ordinal(2024, 2, 29), 31) == "week"
+
+#aujourd'hui fixé au 1er janvier 2024 : chaque occurrence terminée passe à la suivante
+class NewYear(date):
+    @classmethod
+    def today(cls):
+        return cls(2024, 1, 1)
+
+def test_completing_month_end_task(tasks_dir, monkeypatch):
+    monkeypatch.setattr(api, "date", NewYear)
+    store = api.TaskStore(api.JsonStorage(True))
+    store.load()
+    task = api.Task("loyer", date="2024-1-31", store=store, repeat="month")
+    for expected in (date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30), date(2024, 5, 31)):
+        task.switch_status()
+        assert date.fromordinal(task.date) == expected
+        assert not task.achieved
+    assert task.repeat == "month"
+    assert len(store.storage.load_history()["general"]) == 4
+    store.close()
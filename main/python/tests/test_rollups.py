@@ -0,0 +1,43 @@
+from datetime import date, datetime
+
+import pytest
+
+from package.api import tasks as api
+from package.api.rollups import DAY, WEEK, build_rollups, count_rollups, last_periods, period_start
+from package.api.storage import SqliteStorage
+
+
+WEDNESDAY = datetime(2024, 5, 15, 18, 30)
+NEXT_MONDAY = datetime(2024, 5, 20, 9, 0)
+
+
+def test_periods():
+    assert period_start(WEDNESDAY.date(), DAY) == "2024-05-15"
+    assert period_start(WEDNESDAY.date(), WEEK) == "2024-05-13"
+    assert last_periods(DAY, 3, date(2024, 3, 1)) == ["2024-03-01", "2024-02-29", "2024-02-28"]
+    assert last_periods(WEEK, 2, date(2024, 5, 15)) == ["2024-05-13", "2024-05-06"]
+
+def test_count_and_build():
+    assert count_rollups([("work", "a"), ("work", "b")], WEDNESDAY) == {(DAY, "work", "2024-05-15"):2, (WEEK, "work", "2024-05-13"):2}
+    records = [{"folder":"work", "name":"a", "time":WEDNESDAY.isoformat()}, {"folder":"home", "name":"b", "time":NEXT_MONDAY.isoformat()},
+        {"folder":"home", "name":"old"}]#sans date, ignoré
+    assert build_rollups(records) == {DAY:{"work":{"2024-05-15":1}, "home":{"2024-05-20":1}}, WEEK:{"work":{"2024-05-13":1}, "home":{"2024-05-20":1}}}
+
+#les compteurs tenus à chaque ajout sont ceux qu'on reconstruirait depuis l'historique
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_incremental_rollups_match_history(tasks_dir, backend):
+    storage = api.JsonStorage() if backend == "json" else SqliteStorage(api.SQLITE_FILEPATH)
+    for tasks, time in (([("work", "a"), ("home", "b")], WEDNESDAY), ([("work", "c")], WEDNESDAY), ([("work", "d")], NEXT_MONDAY)):
+        storage.add_history(tasks, time)
+        storage.commit()
+    rollups = storage.load_rollups()
+    assert rollups[DAY]["work"] == {"2024-05-15":2, "2024-05-20":1}
+    assert rollups[WEEK]["work"] == {"2024-05-13":2, "2024-05-20":1}
+    assert rollups == build_rollups(storage.iter_history())
+    storage.close()
+
+#rollups.json absent ou illisible : reconstruit depuis l'historique
+def test_json_rollups_rebuilt(tasks_dir):
+    api.add_tasks_to_history([("work", "a")], WEDNESDAY)
+    with open(api.ROLLUPS_FILEPATH, "w") as f: f.write("{")
+    assert api.load_rollups()[WEEK] == {"work":{"2024-05-13":1}}
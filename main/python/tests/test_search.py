@@ -0,0 +1,63 @@
+import pickle
+
+import pytest
+
+from package.api import tasks as api
+from package.api.search import HISTORY, TASK, SearchIndex, index_filepath
+
+
+@pytest.fixture
+def store(tasks_dir):
+    store = api.TaskStore(api.JsonStorage(True))
+    store.load()
+    api.Task("Acheter du pain", store=store)
+    api.Task("Réviser l'examen", folder="école", store=store)
+    store.add_to_history([("general", "Appeler le médecin")])
+    store.flush()
+    return store
+
+def loaded(store, cache = True):
+    index = SearchIndex()
+    index.load(store, cache)
+    return index
+
+
+def test_search_ignores_case_and_accents(store):
+    index = loaded(store)
+    assert index.search("REVISER") == [(TASK, "école", "Réviser l'examen")]
+    assert index.search("me") == [(HISTORY, "general", "Appeler le médecin")]
+    assert index.search("pain") == [(TASK, "general", "Acheter du pain")]
+
+def test_follows_store_changes(store):
+    index = loaded(store)
+    store.folder("general")["Acheter du pain"].rename("Acheter du riz")
+    store.folder("école")["Réviser l'examen"].switch_folder("general")
+    assert index.search("pain") == []
+    assert index.search("riz") == [(TASK, "general", "Acheter du riz")]
+    assert index.search("examen") == [(TASK, "general", "Réviser l'examen")]
+
+#la tâche remplacée à l'arrivée ne reste pas dans l'index
+def test_move_onto_task_of_same_name(store):
+    index = loaded(store)
+    api.Task("Acheter du pain", folder="école", store=store)
+    store.folder("école")["Acheter du pain"].switch_folder("general")
+    assert index.search("pain") == [(TASK, "general", "Acheter du pain")]
+    assert len(index.tasks) == len(index.docs)-1
+
+def test_save_and_restore(store):
+    index = loaded(store)
+    index.save(index_filepath())
+    restored = SearchIndex()
+    assert restored.restore(index_filepath())
+    assert restored.docs == index.docs and restored.grams == index.grams and restored.words == index.words
+    assert restored.search("exam") == index.search("exam")
+    api.Task("Nouvelle", store=store)
+    store.flush()
+    assert not SearchIndex().restore(index_filepath())
+
+@pytest.mark.parametrize("data", [b"", b'{"fingerprint":', b"[1, 2]", b'{"docs":[]}', pickle.dumps({"docs":{}})])
+def test_unreadable_cache_is_rebuilt(store, data):
+    with open(index_filepath(), "wb") as f:
+        f.write(data)
+    assert not SearchIndex().restore(index_filepath())
+    assert loaded(store).search("pain") == [(TASK, "general", "Acheter du pain")]
@@ -0,0 +1,86 @@
+from datetime import date
+
+import pytest
+
+from package.api import tasks as api
+from package.api.snapshot import RECORDS, BinarySnapshot, encode_snapshot, record_to_dict, write_snapshot
+
+
+TASKS = {"general":{"a":{"achieved":False, "priority":1, "date":"2026-1-31"},
+                    "b":{"achieved":True, "priority":None, "date":"0-0-0", "repeat":"2 week"},
+                    "c":{"achieved":False, "priority":0, "date":"2026-2-28", "repeat":"month@31"}},
+         "empty":{}, "été":{"tâche":{"achieved":False, "priority":3, "date":"2026-12-1"}}}
+
+
+def test_round_trip(tmp_path):
+    write_snapshot(TASKS, str(tmp_path/"tasks.bin"))
+    snapshot = BinarySnapshot(str(tmp_path/"tasks.bin"))
+    assert snapshot.load() == TASKS
+    assert snapshot.folder("été") == TASKS["été"]
+    snapshot.close()
+
+def test_separator_in_name_is_refused():
+    with pytest.raises(ValueError):
+        encode_snapshot({"general":{"a\x00b":TASKS["general"]["a"]}})
+
+def test_older_record_versions():
+    day = date(2021, 8, 29).toordinal()
+    assert record_to_dict(RECORDS[1].unpack(RECORDS[1].pack(1, 2, day))) == {"achieved":True, "priority":2, "date":"2021-8-29"}
+    assert record_to_dict(RECORDS[2].unpack(RECORDS[2].pack(0, 3, 0, day, 2))) == {"achieved":False, "priority":0, "date":"2021-8-29", "repeat":"2 month"}
+
+def test_lazy_load_applies_journal_to_touched_folders(tmp_path):
+    write_snapshot(TASKS, str(tmp_path/"tasks.bin"))
+    snapshot = BinarySnapshot(str(tmp_path/"tasks.bin"))
+    tasks = snapshot.load_lazy([{"op":"move", "folder":"general", "name":"a", "new":"empty"}])
+    assert tasks["été"] is None
+    assert sorted(tasks["general"]) == ["b", "c"] and list(tasks["empty"]) == ["a"]
+    snapshot.close()
+
+def test_digest_only_changes_with_folder(tmp_path):
+    write_snapshot(TASKS, str(tmp_path/"a.bin"))
+    write_snapshot(dict(TASKS, general={}), str(tmp_path/"b.bin"))
+    a, b = BinarySnapshot(str(tmp_path/"a.bin")), BinarySnapshot(str(tmp_path/"b.bin"))
+    assert a.digest("été") == b.digest("été")
+    assert a.digest("general") != b.digest("general")
+    a.close()
+    b.close()
+
+
+def open_store():
+    store = api.TaskStore(api.JsonStorage(True, "binary"))
+    store.load()
+    return store
+
+#un autre processus modifie un dossier puis réécrit le snapshot
+def test_external_compaction_only_decodes_changed_folders(tasks_dir, monkeypatch):
+    api.dump_tasks(TASKS, "binary")
+    store = open_store()
+    other = open_store()
+    other.folder("general")["a"].update({"priority":5})
+    monkeypatch.setattr(api, "JOURNAL_MAX_SIZE", 0)
+    other.close()
+    decoded, events = [], []
+    folder = BinarySnapshot.folder
+    monkeypatch.setattr(BinarySnapshot, "folder", lambda self, name: decoded.append(name) or folder(self, name))
+    store.subscribe(lambda event, *args: events.append((event, str(args[0]))))
+    assert store.sync()
+    assert decoded == ["general", "general"]#nouvelle version, puis l'ancienne pour la fusion
+    assert events == [("changed", "a")]
+    assert store.raw_tasks["été"] is None
+    assert store.folder("general")["a"].priority == 5
+    assert store.folder("été")["tâche"].priority == 3
+
+#dossier lu à la demande après le remplacement du snapshot
+def test_lazy_folder_is_read_from_replaced_snapshot(tasks_dir, monkeypatch):
+    api.dump_tasks(TASKS, "binary")
+    store = open_store()
+    other = open_store()
+    other.folder("été")["tâche"].update({"priority":7})
+    api.Task("new", folder="été", store=other)
+    monkeypatch.setattr(api, "JOURNAL_MAX_SIZE", 0)
+    other.flush()
+    monkeypatch.undo()
+    other.folder("été")["new"].delete()
+    other.close()
+    assert store.folder("été")["tâche"].priority == 7
+    assert list(store.folder("été")) == ["tâche"]
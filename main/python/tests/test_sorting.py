@@ -0,0 +1,57 @@
+import random
+
+from package.api import tasks as api
+from package.api.sorting import DATE, MANUAL, NAME, PRIORITY, SORT_MODES, STATUS, SortedRows, is_due_or_urgent, sort_key
+
+
+def make_tasks(count, seed = 0):
+    rng = random.Random(seed)
+    return [api.Task("t%03d" % i, rng.random() < 0.3, "general", rng.randrange(3), rng.choice([0, 738000, 738001, 738100]), loaded=True) for i in range(count)]
+
+def expected(tasks, mode):
+    return [(task.folder, task.name) for task in sorted(tasks, key=lambda task: sort_key(task, mode))]
+
+
+def test_keys():
+    late = api.Task("b", date=738000, priority=0, loaded=True)
+    urgent = api.Task("A", priority=2, loaded=True)
+    assert expected([urgent, late], DATE) == [("general", "b"), ("general", "A")]#sans date en dernier
+    assert expected([late, urgent], PRIORITY) == [("general", "A"), ("general", "b")]
+    assert expected([late, urgent], NAME) == [("general", "A"), ("general", "b")]
+    late.achieved = True
+    assert expected([late, urgent], STATUS) == [("general", "A"), ("general", "b")]
+
+#chaque modification ne déplace qu'une ligne, le résultat reste celui d'un tri complet
+def test_incremental_updates_match_full_sort():
+    tasks = make_tasks(200)
+    rng = random.Random(1)
+    for mode in SORT_MODES:
+        if mode == MANUAL: continue
+        rows = SortedRows(mode)
+        rows.build(tasks[:150])
+        for task in tasks[150:]: assert rows.position(task) == rows.insert(task)
+        for task in rng.sample(tasks, 50):
+            row = (task.folder, task.name)
+            task.priority, task.date = rng.randrange(3), rng.choice([0, 738000, 738050])
+            target = rows.target(row, task)
+            assert rows.reposition(row, task)[1] == target
+        for task in tasks[:20]: rows.pop((task.folder, task.name))
+        assert rows.rows == expected(tasks[20:], mode)
+        assert all(rows.index(row) == i for i, row in enumerate(rows.rows))
+
+def test_manual_mode_keeps_insertion_order():
+    tasks = make_tasks(10)
+    rows = SortedRows(MANUAL)
+    rows.build(tasks[:5])
+    for task in tasks[5:]: rows.insert(task)
+    tasks[0].priority = 2
+    rows.reposition(("general", tasks[0].name), tasks[0])
+    assert rows.rows == [(task.folder, task.name) for task in tasks]
+
+def test_due_or_urgent():
+    today = 738010
+    assert is_due_or_urgent(api.Task("a", date=today, loaded=True), today)
+    assert is_due_or_urgent(api.Task("a", date=today-5, loaded=True), today)
+    assert is_due_or_urgent(api.Task("a", priority=1, loaded=True), today)
+    assert not is_due_or_urgent(api.Task("a", date=today+1, loaded=True), today)
+    assert not is_due_or_urgent(api.Task("a", True, date=today, loaded=True), today)
@@ -0,0 +1,30 @@
+from package.api.storage import SqliteStorage
+
+
+TASK = {"achieved":False, "priority":1, "date":"2026-1-31"}
+
+
+def test_sqlite_round_trip(tmp_path):
+    storage = SqliteStorage(str(tmp_path/"tasks.db"))
+    storage.add_folder("empty")
+    storage.set_tasks([("general", "a", TASK), ("general", "b", dict(TASK, repeat="1 month@31"))])
+    storage.commit()
+    assert storage.load() == {"empty":{}, "general":{"a":TASK, "b":dict(TASK, repeat="1 month@31")}}
+    assert storage.load_folders() == {"empty":None, "general":None}
+    assert [name for _, name, _ in storage.due_before("2026-2-1")] == ["a", "b"]
+
+def test_sqlite_rename_and_move_replace_target(tmp_path):
+    storage = SqliteStorage(str(tmp_path/"tasks.db"))
+    storage.set_tasks([("general", "a", TASK), ("general", "b", dict(TASK, priority=2)), ("other", "a", dict(TASK, priority=3))])
+    storage.rename_task("general", "a", "b")
+    assert storage.load_folder("general") == {"b":TASK}
+    storage.move_task("general", "b", "other")
+    storage.rename_task("other", "b", "a")
+    assert storage.load() == {"general":{}, "other":{"a":TASK}}
+
+def test_sqlite_rename_or_move_onto_itself_keeps_task(tmp_path):
+    storage = SqliteStorage(str(tmp_path/"tasks.db"))
+    storage.set_task("general", "a", TASK)
+    storage.rename_task("general", "a", "a")
+    storage.move_task("general", "a", "general")
+    assert storage.load_folder("general") == {"a":TASK}
@@ -0,0 +1,127 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from package.api import tasks as api
+from package.api.storage import SqliteStorage
+from package.api.sync import SyncClient, SyncState
+from package.api.sync_server import SyncServer
+
+
+#deux appareils synchronisés par le serveur de référence, dans le processus
+#python -m pytest tests, depuis main/python
+class SyncTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        api.set_tasks_dir(self.directory)
+        self.server = SyncServer().start()
+        self.a, self.client_a = self.device("a")
+        self.b, self.client_b = self.device("b")
+
+    def tearDown(self):
+        for client in (self.client_a, self.client_b):
+            client.close()
+            client.store.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def device(self, name, track = True):
+        store = api.TaskStore(SqliteStorage("%s/%s.db" % (self.directory, name)))
+        store.load()
+        client = SyncClient(store, self.server.url, SyncState("%s/%s-sync.db" % (self.directory, name)))
+        client.state.reconcile = mock.Mock(wraps=client.state.reconcile)
+        if track: client.track()
+        return store, client
+
+    #ferme l'appareil a puis le relance, modify est appelé entre les deux
+    def restart_a(self, clean = True, modify = None):
+        if clean: self.client_a.close()
+        else: self.client_a.state.close()
+        self.a.close()
+        if modify is not None: modify()
+        self.a, self.client_a = self.device("a", False)
+        return self.client_a.track()
+
+    def sync(self):
+        self.client_a.sync()
+        self.client_b.sync()
+        self.client_a.sync()
+
+    def state(self, store):
+        return {folder:{name:task.toDict() for name, task in tasks.items()} for folder, tasks in store.load_all().items()}
+
+    def test_converge(self):
+        self.a.add_folder("work")
+        with self.a.batch():
+            for i in range(20): api.Task("t%d" % i, folder="work", store=self.a, priority=i%5)
+        self.sync()
+        self.assertEqual(len(self.b.folder("work")), 20)
+        self.b.folder("work")["t1"].update({"priority":9})
+        self.b.folder("work")["t2"].delete()
+        self.a.folder("work")["t3"].rename("t3bis")
+        self.sync()
+        self.assertEqual(self.state(self.a), self.state(self.b))
+        self.assertEqual(self.a.folder("work")["t1"].priority, 9)
+        self.assertNotIn("t2", self.a.folder("work"))
+        self.assertIn("t3bis", self.b.folder("work"))
+        self.assertEqual(self.server.tasks()[("work", "t3")], None)
+
+    def test_track_skips_unchanged_store(self):
+        api.Task("t", folder="work", store=self.a)
+        self.assertEqual(self.restart_a(), 0)
+        self.client_a.state.reconcile.assert_not_called()
+        self.sync()
+        self.assertIn("t", self.b.folder("work"))
+
+    def test_track_reconciles_changes_made_without_sync(self):
+        self.a.add_folder("work")
+        api.Task("t", folder="work", store=self.a)
+        def modify():
+            storage = SqliteStorage("%s/a.db" % self.directory)
+            storage.set_task("work", "u", api.Task("u", loaded=True).toDict())
+            storage.close()
+        self.assertEqual(self.restart_a(modify=modify), 1)
+        self.sync()
+        self.assertEqual(sorted(self.b.folder("work")), ["t", "u"])
+
+    def test_track_reconciles_after_unclean_stop(self):
+        self.restart_a()
+        api.Task("t", folder="work", store=self.a)
+        self.restart_a(False)
+        self.client_a.state.reconcile.assert_called_once()
+
+    #serveur relancé sans rien : les clients renvoient tout et relisent depuis le début
+    def test_server_restart(self):
+        self.a.add_folder("work")
+        api.Task("t", folder="work", store=self.a)
+        self.sync()
+        self.server.records, self.server.log, self.server.epoch = {}, [], "restarted"
+        api.Task("u", folder="work", store=self.b)
+        self.sync()
+        self.assertEqual(sorted(self.a.folder("work")), ["t", "u"])
+        self.assertIn(("work", "t"), self.server.tasks())
+        self.assertEqual(self.state(self.a), self.state(self.b))
+
+    #horloges fixées au-delà de l'heure actuelle : tick() donne clock+1, sans dépendre du temps
+    def conflict(self, clock_a, clock_b):
+        self.a.add_folder("work")
+        api.Task("t", folder="work", store=self.a, priority=0)
+        self.sync()
+        self.client_a.state.clock, self.client_b.state.clock = clock_a, clock_b
+        self.a.folder("work")["t"].update({"priority":1})
+        self.b.folder("work")["t"].update({"priority":2})
+        self.sync()
+        self.assertEqual(self.state(self.a), self.state(self.b))
+        return self.a.folder("work")["t"].priority
+
+    def test_latest_stamp_wins(self):
+        self.assertEqual(self.conflict(10**15+1, 10**15), 1)
+
+    def test_device_breaks_ties(self):
+        self.client_a.state.device, self.client_b.state.device = "device-a", "device-b"
+        self.assertEqual(self.conflict(10**15, 10**15), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
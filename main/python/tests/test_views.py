@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt5.QtTest import QAbstractItemModelTester
+from PyQt5.QtWidgets import QApplication
+
+from package.api import tasks as api
+from package.api.sorting import NAME, PRIORITY
+from package.resources import resources
+from package.ui import FETCH_SIZE, DueTaskModel, TaskListModel
+
+
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "..", "resources", "base")
+COUNT = FETCH_SIZE*2+50
+
+
+class ResourceContext:
+    def get_resource(self, name):
+        return os.path.join(RESOURCES_DIR, name)
+
+@pytest.fixture(scope="module")
+def app():
+    resources.set_context(ResourceContext())
+    return QApplication.instance() or QApplication([])
+
+@pytest.fixture
+def store(app, tasks_dir):
+    store = api.TaskStore(api.JsonStorage(True))
+    store.load()
+    with store.batch():
+        for i in range(COUNT): api.Task("t%04d" % i, store=store)
+    yield store
+    store.close()
+
+#le testeur de Qt vérifie la cohérence des signaux à chaque modification, il demande toutes les lignes
+def checked_model(model):
+    model.tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Fatal)
+    return model
+
+def names(model):
+    return [model.data(model.index(i)) for i in range(model.rowCount())]
+
+
+def test_rows_are_fetched_by_pages(store):
+    model = TaskListModel("general", store, NAME)
+    assert model.rowCount() == FETCH_SIZE
+    assert model.canFetchMore()
+    model.fetchMore()
+    model.fetchMore()
+    assert model.rowCount() == COUNT
+    assert not model.canFetchMore()
+    assert names(model) == ["t%04d" % i for i in range(COUNT)]
+
+#une ligne au-delà de la partie transmise à la vue n'est signalée qu'au fetchMore suivant
+def test_changes_outside_fetched_rows(store):
+    model = TaskListModel("general", store, NAME)
+    inserted, removed = [], []
+    model.rowsInserted.connect(lambda parent, first, last: inserted.append(first))
+    model.rowsRemoved.connect(lambda parent, first, last: removed.append(first))
+    api.Task("zzz", store=store)
+    assert model.rowCount() == FETCH_SIZE and inserted == []
+    store.folder("general")["t0000"].rename("u0000")#sort de la partie affichée
+    assert model.rowCount() == FETCH_SIZE-1 and removed == [0]
+    store.folder("general")["t0399"].rename("a0399")#y entre
+    assert model.rowCount() == FETCH_SIZE and inserted == [0]
+    assert names(model)[0] == "a0399"
+    store.folder("general")["t0005"].delete()
+    assert model.rowCount() == FETCH_SIZE-1 and removed == [0, 5]
+    assert model.task_index("general", "zzz").row() == COUNT-1
+    assert model.rowCount() == COUNT
+    assert names(model)[-2:] == ["u0000", "zzz"]
+
+def test_move_and_mode_change(store):
+    model = checked_model(TaskListModel("general", store, PRIORITY))
+    store.folder("general")["t0300"].update({"priority":2})
+    assert names(model)[0] == "t0300"
+    model.set_mode(NAME)
+    assert names(model)[:2] == ["t0000", "t0001"]
+    with store.batch():
+        for i in range(10): store.folder("general")["t%04d" % i].update({"priority":1})
+    model.set_mode(PRIORITY)
+    assert names(model)[:11] == ["t0300"]+["t%04d" % i for i in range(10)]
+    assert model.rowCount() == COUNT
+
+def test_due_model_follows_dates(store):
+    model = checked_model(DueTaskModel(store))
+    assert model.rowCount() == 0
+    store.folder("general")["t0001"].update({"priority":1})
+    assert names(model) == ["general / t0001"]
+    store.folder("general")["t0001"].switch_status()
+    assert model.rowCount() == 0